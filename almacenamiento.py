@@ -0,0 +1,230 @@
+"""Selección del backend de almacenamiento y utilidades comunes a todos ellos.
+
+Cada backend es un módulo que implementa las funciones de `OPERACIONES` con
+la misma firma y el mismo formato de resultados que `db.py` (SQL Server):
+
+- "sqlserver": `db.py`, SQL Server vía pyodbc (por defecto).
+- "sqlite": `db_sqlite.py`, archivo SQLite en modo WAL, embebido en el proceso.
+- "memoria": `db_memoria.py`, estructuras en memoria; se pierde al reiniciar.
+
+El backend se elige con la variable de entorno `DB_BACKEND`.
+"""
+import importlib
+import os
+from datetime import time
+
+BACKENDS = {
+    "sqlserver": "db",
+    "sqlite": "db_sqlite",
+    "memoria": "db_memoria",
+}
+BACKEND = os.environ.get("DB_BACKEND", "sqlserver").strip().lower()
+
+OPERACIONES = (
+    "init_db",
+    "create_user",
+    "get_user_by_username",
+    "listar_usuarios",
+    "actualizar_password",
+    "buscar_usuarios_existentes",
+    "crear_usuarios_lote",
+    "obtener_canchas",
+    "crear_reserva",
+    "reservar_si_libre",
+    "crear_reservas_lote",
+    "obtener_reservas",
+    "obtener_reservas_rango",
+    "iterar_reservas_rango",
+    "obtener_reservas_usuario",
+    "listar_reservas",
+    "obtener_ocupacion_rango",
+    "obtener_ocupacion_agregada",
+    "crear_bloqueo",
+    "eliminar_bloqueos",
+    "obtener_bloqueos",
+    "registrar_oyente_reserva",
+)
+
+# Cancha usada cuando no se indica otra (la creada por `init_db`).
+CANCHA_PREDETERMINADA = 1
+
+# Nombres de los días (lunes = 0) tal como se guardan en la columna `dia`.
+DIAS_SEMANA = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sabado", "Domingo")
+# Máscara de `dias_semana` de un bloqueo que aplica todos los días.
+TODOS_LOS_DIAS = (1 << len(DIAS_SEMANA)) - 1
+
+
+def cargar(nombre=None):
+    """Importa y devuelve el módulo del backend `nombre` (o el de `DB_BACKEND`).
+
+    Lanza ValueError si el nombre no es conocido o si el módulo no implementa
+    todas las operaciones; los errores de importación (por ejemplo, pyodbc no
+    instalado) se propagan tal cual.
+    """
+    nombre = (nombre or BACKEND).strip().lower()
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de almacenamiento desconocido: {nombre}. Opciones: {', '.join(BACKENDS)}.")
+    modulo = importlib.import_module(BACKENDS[nombre])
+    faltantes = [operacion for operacion in OPERACIONES if not callable(getattr(modulo, operacion, None))]
+    if faltantes:
+        raise ValueError(f"El backend {nombre} no implementa: {', '.join(faltantes)}.")
+    return modulo
+
+
+_oyentes_reserva = []
+
+
+def registrar_oyente_reserva(funcion):
+    """Registra `funcion(reserva)` para ser llamada tras crear cada reserva."""
+    _oyentes_reserva.append(funcion)
+    return funcion
+
+
+def notificar_reserva_creada(reserva):
+    for oyente in _oyentes_reserva:
+        try:
+            oyente(reserva)
+        except Exception as exc:
+            print("Error en oyente de reservas:", exc)
+
+
+def a_hora(valor):
+    """Convierte "HH:MM" a `datetime.time`; otros valores se devuelven igual."""
+    if isinstance(valor, str):
+        return time.fromisoformat(valor)
+    return valor
+
+
+class Reserva:
+    """Fila de reserva compacta.
+
+    Guarda sólo los valores leídos de la base de datos en `__slots__`; los
+    campos de presentación `hora_inicio` y `hora_fin` ("HH:MM") se calculan al
+    pedirlos. Se usa igual que el dict que reemplaza: `reserva["nombre"]`,
+    `reserva.get("cancha_id")`, `dict(reserva)` y `reserva.nombre` en Jinja.
+
+    Los bloqueos de la administración se entregan como filas de este mismo
+    tipo (una por fecha y cancha) sin usuario: `es_bloqueo` los distingue.
+    """
+
+    __slots__ = ("id", "usuario_id", "usuario_username", "nombre", "fecha_reserva", "dia", "inicio", "fin",
+                 "duracion", "cancha_id")
+
+    CLAVES = __slots__ + ("hora_inicio", "hora_fin", "es_bloqueo")
+
+    def __init__(self, id, usuario_id, usuario_username, nombre, fecha_reserva, dia, inicio, fin, duracion, cancha_id):
+        self.id = id
+        self.usuario_id = usuario_id
+        self.usuario_username = usuario_username
+        self.nombre = nombre
+        self.fecha_reserva = fecha_reserva
+        self.dia = dia
+        self.inicio = inicio
+        self.fin = fin
+        self.duracion = duracion
+        self.cancha_id = cancha_id
+
+    @property
+    def hora_inicio(self):
+        return f"{self.inicio.hour:02d}:{self.inicio.minute:02d}"
+
+    @property
+    def hora_fin(self):
+        return f"{self.fin.hour:02d}:{self.fin.minute:02d}"
+
+    @property
+    def es_bloqueo(self):
+        return self.usuario_id is None
+
+    def __getitem__(self, clave):
+        if clave not in self.CLAVES:
+            raise KeyError(clave)
+        return getattr(self, clave)
+
+    def __setitem__(self, clave, valor):
+        if clave not in self.__slots__:
+            raise KeyError(clave)
+        setattr(self, clave, valor)
+
+    def __contains__(self, clave):
+        return clave in self.CLAVES
+
+    def get(self, clave, predeterminado=None):
+        return getattr(self, clave) if clave in self.CLAVES else predeterminado
+
+    def keys(self):
+        return self.CLAVES
+
+    def copia(self):
+        return Reserva(*(getattr(self, campo) for campo in self.__slots__))
+
+    def __eq__(self, otra):
+        if not isinstance(otra, Reserva):
+            return NotImplemented
+        return all(getattr(self, campo) == getattr(otra, campo) for campo in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Reserva(id={self.id!r}, fecha={self.fecha_reserva}, {self.hora_inicio}-{self.hora_fin}, cancha={self.cancha_id!r})"
+
+
+def fila_a_reserva(row):
+    """Convierte una fila (en el orden de columnas de las consultas de reservas) a `Reserva`."""
+    return Reserva(*row[:10])
+
+
+def bloqueo_aplica(dias_semana, fecha):
+    """True si un bloqueo con la máscara `dias_semana` (bit 0 = lunes) cubre `fecha`."""
+    return bool(dias_semana >> fecha.weekday() & 1)
+
+
+def nombre_bloqueo(motivo):
+    return f"Bloqueado: {motivo}" if motivo else "Bloqueado"
+
+
+def reserva_de_bloqueo(bloqueo_id, motivo, fecha, inicio, fin, cancha_id):
+    """Fila de ocupación de un bloqueo en una fecha y cancha, con el formato de `Reserva`."""
+    return Reserva(bloqueo_id, None, None, nombre_bloqueo(motivo), fecha, DIAS_SEMANA[fecha.weekday()],
+                   a_hora(inicio), a_hora(fin), None, cancha_id)
+
+
+def agregar_bloqueos(existentes, fechas, bloqueos, cancha_id):
+    """Agrega a `existentes` (fecha -> reservas) las filas de los bloqueos que cubren cada una de `fechas`.
+
+    `bloqueos` son tuplas (id, fecha_desde, fecha_hasta, dias_semana,
+    hora_inicio, hora_fin, motivo) con las fechas como `date`.
+    """
+    for fecha in fechas:
+        ocupadas = existentes.setdefault(fecha, [])
+        for bloqueo_id, desde, hasta, dias_semana, inicio, fin, motivo in bloqueos:
+            if desde <= fecha <= hasta and bloqueo_aplica(dias_semana, fecha):
+                ocupadas.append(reserva_de_bloqueo(bloqueo_id, motivo, fecha, inicio, fin, cancha_id))
+    return existentes
+
+
+def separar_conflictos(reservas, existentes, cancha_id):
+    """Separa las reservas pedidas en nuevas y en conflicto con `existentes`.
+
+    `existentes` es un dict fecha -> lista de reservas ya guardadas de la
+    cancha (incluidos los bloqueos que la cubren, ver `reserva_de_bloqueo`);
+    las pedidas también se validan entre sí. Devuelve (nuevas,
+    conflictos) con el formato de `crear_reservas_lote`.
+    """
+    nuevas = []
+    conflictos = []
+    for pedida in reservas:
+        inicio = a_hora(pedida["hora_inicio"])
+        fin = a_hora(pedida["hora_fin"])
+        ocupadas = existentes.setdefault(pedida["fecha_reserva"], [])
+        conflicto = next((r for r in ocupadas if r["inicio"] < fin and r["fin"] > inicio), None)
+        if conflicto:
+            conflictos.append((pedida, conflicto))
+            continue
+        nueva = fila_a_reserva(
+            (None, pedida["usuario_id"], pedida["usuario_username"], pedida["nombre_mostrado"],
+             pedida["fecha_reserva"], pedida["dia"], inicio, fin, pedida["duracion_horas"], cancha_id)
+        )
+        ocupadas.append(nueva)
+        nuevas.append(nueva)
+    return nuevas, conflictos
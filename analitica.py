@@ -0,0 +1,204 @@
+"""Ocupación de las canchas por hora y día de la semana sobre un rango de fechas.
+
+La base de datos agrupa las reservas del rango por día de la semana y
+horario, y por usuario (`db.obtener_ocupacion_agregada`); aquí sólo se
+suman los bloques de cada grupo, por su cantidad de reservas, en una matriz
+día de la semana × bloque horario. Las columnas son los bloques de
+`Calendario.tabla_general`.
+La capacidad de cada celda (cuántas veces está abierto ese bloque en ese día
+de la semana dentro del rango, por el número de canchas) se obtiene con
+aritmética a partir de las plantillas semanales, corrigiendo sólo las fechas
+especiales y feriados del rango, sin recorrerlo día por día.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import horarios
+
+DIAS_POR_SEMANA = 7
+# Celdas más ocupadas que se listan como picos.
+MAX_PICOS = 5
+
+
+def contar_dias_semana(fecha_inicio, fecha_fin):
+    """Cuántas veces aparece cada día de la semana (lunes = 0) entre dos fechas, ambas incluidas."""
+    total = (fecha_fin - fecha_inicio).days + 1
+    if total <= 0:
+        return [0] * DIAS_POR_SEMANA
+    semanas, resto = divmod(total, DIAS_POR_SEMANA)
+    conteo = [semanas] * DIAS_POR_SEMANA
+    primero = fecha_inicio.weekday()
+    for desplazamiento in range(resto):
+        conteo[(primero + desplazamiento) % DIAS_POR_SEMANA] += 1
+    return conteo
+
+
+def calcular_capacidad(calendario, fecha_inicio, fecha_fin, num_canchas):
+    """Matriz [día de la semana][bloque de `tabla_general`] con los bloques reservables del rango."""
+    tabla = calendario.tabla_general
+
+    def abiertos(plantilla):
+        if not len(plantilla):
+            return 0
+        return tabla.mascara_intervalo(plantilla.apertura, plantilla.cierre)
+
+    dias = contar_dias_semana(fecha_inicio, fecha_fin)
+    capacidad = []
+    for dia in range(DIAS_POR_SEMANA):
+        mascara = abiertos(calendario.tabla_dia_semana(dia))
+        capacidad.append([dias[dia] if mascara >> indice & 1 else 0 for indice in range(len(tabla))])
+    for fecha, plantilla in calendario.especiales_en(fecha_inicio, fecha_fin):
+        fila = capacidad[fecha.weekday()]
+        habitual = abiertos(calendario.tabla_dia_semana(fecha.weekday()))
+        especial = abiertos(plantilla)
+        for indice in range(len(tabla)):
+            fila[indice] += (especial >> indice & 1) - (habitual >> indice & 1)
+    return [[celda * num_canchas for celda in fila] for fila in capacidad]
+
+
+def calcular_ocupacion(agregado, fecha_inicio, fecha_fin, calendario, num_canchas, max_usuarios=20):
+    """Resume la ocupación a partir de las reservas agrupadas de `db.obtener_ocupacion_agregada`.
+
+    Devuelve un dict con:
+
+    - `ocupados`: matriz [día de la semana][bloque] con los bloques reservados.
+    - `capacidad`: matriz con los bloques reservables de cada celda.
+    - `tasas`: `ocupados` dividida por la capacidad de cada celda (0 a 1).
+    - `tasa_por_dia` y `tasa_por_hora`: ocupación agregada por fila y por columna.
+    - `horas_por_usuario`: lista de {username, reservas, horas}, de mayor a menor.
+    - `picos`: las celdas con mayor ocupación.
+    - totales del rango (`reservas`, `horas_reservadas`, `tasa_global`).
+    """
+    tabla = calendario.tabla_general
+    bloques = len(tabla)
+    ocupados = [[0] * bloques for _ in range(DIAS_POR_SEMANA)]
+
+    for franja in agregado["franjas"]:
+        fila = ocupados[franja["dia_semana"]]
+        mascara = tabla.mascara_intervalo(horarios.a_minutos(franja["inicio"]), horarios.a_minutos(franja["fin"]))
+        indice = 0
+        while mascara:
+            if mascara & 1:
+                fila[indice] += franja["reservas"]
+            mascara >>= 1
+            indice += 1
+
+    usuarios = agregado["usuarios"]
+    total_reservas = sum(usuario["reservas"] for usuario in usuarios)
+    total_minutos = sum(usuario["minutos"] for usuario in usuarios)
+
+    capacidad = calcular_capacidad(calendario, fecha_inicio, fecha_fin, num_canchas)
+    tasas = [
+        [ocupados[dia][indice] / capacidad[dia][indice] if capacidad[dia][indice] else 0.0 for indice in range(bloques)]
+        for dia in range(DIAS_POR_SEMANA)
+    ]
+    por_hora = [sum(capacidad[dia][indice] for dia in range(DIAS_POR_SEMANA)) for indice in range(bloques)]
+    tasa_por_hora = [
+        sum(ocupados[dia][indice] for dia in range(DIAS_POR_SEMANA)) / por_hora[indice] if por_hora[indice] else 0.0
+        for indice in range(bloques)
+    ]
+    tasa_por_dia = [
+        sum(ocupados[dia]) / sum(capacidad[dia]) if sum(capacidad[dia]) else 0.0
+        for dia in range(DIAS_POR_SEMANA)
+    ]
+    capacidad_total = sum(por_hora)
+    celdas = sorted(
+        ((tasas[dia][indice], dia, indice) for dia in range(DIAS_POR_SEMANA) for indice in range(bloques)
+         if ocupados[dia][indice]),
+        reverse=True,
+    )
+    horas_por_usuario = sorted(
+        (
+            {"username": datos["username"], "reservas": datos["reservas"], "horas": datos["minutos"] / 60}
+            for datos in usuarios
+        ),
+        key=lambda fila: (-fila["horas"], fila["username"] or ""),
+    )
+
+    return {
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin,
+        "horas": list(tabla.horas),
+        "num_canchas": num_canchas,
+        "dias_en_rango": contar_dias_semana(fecha_inicio, fecha_fin),
+        "ocupados": ocupados,
+        "capacidad": capacidad,
+        "tasas": tasas,
+        "tasa_por_dia": tasa_por_dia,
+        "tasa_por_hora": tasa_por_hora,
+        "picos": [
+            {"dia": dia, "hora": tabla.horas[indice], "tasa": tasa, "ocupados": ocupados[dia][indice]}
+            for tasa, dia, indice in celdas[:MAX_PICOS]
+        ],
+        "horas_por_usuario": horas_por_usuario[:max_usuarios],
+        "usuarios": len(horas_por_usuario),
+        "reservas": total_reservas,
+        "horas_reservadas": total_minutos / 60,
+        "tasa_global": sum(map(sum, ocupados)) / capacidad_total if capacidad_total else 0.0,
+    }
+
+
+class CacheAnalitica:
+    """Caché LRU de resúmenes de ocupación por rango, segura para hilos.
+
+    Al crear una reserva se descartan los rangos que contienen su fecha; el
+    TTL acota el desfase con reservas hechas desde otras instancias.
+    """
+
+    def __init__(self, max_rangos=32, ttl_segundos=300.0):
+        self.max_rangos = max_rangos
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()  # (fecha_inicio, fecha_fin, variante) -> (resumen, guardado_en)
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0, "desalojos": 0, "invalidaciones": 0}
+
+    def obtener(self, fecha_inicio, fecha_fin, variante, calcular):
+        """Devuelve el resumen del rango, calculándolo con `calcular()` si hace falta."""
+        clave = (fecha_inicio, fecha_fin, variante)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[1] <= self.ttl_segundos:
+                self._entradas.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada[0]
+            self._stats["fallos"] += 1
+            generacion = self._generacion
+
+        resumen = calcular()
+        with self._lock:
+            if generacion != self._generacion:
+                # Se creó una reserva mientras se calculaba: no se guarda.
+                return resumen
+            self._entradas[clave] = (resumen, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_rangos:
+                self._entradas.popitem(last=False)
+                self._stats["desalojos"] += 1
+        return resumen
+
+    def registrar_reserva(self, reserva):
+        """Oyente de reservas creadas: descarta los rangos que incluyen su fecha."""
+        fecha = reserva["fecha_reserva"]
+        with self._lock:
+            self._generacion += 1
+            for clave in [clave for clave in self._entradas if clave[0] <= fecha <= clave[1]]:
+                del self._entradas[clave]
+                self._stats["invalidaciones"] += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Devuelve los contadores de la caché (aciertos, fallos, desalojos, tamaño)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["rangos"] = len(self._entradas)
+            stats["max_rangos"] = self.max_rangos
+        consultas = stats["aciertos"] + stats["fallos"]
+        stats["tasa_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+        return stats
@@ -1,32 +1,145 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, Response, stream_with_context
+from markupsafe import Markup
+from werkzeug.utils import secure_filename
 import os
+
+import almacenamiento
+import metricas
 try:
-    import db
+    # Backend elegido con DB_BACKEND: sqlserver (por defecto), sqlite o memoria.
+    db = almacenamiento.cargar()
     DB_AVAILABLE = True
 except Exception as _err:
     db = None
     DB_AVAILABLE = False
-    print("Aviso: módulo de base de datos no disponible. Instala 'pyodbc' y configura MSSQL_CONN para habilitar auth.")
+    print(f"Aviso: backend de almacenamiento '{almacenamiento.BACKEND}' no disponible ({_err}).")
+    print("Instala 'pyodbc' para SQL Server o usa DB_BACKEND=sqlite / DB_BACKEND=memoria.")
 from datetime import datetime, timedelta, date
+import hashlib
+import time
+
+import analitica
+import calendario
+import disponibilidad
+import eventos
+import exportacion
+import fragmentos
+import horarios
+import importacion
+import lectura
+import seguridad
 
 app = Flask(__name__)
 app.secret_key = "canchas_secretas"  # clave necesaria para usar mensajes flash
 
 FORMATO_FECHA = "%Y-%m-%d"
 
-# Días disponibles para mostrar en los formularios.
-DIAS_SEMANA = [
-    "Lunes",
-    "Martes",
-    "Miércoles",
-    "Jueves",
-    "Viernes",
-    "Sabado",
-    "Domingo"
-]
+# Días disponibles para mostrar en los formularios (mismo texto que la columna `dia`).
+DIAS_SEMANA = list(almacenamiento.DIAS_SEMANA)
+
+# Horario de apertura por día de la semana, feriados y duraciones (HORARIO_ARCHIVO, JSON).
+# Sin archivo: todos los días de 06:00 a 22:00 en bloques de una hora y reservas de 1 a 3 horas.
+CALENDARIO = calendario.cargar(os.environ.get("HORARIO_ARCHIVO"))
+DURACIONES = CALENDARIO.duraciones
+# Todas las horas de inicio posibles en algún día; las de cada fecha salen de `CALENDARIO.tabla(fecha)`.
+HORAS_DISPONIBLES = list(CALENDARIO.horas)
+
+# Días hacia adelante en los que se buscan huecos libres por defecto, y límites de la búsqueda.
+HUECOS_DIAS_HORIZONTE = int(os.environ.get("HUECOS_DIAS_HORIZONTE", "90"))
+HUECOS_MAX_DIAS = 366
+HUECOS_MAX_RESULTADOS = 50
+# Huecos que se sugieren cuando la fecha elegida está completa.
+HUECOS_SUGERIDOS = 3
+# Días que puede abarcar como máximo el rango de la analítica de ocupación.
+ANALITICA_MAX_DIAS = 366
+
+# Paginación de "Mis reservas": filas por página y máximo que se puede pedir.
+MIS_RESERVAS_POR_PAGINA = 20
+MIS_RESERVAS_MAX_PAGINA = 100
+VISTAS_MIS_RESERVAS = ("proximas", "anteriores")
+# Paginación de los listados de administración (usuarios y reservas).
+ADMIN_POR_PAGINA = 50
+ADMIN_MAX_PAGINA = 200
+ORDENES_ADMIN_RESERVAS = ("recientes", "antiguas")
+
+
+def _cargar_reservas_fecha(fecha):
+    if not DB_AVAILABLE:
+        return []
+    # Reservas y bloqueos de la fecha en una sola consulta.
+    return db.obtener_ocupacion_rango(fecha, fecha)
+
+
+# Ocupación por fecha en memoria; se actualiza al crear reservas.
+cache_disponibilidad = disponibilidad.CacheDisponibilidad(
+    _cargar_reservas_fecha,
+    CALENDARIO,
+    max_fechas=int(os.environ.get("CACHE_DISPONIBILIDAD_FECHAS", "400")),
+    ttl_segundos=float(os.environ.get("CACHE_DISPONIBILIDAD_TTL", "60")),
+)
+# HTML del resumen semanal por semana ISO; se invalida al reservar en esa semana.
+cache_resumen = fragmentos.CacheFragmentos(
+    max_entradas=int(os.environ.get("CACHE_RESUMEN_SEMANAS", "64")),
+    ttl_segundos=float(os.environ.get("CACHE_RESUMEN_TTL", "60")),
+)
+
+# Resúmenes de ocupación por rango de fechas; se descartan al reservar dentro del rango.
+cache_analitica = analitica.CacheAnalitica(
+    max_rangos=int(os.environ.get("CACHE_ANALITICA_RANGOS", "32")),
+    ttl_segundos=float(os.environ.get("CACHE_ANALITICA_TTL", "300")),
+)
+
+# Reparte a los clientes de /stream las reservas creadas en este proceso.
+difusor_reservas = eventos.Difusor(
+    tamano_cola=int(os.environ.get("SSE_TAMANO_COLA", "100")),
+    max_clientes=int(os.environ.get("SSE_MAX_CLIENTES", "200")),
+)
+# Cada cuántos segundos se envía un comentario para mantener viva la conexión.
+SSE_PING_SEGUNDOS = 15
+
+if DB_AVAILABLE:
+    metricas.instrumentar_backend(db, [op for op in almacenamiento.OPERACIONES if op != "registrar_oyente_reserva"])
+    if hasattr(db, "estadisticas_pool"):
+        metricas.registrar_colector("db_pool", db.estadisticas_pool)
+    db.registrar_oyente_reserva(cache_disponibilidad.registrar_reserva)
+    db.registrar_oyente_reserva(cache_resumen.registrar_reserva)
+    db.registrar_oyente_reserva(cache_analitica.registrar_reserva)
+    db.registrar_oyente_reserva(difusor_reservas.publicar_reserva)
+    if db.EMBEBIDO:
+        # SQLite y memoria viven en el proceso: se preparan al importar la aplicación.
+        db.init_db()
+
+CANCHA_PREDETERMINADA = disponibilidad.CANCHA_PREDETERMINADA
+CANCHAS_PREDETERMINADAS = [{"id": CANCHA_PREDETERMINADA, "nombre": "Cancha 1"}]
+# Las canchas cambian muy poco: se releen de la base de datos cada pocos minutos.
+CANCHAS_TTL_SEGUNDOS = 300
+_canchas_cache = {"canchas": None, "cargadas_en": 0.0}
+
+
+def obtener_canchas():
+    """Devuelve la lista de canchas activas como dicts {'id', 'nombre'}."""
+    ahora = time.monotonic()
+    if _canchas_cache["canchas"] is None or ahora - _canchas_cache["cargadas_en"] > CANCHAS_TTL_SEGUNDOS:
+        canchas = CANCHAS_PREDETERMINADAS
+        if DB_AVAILABLE:
+            try:
+                canchas = db.obtener_canchas() or CANCHAS_PREDETERMINADAS
+            except Exception as exc:
+                print("No se pudieron cargar las canchas:", exc)
+        _canchas_cache["canchas"] = canchas
+        _canchas_cache["cargadas_en"] = ahora
+    return _canchas_cache["canchas"]
 
-HORAS_DISPONIBLES = [f"{hora:02d}:00" for hora in range(6, 22)]
+
+def leer_cancha(valor, canchas):
+    """Convierte el id de cancha recibido a int; si no es válido usa la primera cancha."""
+    try:
+        cancha_id = int(valor)
+    except (ValueError, TypeError):
+        return canchas[0]["id"]
+    if any(cancha["id"] == cancha_id for cancha in canchas):
+        return cancha_id
+    return canchas[0]["id"]
 
 
 def obtener_dia_desde_fecha(fecha_obj):
@@ -45,28 +158,29 @@ def obtener_reservas_por_dia(fecha_inicio=None, fecha_fin=None):
     reservas_db = []
     if DB_AVAILABLE:
         try:
-            reservas_db = db.obtener_reservas()
+            # El filtro por rango se hace en SQL; las filas ya vienen ordenadas
+            # por fecha y hora de inicio. Con el rango completo se incluyen los bloqueos.
+            if fecha_inicio and fecha_fin:
+                reservas_db = db.obtener_ocupacion_rango(fecha_inicio, fecha_fin)
+            else:
+                reservas_db = db.obtener_reservas_rango(fecha_inicio, fecha_fin)
         except Exception as exc:
             print("No se pudieron cargar reservas desde la base de datos:", exc)
+        else:
+            # Aprovechamos la consulta semanal para refrescar la caché de disponibilidad.
+            if fecha_inicio and fecha_fin:
+                cache_disponibilidad.precargar_rango(fecha_inicio, fecha_fin, reservas_db)
 
     for reserva in reservas_db:
-        fecha_reserva = reserva.get("fecha_reserva")
-        if fecha_inicio and fecha_reserva and fecha_reserva < fecha_inicio:
-            continue
-        if fecha_fin and fecha_reserva and fecha_reserva > fecha_fin:
-            continue
         if reserva["dia"] in reservas_por_dia:
             reservas_por_dia[reserva["dia"]].append(reserva)
 
-    for reservas_dia in reservas_por_dia.values():
-        reservas_dia.sort(key=lambda r: (r.get("fecha_reserva", date.today()), r["inicio"]))
-
     return reservas_por_dia
 
 
 def horarios_se_cruzan(inicio_a, fin_a, inicio_b, fin_b):
     """Devuelve True si dos rangos horarios se sobreponen."""
-    return inicio_a < fin_b and fin_a > inicio_b
+    return horarios.se_cruzan(inicio_a, fin_a, inicio_b, fin_b)
 
 
 def obtener_dia_actual():
@@ -74,49 +188,66 @@ def obtener_dia_actual():
     return obtener_dia_desde_fecha(datetime.now().date())
 
 
-def generar_segmentos_horarios(reservas_dia, horas_disponibles=None):
-    """Construye una lista de bloques horarios de una hora marcando disponibilidad."""
-    if horas_disponibles is None:
-        horas_disponibles = HORAS_DISPONIBLES
+def generar_segmentos_horarios(reservas_dia, tabla):
+    """Construye la lista de bloques horarios de `tabla` marcando disponibilidad.
 
-    segmentos = []
-    formato = "%H:%M"
-    for hora_inicio_str in horas_disponibles:
-        hora_actual = datetime.strptime(hora_inicio_str, formato)
-        siguiente_hora = hora_actual + timedelta(hours=1)
-        reserva_segmento = next(
-            (
-                reserva
-                for reserva in reservas_dia
-                if horarios_se_cruzan(
-                    hora_actual.time(),
-                    siguiente_hora.time(),
-                    reserva["inicio"],
-                    reserva["fin"],
-                )
-            ),
-            None,
-        )
+    `tabla` es la de la fecha (`CALENDARIO.tabla(fecha)`); un día cerrado no tiene bloques.
+    Los bloqueos de la administración llegan entre las reservas y se marcan "Bloqueado".
+    Si un bloqueo cubre una reserva ya hecha, el bloque se muestra "Reservado" con esa
+    reserva, para que no quede oculta.
+    """
+
+    # Pasamos cada reserva a minutos una sola vez; las reservas reales van antes que
+    # los bloqueos para que la búsqueda de cada bloque las encuentre primero.
+    intervalos = sorted(
+        (
+            (horarios.a_minutos(reserva["inicio"]), horarios.a_minutos(reserva["fin"]), reserva)
+            for reserva in reservas_dia
+        ),
+        key=lambda intervalo: bool(intervalo[2].get("es_bloqueo")),
+    )
+    mascara = 0
+    for inicio, fin, _ in intervalos:
+        mascara |= tabla.mascara_intervalo(inicio, fin)
 
+    segmentos = []
+    for indice, hora_inicio in enumerate(tabla.horas):
+        reserva_segmento = None
+        # Sólo buscamos la reserva cuando la máscara indica que el bloque está ocupado.
+        if mascara >> indice & 1:
+            inicio_bloque = tabla.inicios[indice]
+            fin_bloque = tabla.fines[indice]
+            reserva_segmento = next(
+                (
+                    reserva
+                    for inicio, fin, reserva in intervalos
+                    if horarios.se_cruzan(inicio_bloque, fin_bloque, inicio, fin)
+                ),
+                None,
+            )
+
+        estado = "Disponible"
+        if reserva_segmento:
+            estado = "Bloqueado" if reserva_segmento.get("es_bloqueo") else "Reservado"
         segmentos.append(
             {
-                "hora_inicio": hora_actual.strftime(formato),
-                "hora_fin": siguiente_hora.strftime(formato),
-                "estado": "Reservado" if reserva_segmento else "Disponible",
+                "hora_inicio": hora_inicio,
+                "hora_fin": tabla.textos_fin[indice],
+                "estado": estado,
                 "reserva": reserva_segmento,
             }
         )
 
-        hora_actual = siguiente_hora
-
     return segmentos
 
 
-def obtener_horas_libres(dia, duracion=1, fecha_reserva=None):
-    """Devuelve la lista de horas en punto libres para un día específico.
+def obtener_horas_libres(dia, duracion=1, fecha_reserva=None, cancha_id=CANCHA_PREDETERMINADA):
+    """Devuelve la lista de horas de inicio libres para un día específico.
 
     Ahora considera la `duracion` (horas) y devuelve sólo las horas de inicio
-    que cuentan con `duracion` bloques consecutivos libres.
+    que cuentan con `duracion` horas consecutivas libres en la cancha
+    `cancha_id`, dentro del horario de la fecha. La ocupación de la fecha se
+    toma de `cache_disponibilidad`.
     """
     if dia not in DIAS_SEMANA:
         return []
@@ -124,65 +255,141 @@ def obtener_horas_libres(dia, duracion=1, fecha_reserva=None):
     if fecha_reserva is None:
         return HORAS_DISPONIBLES.copy()
 
-    formato = "%H:%M"
-    # Marcamos ocupadas todas las horas en punto que estén cubiertas por reservas.
-    horas_ocupadas = set()
-    reservas_fecha = []
-    if DB_AVAILABLE:
-        try:
-            reservas_fecha = db.obtener_reservas(fecha_reserva)
-        except Exception as exc:
-            print("No se pudieron obtener reservas para la fecha", fecha_reserva, exc)
-
-    for reserva in reservas_fecha:
-        if reserva["dia"] != dia:
-            continue
-        inicio_dt = datetime.strptime(reserva["hora_inicio"], formato)
-        fin_dt = datetime.strptime(reserva["hora_fin"], formato)
-        curr = inicio_dt
-        while curr < fin_dt:
-            horas_ocupadas.add(curr.strftime(formato))
-            curr += timedelta(hours=1)
-
-    # Ahora para cada posible hora de inicio, comprobamos si hay duracion bloques
-    horas_validas = []
-    for hora in HORAS_DISPONIBLES:
-        inicio_dt = datetime.strptime(hora, formato)
-        fin_dt = inicio_dt + timedelta(hours=duracion)
-        # comprobar que no exceda horario de cierre (22:00)
-        cierre = datetime.strptime(HORAS_DISPONIBLES[-1], formato) + timedelta(hours=1)
-        if fin_dt > cierre:
-            continue
-
-        # comprobar todos los bloques intermedios
-        curr = inicio_dt
-        disponible = True
-        while curr < fin_dt:
-            if curr.strftime(formato) in horas_ocupadas:
-                disponible = False
-                break
-            curr += timedelta(hours=1)
-
-        if disponible:
-            horas_validas.append(hora)
-
-    return horas_validas
-
-
-def construir_horas_inicio_fin(dia, duracion=1, fecha_reserva=None):
+    try:
+        return cache_disponibilidad.horas_libres(fecha_reserva, duracion, cancha_id)
+    except Exception as exc:
+        print("No se pudieron obtener reservas para la fecha", fecha_reserva, exc)
+        return cache_disponibilidad.horas_libres_desde_mascara(0, duracion, CALENDARIO.tabla(fecha_reserva))
+
+
+def construir_horas_inicio_fin(dia, duracion=1, fecha_reserva=None, cancha_id=CANCHA_PREDETERMINADA):
     """Devuelve una lista de dicts {'hora_inicio','hora_fin'} para horas de inicio
     válidas según la duración."""
-    formato = "%H:%M"
-    horas_inicio = obtener_horas_libres(dia, duracion, fecha_reserva)
-    result = []
-    for hora in horas_inicio:
-        inicio_dt = datetime.strptime(hora, formato)
-        fin_dt = inicio_dt + timedelta(hours=duracion)
-        result.append({
-            "hora_inicio": inicio_dt.strftime(formato),
-            "hora_fin": fin_dt.strftime(formato),
-        })
-    return result
+    horas_inicio = obtener_horas_libres(dia, duracion, fecha_reserva, cancha_id)
+    return [
+        {
+            "hora_inicio": hora,
+            "hora_fin": horarios.a_texto(horarios.fin_de(hora, duracion)),
+        }
+        for hora in horas_inicio
+    ]
+
+
+def buscar_huecos_libres(fecha_desde, dias, duracion, cancha_ids, dias_semana=None, horas=None, limite=5):
+    """Primeros huecos libres desde `fecha_desde` en los próximos `dias` días.
+
+    Lee las reservas y bloqueos de todo el horizonte con una sola consulta y delega el
+    recorrido en `disponibilidad.buscar_huecos`. No devuelve fechas pasadas
+    ni bloques de hoy que ya empezaron. Cada hueco incluye el nombre del día.
+    """
+    ahora = datetime.now()
+    fecha_desde = max(fecha_desde, ahora.date())
+    # El horizonte se recorta al último día representable (9999-12-31).
+    fecha_hasta = fecha_desde + timedelta(days=min(dias - 1, (date.max - fecha_desde).days))
+    minuto_minimo = ahora.hour * 60 + ahora.minute if fecha_desde == ahora.date() else 0
+    reservas = db.obtener_ocupacion_rango(fecha_desde, fecha_hasta) if DB_AVAILABLE else []
+    huecos = disponibilidad.buscar_huecos(
+        reservas,
+        fecha_desde,
+        fecha_hasta,
+        CALENDARIO,
+        duracion,
+        cancha_ids,
+        dias_semana=dias_semana,
+        horas=horas,
+        limite=limite,
+        minuto_minimo=minuto_minimo,
+    )
+    for hueco in huecos:
+        hueco["dia"] = obtener_dia_desde_fecha(hueco["fecha"])
+    return huecos
+
+
+def leer_busqueda_huecos(args, canchas):
+    """Valida los parámetros de búsqueda de huecos. Devuelve (criterios, error)."""
+    try:
+        fecha_desde = datetime.strptime(args["desde"], FORMATO_FECHA).date() if args.get("desde") else date.today()
+    except ValueError:
+        return None, "Fecha inválida, usa el formato AAAA-MM-DD."
+    try:
+        dias = int(args.get("dias", HUECOS_DIAS_HORIZONTE))
+        duracion = int(args.get("duracion", DURACIONES[0]))
+        limite = int(args.get("limite", 5))
+    except (ValueError, TypeError):
+        return None, "Los parámetros dias, duracion y limite deben ser números enteros."
+    if duracion not in DURACIONES:
+        return None, f"La duración debe ser una de: {', '.join(map(str, DURACIONES))} horas."
+    if not 1 <= dias <= HUECOS_MAX_DIAS:
+        return None, f"El horizonte debe ser de 1 a {HUECOS_MAX_DIAS} días."
+    if fecha_desde > date.max - timedelta(days=dias - 1):
+        return None, "El horizonte de búsqueda supera la última fecha válida."
+    limite = min(max(limite, 1), HUECOS_MAX_RESULTADOS)
+
+    nombres_dias = [dia for dia in args.getlist("dia") if dia]
+    if any(dia not in DIAS_SEMANA for dia in nombres_dias):
+        return None, "Día de la semana no válido."
+    horas = [hora for hora in args.getlist("hora") if hora]
+    if any(hora not in HORAS_DISPONIBLES for hora in horas):
+        return None, "Hora de inicio no válida."
+
+    cancha_ids = [cancha["id"] for cancha in canchas]
+    if args.get("cancha"):
+        cancha_ids = [leer_cancha(args.get("cancha"), canchas)]
+
+    return {
+        "fecha_desde": fecha_desde,
+        "dias": dias,
+        "duracion": duracion,
+        "cancha_ids": cancha_ids,
+        "dias_semana": {DIAS_SEMANA.index(dia) for dia in nombres_dias} or None,
+        "horas": horas or None,
+        "limite": limite,
+    }, None
+
+
+def describir_horario(tabla):
+    """Apertura, cierre y tamaño de bloque de una tabla para las vistas; None si está cerrado."""
+    if not len(tabla):
+        return None
+    return {
+        "apertura": horarios.a_texto(tabla.apertura),
+        "cierre": horarios.a_texto(tabla.cierre),
+        "minutos_bloque": tabla.minutos_bloque,
+    }
+
+
+def cargar_disponibilidad_dia(fecha):
+    """`EntradaDisponibilidad` de la fecha, o None si la base de datos no respondió."""
+    try:
+        return cache_disponibilidad.obtener(fecha)
+    except Exception as exc:
+        print("No se pudieron obtener reservas para la fecha", fecha, exc)
+        return None
+
+
+def generar_grilla_canchas(fecha, canchas):
+    """Construye la grilla cancha × hora de una fecha.
+
+    Usa una sola carga de la fecha (todas las canchas) desde
+    `cache_disponibilidad`. Devuelve una fila por bloque horario con el estado
+    de cada cancha en el mismo orden que `canchas`.
+    """
+    entrada = cargar_disponibilidad_dia(fecha)
+    tabla = entrada.tabla if entrada else CALENDARIO.tabla(fecha)
+    columnas = [
+        generar_segmentos_horarios(entrada.ocupacion(cancha["id"]).reservas if entrada else [], tabla)
+        for cancha in canchas
+    ]
+    grilla = []
+    for indice, hora_inicio in enumerate(tabla.horas):
+        grilla.append(
+            {
+                "hora_inicio": hora_inicio,
+                "hora_fin": tabla.textos_fin[indice],
+                "canchas": [segmentos[indice] for segmentos in columnas],
+            }
+        )
+    return grilla
 
 
 @app.route("/")
@@ -229,24 +436,49 @@ def inicio():
 
     inicio_semana = fecha_seleccionada - timedelta(days=fecha_seleccionada.weekday())
     fin_semana = inicio_semana + timedelta(days=6)
-    reservas_por_dia = obtener_reservas_por_dia(inicio_semana, fin_semana)
-    reservas_dia = reservas_por_dia.get(dia_seleccionado, [])
-    reservas_dia_fecha = [r for r in reservas_dia if r.get("fecha_reserva") == fecha_seleccionada]
-    segmentos = generar_segmentos_horarios(reservas_dia_fecha)
+    semana_resumen = fragmentos.semana_iso(inicio_semana)
+    # Versión del resumen tomada antes de leer la semana: si se reserva durante la
+    # consulta, el HTML renderizado con los datos viejos no se guarda.
+    version_resumen = cache_resumen.version(semana_resumen)
+    canchas = obtener_canchas()
+    cancha_id = leer_cancha(request.args.get("cancha") or form_data.get("cancha_id"), canchas)
+    if cache_disponibilidad.vigente(fecha_seleccionada):
+        reservas_por_dia = obtener_reservas_por_dia(inicio_semana, fin_semana)
+        entrada_dia = cargar_disponibilidad_dia(fecha_seleccionada)
+    else:
+        # Sin el día elegido en caché, su ocupación y la semana se piden a la vez en
+        # modo concurrente. En modo secuencial la consulta semanal la deja precargada.
+        reservas_por_dia, entrada_dia = lectura.en_paralelo(
+            lambda: obtener_reservas_por_dia(inicio_semana, fin_semana),
+            lambda: cargar_disponibilidad_dia(fecha_seleccionada),
+        )
+    reservas_dia_fecha = entrada_dia.ocupacion(cancha_id).reservas if entrada_dia else []
+    tabla_dia = CALENDARIO.tabla(fecha_seleccionada)
+    segmentos = generar_segmentos_horarios(reservas_dia_fecha, tabla_dia)
+    grilla_canchas = generar_grilla_canchas(fecha_seleccionada, canchas) if len(canchas) > 1 else []
     dia_formulario = dia_seleccionado
-    # Determinar duración: prioridad GET > form_data > 1
+    # Determinar duración: prioridad GET > form_data > la primera permitida
     try:
         duracion = int(duracion_param) if duracion_param else int(form_data.get("duracion", 1))
     except (ValueError, TypeError):
         duracion = 1
 
-    if duracion not in (1, 2, 3):
-        duracion = 1
+    if duracion not in DURACIONES:
+        duracion = DURACIONES[0]
 
-    horas_formulario = construir_horas_inicio_fin(dia_formulario, duracion, fecha_seleccionada)
+    horas_formulario = construir_horas_inicio_fin(dia_formulario, duracion, fecha_seleccionada, cancha_id)
     hora_previa = form_data.get("hora_inicio")
     hora_previa_no_disponible = bool(hora_previa and hora_previa not in horas_formulario)
     formulario_bloqueado = len(horas_formulario) == 0
+    dia_cerrado = not len(tabla_dia)
+    huecos_sugeridos = []
+    if formulario_bloqueado:
+        try:
+            huecos_sugeridos = buscar_huecos_libres(
+                fecha_seleccionada, HUECOS_DIAS_HORIZONTE, duracion, [cancha_id], limite=HUECOS_SUGERIDOS
+            )
+        except Exception as exc:
+            print("No se pudieron buscar huecos libres:", exc)
 
     nombre_usuario = obtener_nombre_usuario(usuario)
     form_data["dia"] = dia_formulario
@@ -260,9 +492,25 @@ def inicio():
             "visual": fecha_dia.strftime("%d-%m-%Y"),
         }
 
+    nombres_canchas = {cancha["id"]: cancha["nombre"] for cancha in canchas}
+    # El resumen es igual para todos los que miran la semana: se reutiliza el HTML.
+    resumen_semanal = cache_resumen.obtener(
+        semana_resumen,
+        tuple(sorted(nombres_canchas.items())),
+        lambda: render_template(
+            "_resumen_semanal.html",
+            reservas_por_dia=reservas_por_dia,
+            dias=DIAS_SEMANA,
+            fechas_semana=fechas_semana,
+            canchas=canchas,
+            nombres_canchas=nombres_canchas,
+        ),
+        version=version_resumen,
+    )
+
     return render_template(
         "index.html",
-        reservas_por_dia=reservas_por_dia,
+        resumen_semanal=Markup(resumen_semanal),
         dias=DIAS_SEMANA,
         form_data=form_data,
         dia_seleccionado=dia_seleccionado,
@@ -270,6 +518,10 @@ def inicio():
         dia_formulario=dia_formulario,
         horas_formulario=horas_formulario,
         formulario_bloqueado=formulario_bloqueado,
+        dia_cerrado=dia_cerrado,
+        horario_dia=describir_horario(tabla_dia),
+        duraciones=DURACIONES,
+        huecos_sugeridos=huecos_sugeridos,
         hora_previa=hora_previa,
         hora_previa_no_disponible=hora_previa_no_disponible,
         duracion=duracion,
@@ -277,9 +529,353 @@ def inicio():
         nombre_usuario=nombre_usuario,
         fecha_reserva=fecha_seleccionada.strftime(FORMATO_FECHA),
         fechas_semana=fechas_semana,
+        canchas=canchas,
+        cancha_id=cancha_id,
+        nombres_canchas=nombres_canchas,
+        grilla_canchas=grilla_canchas,
+    )
+
+
+@app.route("/api/disponibilidad")
+def api_disponibilidad():
+    """Segmentos y horas de inicio libres de una fecha en JSON.
+
+    Responde con un ETag fuerte derivado de la versión de las reservas de la
+    fecha, de modo que los clientes pueden revalidar con `If-None-Match` y
+    recibir un 304 sin cuerpo mientras nada cambie.
+    """
+    if not usuario_actual():
+        return jsonify({"error": "No autenticado."}), 401
+
+    fecha_param = request.args.get("fecha")
+    try:
+        fecha = datetime.strptime(fecha_param, FORMATO_FECHA).date() if fecha_param else date.today()
+    except ValueError:
+        return jsonify({"error": "Fecha inválida, usa el formato AAAA-MM-DD."}), 400
+
+    try:
+        duracion = int(request.args.get("duracion", 1))
+    except (ValueError, TypeError):
+        duracion = 1
+    if duracion not in DURACIONES:
+        duracion = DURACIONES[0]
+
+    try:
+        canchas = obtener_canchas()
+        entrada = cache_disponibilidad.obtener(fecha)
+    except Exception as exc:
+        print("No se pudieron obtener reservas para la fecha", fecha, exc)
+        return jsonify({"error": "No se pudo consultar la disponibilidad."}), 503
+    cancha_id = leer_cancha(request.args.get("cancha"), canchas)
+
+    etag = hashlib.sha1(
+        f"{fecha.isoformat()}|{cancha_id}|{duracion}|{entrada.version}|{CALENDARIO.version}".encode()
+    ).hexdigest()
+    if etag in request.if_none_match:
+        respuesta = app.response_class(status=304)
+    else:
+        dia = obtener_dia_desde_fecha(fecha)
+        segmentos = generar_segmentos_horarios(entrada.ocupacion(cancha_id).reservas, entrada.tabla)
+        respuesta = jsonify(
+            {
+                "fecha": fecha.strftime(FORMATO_FECHA),
+                "dia": dia,
+                "cancha_id": cancha_id,
+                "duracion": duracion,
+                "segmentos": [
+                    {
+                        "hora_inicio": segmento["hora_inicio"],
+                        "hora_fin": segmento["hora_fin"],
+                        "estado": segmento["estado"],
+                        "reserva": {
+                            "nombre": segmento["reserva"]["nombre"],
+                            "hora_inicio": segmento["reserva"]["hora_inicio"],
+                            "hora_fin": segmento["reserva"]["hora_fin"],
+                        } if segmento["reserva"] else None,
+                    }
+                    for segmento in segmentos
+                ],
+                "horas": construir_horas_inicio_fin(dia, duracion, fecha, cancha_id),
+            }
+        )
+    respuesta.set_etag(etag)
+    # Incluye nombres de quienes reservan: sólo cachés privadas, siempre revalidando.
+    respuesta.headers["Cache-Control"] = "private, no-cache"
+    return respuesta
+
+
+@app.route("/api/huecos")
+def api_huecos():
+    """Primeros huecos libres para una duración, con días y horas preferidos opcionales.
+
+    Parámetros: `duracion` (1-3), `desde` (AAAA-MM-DD, por defecto hoy),
+    `dias` (horizonte), `limite`, `cancha` y `dia`/`hora` repetibles.
+    """
+    if not usuario_actual():
+        return jsonify({"error": "No autenticado."}), 401
+
+    criterios, error = leer_busqueda_huecos(request.args, obtener_canchas())
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        huecos = buscar_huecos_libres(**criterios)
+    except Exception as exc:
+        print("No se pudieron buscar huecos libres:", exc)
+        return jsonify({"error": "No se pudo consultar la disponibilidad."}), 503
+
+    return jsonify(
+        {
+            "duracion": criterios["duracion"],
+            "huecos": [dict(hueco, fecha=hueco["fecha"].strftime(FORMATO_FECHA)) for hueco in huecos],
+        }
+    )
+
+
+@app.route("/buscar")
+def buscar_huecos():
+    """Formulario para buscar los próximos horarios libres."""
+    usuario = usuario_actual()
+    if not usuario:
+        return redirect(url_for("login"))
+
+    canchas = obtener_canchas()
+    huecos = None
+    if request.args:
+        criterios, error = leer_busqueda_huecos(request.args, canchas)
+        if error:
+            flash(error, "warning")
+        else:
+            try:
+                huecos = buscar_huecos_libres(**criterios)
+            except Exception as exc:
+                print("No se pudieron buscar huecos libres:", exc)
+                flash("No se pudo consultar la disponibilidad.", "danger")
+
+    return render_template(
+        "buscar.html",
+        huecos=huecos,
+        valores=request.args,
+        dias=DIAS_SEMANA,
+        horas=HORAS_DISPONIBLES,
+        canchas=canchas,
+        nombres_canchas={cancha["id"]: cancha["nombre"] for cancha in canchas},
+        horizonte=HUECOS_DIAS_HORIZONTE,
+        max_dias=HUECOS_MAX_DIAS,
+        duraciones=DURACIONES,
     )
 
 
+def cursor_reserva(reserva):
+    """Cursor de paginación de una reserva: "AAAA-MM-DD_HH:MM_id"."""
+    return f"{reserva['fecha_reserva'].strftime(FORMATO_FECHA)}_{reserva['hora_inicio']}_{reserva['id']}"
+
+
+def leer_cursor(texto):
+    """Convierte un cursor de `cursor_reserva` a la tupla (fecha, hora, id); ValueError si no es válido."""
+    fecha, hora, reserva_id = texto.split("_")
+    return (
+        datetime.strptime(fecha, FORMATO_FECHA).date(),
+        datetime.strptime(hora, "%H:%M").time(),
+        int(reserva_id),
+    )
+
+
+def leer_limite(args, por_defecto, maximo):
+    """Lee el parámetro `limite` acotado entre 1 y `maximo`; ValueError si no es un entero."""
+    try:
+        limite = int(args.get("limite", por_defecto))
+    except (ValueError, TypeError):
+        raise ValueError("El parámetro limite debe ser un número entero.")
+    return min(max(limite, 1), maximo)
+
+
+def pagina_mis_reservas(usuario_id, args):
+    """Lee `vista`, `despues` y `limite` y devuelve (pagina, error).
+
+    "proximas" recorre desde hoy hacia adelante y "anteriores" desde ayer
+    hacia atrás. Se pide una fila de más para saber si hay otra página; el
+    cursor `siguiente` es la clave de la última fila mostrada.
+    """
+    vista = args.get("vista") or VISTAS_MIS_RESERVAS[0]
+    if vista not in VISTAS_MIS_RESERVAS:
+        return None, "Vista no válida."
+    try:
+        limite = leer_limite(args, MIS_RESERVAS_POR_PAGINA, MIS_RESERVAS_MAX_PAGINA)
+    except ValueError as exc:
+        return None, str(exc)
+    if args.get("despues"):
+        try:
+            despues = leer_cursor(args["despues"])
+        except ValueError:
+            return None, "Cursor de paginación inválido."
+    else:
+        # Clave anterior a cualquier reserva de hoy: separa las próximas de las anteriores.
+        despues = (date.today(), horarios.a_hora(0), 0)
+
+    reservas = db.obtener_reservas_usuario(usuario_id, despues, limite + 1, descendente=vista == "anteriores")
+    return {
+        "vista": vista,
+        "reservas": reservas[:limite],
+        "siguiente": cursor_reserva(reservas[limite - 1]) if len(reservas) > limite else None,
+        "limite": limite,
+    }, None
+
+
+@app.route("/mis-reservas")
+def mis_reservas():
+    """Historial de reservas del usuario en sesión, por páginas."""
+    usuario = usuario_actual()
+    if not usuario:
+        return redirect(url_for("login"))
+
+    pagina = None
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible.", "danger")
+    else:
+        try:
+            pagina, error = pagina_mis_reservas(usuario["id"], request.args)
+        except Exception as exc:
+            print("No se pudieron cargar las reservas del usuario:", exc)
+            flash("Error al consultar tus reservas.", "danger")
+        else:
+            if error:
+                flash(error, "warning")
+
+    canchas = obtener_canchas()
+    return render_template(
+        "mis_reservas.html",
+        pagina=pagina,
+        vista=pagina["vista"] if pagina else VISTAS_MIS_RESERVAS[0],
+        primera_pagina=not request.args.get("despues"),
+        canchas=canchas,
+        nombres_canchas={cancha["id"]: cancha["nombre"] for cancha in canchas},
+        usuario=usuario,
+        nombre_usuario=obtener_nombre_usuario(usuario),
+    )
+
+
+@app.route("/api/mis-reservas")
+def api_mis_reservas():
+    """Las reservas del usuario en sesión en JSON, con el cursor de la página siguiente.
+
+    Parámetros: `vista` (proximas o anteriores), `despues` (cursor) y `limite`.
+    """
+    usuario = usuario_actual()
+    if not usuario:
+        return jsonify({"error": "No autenticado."}), 401
+    if not DB_AVAILABLE:
+        return jsonify({"error": "La base de datos no está disponible."}), 503
+    try:
+        pagina, error = pagina_mis_reservas(usuario["id"], request.args)
+    except Exception as exc:
+        print("No se pudieron cargar las reservas del usuario:", exc)
+        return jsonify({"error": "No se pudo consultar las reservas."}), 503
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify(
+        {
+            "vista": pagina["vista"],
+            "siguiente": pagina["siguiente"],
+            "reservas": [
+                {
+                    "id": reserva["id"],
+                    "fecha": reserva["fecha_reserva"].strftime(FORMATO_FECHA),
+                    "dia": reserva["dia"],
+                    "hora_inicio": reserva["hora_inicio"],
+                    "hora_fin": reserva["hora_fin"],
+                    "duracion": reserva["duracion"],
+                    "cancha_id": reserva["cancha_id"],
+                }
+                for reserva in pagina["reservas"]
+            ],
+        }
+    )
+
+
+@app.route("/stream")
+def stream():
+    """Server-Sent Events con cada bloque reservado, para actualizar la página sin recargar.
+
+    Emite eventos `reserva` con fecha, hora_inicio, hora_fin, cancha_id y
+    estado. Si el cliente se quedó atrás y se perdieron eventos, envía
+    `resincronizar` para que vuelva a pedir la disponibilidad completa.
+    """
+    if not usuario_actual():
+        return jsonify({"error": "No autenticado."}), 401
+    try:
+        suscripcion = difusor_reservas.suscribir()
+    except eventos.DemasiadosClientesError:
+        return jsonify({"error": "Demasiados clientes conectados."}), 503
+
+    def generar():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                evento = suscripcion.siguiente(SSE_PING_SEGUNDOS)
+                if suscripcion.desfasada:
+                    suscripcion.desfasada = False
+                    yield eventos.formatear_sse({}, "resincronizar")
+                if evento is None:
+                    yield ": ping\n\n"
+                else:
+                    yield eventos.formatear_sse(evento, "reserva")
+        finally:
+            difusor_reservas.cancelar(suscripcion)
+
+    respuesta = Response(stream_with_context(generar()), mimetype="text/event-stream")
+    respuesta.headers["Cache-Control"] = "no-cache"
+    # Evita que un proxy (nginx) acumule los eventos antes de enviarlos.
+    respuesta.headers["X-Accel-Buffering"] = "no"
+    return respuesta
+
+
+## MÉTRICAS ######################################################
+
+# Si se define, /metrics exige la cabecera "Authorization: Bearer <token>".
+METRICAS_TOKEN = os.environ.get("METRICAS_TOKEN")
+
+metricas.registrar_colector("cache_disponibilidad", cache_disponibilidad.estadisticas)
+metricas.registrar_colector("cache_resumen", cache_resumen.estadisticas)
+metricas.registrar_colector("cache_analitica", cache_analitica.estadisticas)
+metricas.registrar_colector("sse", difusor_reservas.estadisticas)
+metricas.registrar_colector("hash", seguridad.estadisticas)
+
+
+@app.before_request
+def iniciar_metricas_peticion():
+    g.metricas_inicio = metricas.iniciar_peticion()
+
+
+@app.after_request
+def registrar_metricas_peticion(respuesta):
+    _terminar_metricas(respuesta.status_code)
+    return respuesta
+
+
+@app.teardown_request
+def registrar_metricas_error(exc):
+    # Sólo llega aquí sin pasar por after_request si la vista lanzó una excepción.
+    if exc is not None:
+        _terminar_metricas(500)
+
+
+def _terminar_metricas(estado):
+    inicio = g.pop("metricas_inicio", None)
+    if inicio is None:
+        return
+    ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+    metricas.terminar_peticion(inicio, ruta, request.method, estado)
+
+
+@app.route("/metrics")
+def metrics():
+    """Métricas en formato de texto de Prometheus."""
+    if METRICAS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICAS_TOKEN}":
+        return Response("No autorizado.\n", status=401, mimetype="text/plain")
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
 def usuario_actual():
     """Devuelve dict con usuario en sesión o None."""
     if not session.get("user_id"):
@@ -335,21 +931,22 @@ def login():
         return redirect(url_for("login"))
 
     password_db = user.get("password_hash")
-    password_ok = False
-
-    if password_db:
-        try:
-            password_ok = check_password_hash(password_db, password)
-        except ValueError:
-            password_ok = False
-
-    if not password_ok and password_db == password:
-        password_ok = True
+    try:
+        # La verificación corre en el pool acotado de `seguridad`.
+        password_ok, necesita_rehash = seguridad.verificar_password(password_db, password)
+    except seguridad.SobrecargaHashError:
+        flash("El servidor está ocupado, intenta nuevamente en unos segundos.", "warning")
+        return redirect(url_for("login"))
 
     if not password_ok:
         flash("Usuario o contraseña incorrectos.", "danger")
         return redirect(url_for("login"))
 
+    if necesita_rehash:
+        # Texto plano u hash con método/costo anterior: se actualiza en segundo plano.
+        user_id = user["id"]
+        seguridad.programar_rehash(password, lambda nuevo_hash: db.actualizar_password(user_id, nuevo_hash))
+
     # Guardar en sesión
     session["user_id"] = user["id"]
     session["username"] = user["username"]
@@ -396,7 +993,11 @@ def admin_register():
 
     dni_valor = dni or None
 
-    password_hash = generate_password_hash(password)
+    try:
+        password_hash = seguridad.generar_hash(password)
+    except seguridad.SobrecargaHashError:
+        flash("El servidor está ocupado, intenta nuevamente en unos segundos.", "warning")
+        return redirect(url_for("admin_register"))
     try:
         db.create_user(username, password_hash, role, nombres, apellidos, dni_valor)
     except Exception as e:
@@ -407,6 +1008,499 @@ def admin_register():
     return redirect(url_for("inicio"))
 
 
+@app.route("/admin/usuarios/importar", methods=["GET", "POST"])
+def admin_importar_usuarios():
+    """Crea usuarios en bloque a partir de un CSV y muestra el resultado por fila."""
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    if request.method == "GET":
+        return render_template("admin_importar.html", resultados=None, columnas=importacion.COLUMNAS_OBLIGATORIAS)
+
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible, no se pueden crear usuarios.", "danger")
+        return redirect(url_for("admin_importar_usuarios"))
+
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        flash("Selecciona un archivo CSV.", "warning")
+        return redirect(url_for("admin_importar_usuarios"))
+
+    try:
+        contenido = archivo.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        flash("El archivo debe estar codificado en UTF-8.", "danger")
+        return redirect(url_for("admin_importar_usuarios"))
+
+    try:
+        resultados, error = importacion.importar_usuarios(contenido, db)
+    except Exception as exc:
+        print("Error al importar usuarios:", exc)
+        flash("Error al guardar los usuarios en la base de datos; no se creó ninguno.", "danger")
+        return redirect(url_for("admin_importar_usuarios"))
+
+    if error:
+        flash(error, "danger")
+        return redirect(url_for("admin_importar_usuarios"))
+
+    creados = sum(1 for resultado in resultados if resultado["estado"] == "Creado")
+    flash(f"Se crearon {creados} de {len(resultados)} usuarios.", "success" if creados == len(resultados) else "warning")
+    return render_template("admin_importar.html", resultados=resultados, columnas=importacion.COLUMNAS_OBLIGATORIAS)
+
+
+@app.route("/admin/reservas/exportar")
+def admin_exportar_reservas():
+    """Descarga las reservas de un rango de fechas como CSV o XLSX.
+
+    Sin parámetros muestra el formulario. Las filas se leen por lotes y se
+    envían a medida que se generan, así el rango puede ser una temporada entera.
+    """
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    def mostrar_formulario():
+        return render_template(
+            "admin_exportar.html",
+            xlsx_disponible=exportacion.xlsx_disponible(),
+            valores=request.args,
+        )
+
+    if "desde" not in request.args:
+        return mostrar_formulario()
+
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible, no se pueden exportar reservas.", "danger")
+        return mostrar_formulario()
+
+    try:
+        fecha_desde = datetime.strptime(request.args.get("desde", ""), FORMATO_FECHA).date()
+        fecha_hasta = datetime.strptime(request.args.get("hasta", ""), FORMATO_FECHA).date()
+    except ValueError:
+        flash("Indica las fechas desde y hasta con formato AAAA-MM-DD.", "warning")
+        return mostrar_formulario()
+    if fecha_hasta < fecha_desde:
+        flash("La fecha hasta no puede ser anterior a la fecha desde.", "warning")
+        return mostrar_formulario()
+
+    formato = request.args.get("formato", "csv")
+    if formato not in exportacion.FORMATOS:
+        flash("Formato de exportación no válido.", "warning")
+        return mostrar_formulario()
+    if formato == "xlsx" and not exportacion.xlsx_disponible():
+        flash("La exportación a XLSX no está disponible en este servidor (falta openpyxl).", "warning")
+        return mostrar_formulario()
+
+    usuario_id = None
+    username = request.args.get("usuario", "").strip()
+    if username:
+        try:
+            usuario = db.get_user_by_username(username)
+        except Exception as exc:
+            print("Error al buscar usuario para exportar:", exc)
+            flash("Error al consultar la base de datos.", "danger")
+            return mostrar_formulario()
+        if not usuario:
+            flash(f"No existe el usuario {username}.", "warning")
+            return mostrar_formulario()
+        usuario_id = usuario["id"]
+
+    reservas = db.iterar_reservas_rango(fecha_desde, fecha_hasta, usuario_id=usuario_id)
+    generar = exportacion.generar_xlsx if formato == "xlsx" else exportacion.generar_csv
+    nombre_archivo = f"reservas_{fecha_desde.isoformat()}_{fecha_hasta.isoformat()}"
+    if username:
+        nombre_archivo += f"_{secure_filename(username) or usuario_id}"
+    return Response(
+        stream_with_context(generar(reservas)),
+        mimetype=exportacion.MIMETYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre_archivo}.{formato}"'},
+    )
+
+
+def pagina_admin_usuarios(args):
+    """Lee los prefijos `username` y `dni`, `despues` y `limite` y devuelve (pagina, error).
+
+    Se pide una fila de más para saber si hay otra página; el cursor
+    `siguiente` es el username de la última fila mostrada.
+    """
+    try:
+        limite = leer_limite(args, ADMIN_POR_PAGINA, ADMIN_MAX_PAGINA)
+    except ValueError as exc:
+        return None, str(exc)
+    username = args.get("username", "").strip()
+    dni = args.get("dni", "").strip()
+    usuarios = db.listar_usuarios(username or None, dni or None, args.get("despues") or None, limite + 1)
+    return {
+        "usuarios": usuarios[:limite],
+        "siguiente": usuarios[limite - 1]["username"] if len(usuarios) > limite else None,
+        "limite": limite,
+    }, None
+
+
+def pagina_admin_reservas(args, canchas):
+    """Lee los filtros del listado de reservas y devuelve (pagina, error).
+
+    Filtros opcionales: `desde` y `hasta` (AAAA-MM-DD), `usuario` (username
+    exacto) y `cancha`; `orden` es "recientes" (por defecto) o "antiguas".
+    La paginación es por clave como en "Mis reservas".
+    """
+    orden = args.get("orden") or ORDENES_ADMIN_RESERVAS[0]
+    if orden not in ORDENES_ADMIN_RESERVAS:
+        return None, "Orden no válido."
+    try:
+        limite = leer_limite(args, ADMIN_POR_PAGINA, ADMIN_MAX_PAGINA)
+    except ValueError as exc:
+        return None, str(exc)
+    try:
+        fecha_desde = datetime.strptime(args["desde"], FORMATO_FECHA).date() if args.get("desde") else None
+        fecha_hasta = datetime.strptime(args["hasta"], FORMATO_FECHA).date() if args.get("hasta") else None
+    except ValueError:
+        return None, "Indica las fechas desde y hasta con formato AAAA-MM-DD."
+    if fecha_desde and fecha_hasta and fecha_hasta < fecha_desde:
+        return None, "La fecha hasta no puede ser anterior a la fecha desde."
+
+    cancha_id = None
+    if args.get("cancha"):
+        try:
+            cancha_id = int(args["cancha"])
+        except ValueError:
+            cancha_id = None
+        if not any(cancha["id"] == cancha_id for cancha in canchas):
+            return None, "Cancha no válida."
+
+    despues = None
+    if args.get("despues"):
+        try:
+            despues = leer_cursor(args["despues"])
+        except ValueError:
+            return None, "Cursor de paginación inválido."
+
+    usuario_id = None
+    username = args.get("usuario", "").strip()
+    if username:
+        usuario = db.get_user_by_username(username)
+        if not usuario:
+            return None, f"No existe el usuario {username}."
+        usuario_id = usuario["id"]
+
+    reservas = db.listar_reservas(fecha_desde, fecha_hasta, usuario_id, cancha_id, despues, limite + 1,
+                                  descendente=orden == "recientes")
+    return {
+        "orden": orden,
+        "reservas": reservas[:limite],
+        "siguiente": cursor_reserva(reservas[limite - 1]) if len(reservas) > limite else None,
+        "limite": limite,
+    }, None
+
+
+def filtros_listado(args):
+    """Parámetros no vacíos del listado salvo el cursor, para repetirlos en los enlaces de página."""
+    return {clave: valor for clave, valor in args.items() if valor and clave != "despues"}
+
+
+@app.route("/admin/usuarios")
+def admin_usuarios():
+    """Listado de usuarios con búsqueda por prefijo de username o DNI, por páginas."""
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    pagina = None
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible.", "danger")
+    else:
+        try:
+            pagina, error = pagina_admin_usuarios(request.args)
+        except Exception as exc:
+            print("No se pudieron listar los usuarios:", exc)
+            flash("Error al consultar los usuarios.", "danger")
+        else:
+            if error:
+                flash(error, "warning")
+
+    return render_template(
+        "admin_usuarios.html",
+        pagina=pagina,
+        valores=request.args,
+        filtros=filtros_listado(request.args),
+        primera_pagina=not request.args.get("despues"),
+    )
+
+
+@app.route("/admin/reservas")
+def admin_reservas():
+    """Listado de todas las reservas con filtros por fechas, usuario y cancha, por páginas."""
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    canchas = obtener_canchas()
+    pagina = None
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible.", "danger")
+    else:
+        try:
+            pagina, error = pagina_admin_reservas(request.args, canchas)
+        except Exception as exc:
+            print("No se pudieron listar las reservas:", exc)
+            flash("Error al consultar las reservas.", "danger")
+        else:
+            if error:
+                flash(error, "warning")
+
+    return render_template(
+        "admin_reservas.html",
+        pagina=pagina,
+        valores=request.args,
+        filtros=filtros_listado(request.args),
+        primera_pagina=not request.args.get("despues"),
+        canchas=canchas,
+        nombres_canchas={cancha["id"]: cancha["nombre"] for cancha in canchas},
+    )
+
+
+def leer_bloqueo(form, canchas):
+    """Valida el formulario de bloqueo. Devuelve (datos, error).
+
+    Sin días marcados el bloqueo aplica todos los días; sin cancha, a todas.
+    """
+    try:
+        fecha_desde = datetime.strptime(form.get("desde", ""), FORMATO_FECHA).date()
+        fecha_hasta = datetime.strptime(form["hasta"], FORMATO_FECHA).date() if form.get("hasta") else fecha_desde
+    except ValueError:
+        return None, "Indica las fechas desde y hasta con formato AAAA-MM-DD."
+    if fecha_hasta < fecha_desde:
+        return None, "La fecha hasta no puede ser anterior a la fecha desde."
+    try:
+        inicio = horarios.a_minutos(form.get("hora_inicio", ""))
+        fin = horarios.a_minutos(form.get("hora_fin", ""))
+    except ValueError:
+        return None, "Indica las horas de inicio y fin con formato HH:MM."
+    if not 0 <= inicio < fin < 24 * horarios.MINUTOS_POR_HORA:
+        return None, "La hora de inicio debe ser anterior a la hora de fin."
+
+    nombres_dias = [dia for dia in form.getlist("dia") if dia]
+    if any(dia not in DIAS_SEMANA for dia in nombres_dias):
+        return None, "Día de la semana no válido."
+    dias_semana = sum(1 << DIAS_SEMANA.index(dia) for dia in set(nombres_dias)) or almacenamiento.TODOS_LOS_DIAS
+
+    cancha_id = None
+    if form.get("cancha_id"):
+        try:
+            cancha_id = int(form["cancha_id"])
+        except ValueError:
+            cancha_id = None
+        if not any(cancha["id"] == cancha_id for cancha in canchas):
+            return None, "Cancha no válida."
+
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "dias_semana": dias_semana,
+        "hora_inicio": horarios.a_texto(inicio),
+        "hora_fin": horarios.a_texto(fin),
+        "cancha_id": cancha_id,
+        "motivo": form.get("motivo", "").strip()[:200],
+    }, None
+
+
+def invalidar_ocupacion():
+    """Descarta la disponibilidad y los resúmenes en caché tras crear o quitar bloqueos."""
+    cache_disponibilidad.invalidar()
+    cache_resumen.invalidar()
+
+
+@app.route("/admin/bloqueos", methods=["GET", "POST"])
+def admin_bloqueos():
+    """Bloqueos de horarios (mantenimiento, torneos) sobre un rango de fechas.
+
+    Al crear un bloqueo se listan las reservas existentes que se cruzan con
+    él; no se cancelan automáticamente.
+    """
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    canchas = obtener_canchas()
+    conflictos = None
+    valores = {}
+
+    if request.method == "POST":
+        valores = request.form
+        datos, error = leer_bloqueo(request.form, canchas)
+        if error:
+            flash(error, "warning")
+        elif not DB_AVAILABLE:
+            flash("La base de datos no está disponible, no se pueden crear bloqueos.", "danger")
+        else:
+            try:
+                resultado = db.crear_bloqueo(creado_por=user.get("username") or "", **datos)
+            except Exception as exc:
+                print("Error al crear bloqueo:", exc)
+                flash("No se pudo guardar el bloqueo en la base de datos.", "danger")
+            else:
+                invalidar_ocupacion()
+                valores = {}
+                conflictos = resultado["conflictos"]
+                if conflictos:
+                    flash(
+                        f"Bloqueo creado. {len(conflictos)} reservas existentes se cruzan con él y no se cancelaron.",
+                        "warning",
+                    )
+                else:
+                    flash("Bloqueo creado sin conflictos con reservas existentes.", "success")
+
+    bloqueos = []
+    if DB_AVAILABLE:
+        try:
+            bloqueos = [
+                dict(bloqueo, dias=[dia for indice, dia in enumerate(DIAS_SEMANA) if bloqueo["dias_semana"] >> indice & 1])
+                for bloqueo in db.obtener_bloqueos(date.today())
+            ]
+        except Exception as exc:
+            print("No se pudieron cargar los bloqueos:", exc)
+            flash("Error al consultar los bloqueos.", "danger")
+
+    return render_template(
+        "admin_bloqueos.html",
+        bloqueos=bloqueos,
+        conflictos=conflictos,
+        valores=valores,
+        dias_marcados=valores.getlist("dia") if valores else [],
+        dias=DIAS_SEMANA,
+        canchas=canchas,
+        nombres_canchas={cancha["id"]: cancha["nombre"] for cancha in canchas},
+    )
+
+
+@app.route("/admin/bloqueos/eliminar", methods=["POST"])
+def admin_eliminar_bloqueos():
+    """Quita los bloqueos marcados con un solo DELETE."""
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    try:
+        ids = [int(valor) for valor in request.form.getlist("bloqueo_id")]
+    except ValueError:
+        ids = []
+    if not ids:
+        flash("Selecciona al menos un bloqueo.", "warning")
+        return redirect(url_for("admin_bloqueos"))
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible.", "danger")
+        return redirect(url_for("admin_bloqueos"))
+
+    try:
+        eliminados = db.eliminar_bloqueos(ids)
+    except Exception as exc:
+        print("Error al eliminar bloqueos:", exc)
+        flash("No se pudieron eliminar los bloqueos.", "danger")
+        return redirect(url_for("admin_bloqueos"))
+
+    invalidar_ocupacion()
+    flash(f"Se eliminaron {eliminados} bloqueos.", "success")
+    return redirect(url_for("admin_bloqueos"))
+
+
+def leer_rango_analitica():
+    """Rango pedido en `desde`/`hasta`; por defecto las últimas cuatro semanas.
+
+    Devuelve (fecha_desde, fecha_hasta, error).
+    """
+    hoy = date.today()
+    try:
+        fecha_desde = datetime.strptime(request.args["desde"], FORMATO_FECHA).date() if request.args.get("desde") \
+            else hoy - timedelta(days=27)
+        fecha_hasta = datetime.strptime(request.args["hasta"], FORMATO_FECHA).date() if request.args.get("hasta") \
+            else hoy
+    except ValueError:
+        return None, None, "Fechas inválidas, usa el formato AAAA-MM-DD."
+    if fecha_hasta < fecha_desde:
+        return None, None, "La fecha hasta no puede ser anterior a la fecha desde."
+    if (fecha_hasta - fecha_desde).days >= ANALITICA_MAX_DIAS:
+        return None, None, f"El rango no puede superar los {ANALITICA_MAX_DIAS} días."
+    return fecha_desde, fecha_hasta, None
+
+
+def obtener_resumen_ocupacion(fecha_desde, fecha_hasta):
+    """Resumen de `analitica.calcular_ocupacion` del rango, desde la caché si está."""
+    num_canchas = len(obtener_canchas())
+    return cache_analitica.obtener(
+        fecha_desde,
+        fecha_hasta,
+        (num_canchas, CALENDARIO.version),
+        lambda: analitica.calcular_ocupacion(
+            db.obtener_ocupacion_agregada(fecha_desde, fecha_hasta), fecha_desde, fecha_hasta, CALENDARIO, num_canchas
+        ),
+    )
+
+
+@app.route("/admin/analitica")
+def admin_analitica():
+    """Mapa de calor de ocupación por día y hora, y horas reservadas por usuario."""
+    user = usuario_actual()
+    if not user or user.get("role") != "admin":
+        flash("Acceso denegado. Solo administradores.", "danger")
+        return redirect(url_for("inicio"))
+
+    fecha_desde, fecha_hasta, error = leer_rango_analitica()
+    resumen = None
+    if error:
+        flash(error, "warning")
+    elif not DB_AVAILABLE:
+        flash("La base de datos no está disponible.", "danger")
+    else:
+        try:
+            resumen = obtener_resumen_ocupacion(fecha_desde, fecha_hasta)
+        except Exception as exc:
+            print("No se pudo calcular la ocupación:", exc)
+            flash("Error al consultar las reservas.", "danger")
+
+    return render_template(
+        "admin_analitica.html",
+        resumen=resumen,
+        dias=DIAS_SEMANA,
+        desde=request.args.get("desde") or (fecha_desde.strftime(FORMATO_FECHA) if fecha_desde else ""),
+        hasta=request.args.get("hasta") or (fecha_hasta.strftime(FORMATO_FECHA) if fecha_hasta else ""),
+    )
+
+
+@app.route("/api/analitica")
+def api_analitica():
+    """Los mismos datos de `/admin/analitica` en JSON."""
+    user = usuario_actual()
+    if not user:
+        return jsonify({"error": "No autenticado."}), 401
+    if user.get("role") != "admin":
+        return jsonify({"error": "Solo administradores."}), 403
+
+    fecha_desde, fecha_hasta, error = leer_rango_analitica()
+    if error:
+        return jsonify({"error": error}), 400
+    if not DB_AVAILABLE:
+        return jsonify({"error": "La base de datos no está disponible."}), 503
+    try:
+        resumen = obtener_resumen_ocupacion(fecha_desde, fecha_hasta)
+    except Exception as exc:
+        print("No se pudo calcular la ocupación:", exc)
+        return jsonify({"error": "No se pudo consultar las reservas."}), 503
+
+    datos = dict(resumen)
+    datos["fecha_inicio"] = fecha_desde.strftime(FORMATO_FECHA)
+    datos["fecha_fin"] = fecha_hasta.strftime(FORMATO_FECHA)
+    datos["dias"] = DIAS_SEMANA
+    datos["picos"] = [dict(pico, dia=DIAS_SEMANA[pico["dia"]]) for pico in resumen["picos"]]
+    return jsonify(datos)
+
+
 @app.route("/reservar", methods=["GET", "POST"])
 def reservar():
     """Permite crear una nueva reserva y valida solapamientos."""
@@ -430,8 +1524,8 @@ def reservar():
             duracion = int(duracion_param) if duracion_param else 1
         except (ValueError, TypeError):
             duracion = 1
-        if duracion not in (1, 2, 3):
-            duracion = 1
+        if duracion not in DURACIONES:
+            duracion = DURACIONES[0]
 
         if fecha_param:
             try:
@@ -441,12 +1535,20 @@ def reservar():
         else:
             fecha_reserva = date.today()
 
+        canchas = obtener_canchas()
+        cancha_id = leer_cancha(request.args.get("cancha"), canchas)
+
         horas_disponibles = []
         if dia in DIAS_SEMANA:
-            horas_disponibles = construir_horas_inicio_fin(dia, duracion, fecha_reserva)
+            horas_disponibles = construir_horas_inicio_fin(dia, duracion, fecha_reserva, cancha_id)
 
         dia = obtener_dia_desde_fecha(fecha_reserva)
-        form_data = {"dia": dia, "duracion": duracion, "fecha": fecha_reserva.strftime(FORMATO_FECHA)}
+        form_data = {
+            "dia": dia,
+            "duracion": duracion,
+            "fecha": fecha_reserva.strftime(FORMATO_FECHA),
+            "cancha_id": cancha_id,
+        }
         return render_template(
             "reservar.html",
             dias=DIAS_SEMANA,
@@ -455,6 +1557,9 @@ def reservar():
             usuario=user,
             nombre_usuario=nombre_usuario,
             fecha_reserva=fecha_reserva.strftime(FORMATO_FECHA),
+            canchas=canchas,
+            duraciones=DURACIONES,
+            horario_dia=describir_horario(CALENDARIO.tabla(fecha_reserva)),
         )
 
     if request.method == "POST":
@@ -484,21 +1589,28 @@ def reservar():
             flash("Selecciona un día válido de lunes a viernes.", "warning")
             return redirect(url_for("inicio", fecha=fecha_texto or date.today().strftime(FORMATO_FECHA)))
 
-        # Leer duración enviada por el formulario (por seguridad limitar a 1-3)
+        # Leer duración enviada por el formulario (sólo las permitidas por el calendario)
         duracion_raw = request.form.get("duracion", "1")
         try:
             duracion = int(duracion_raw)
         except (ValueError, TypeError):
             duracion = 1
 
-        if duracion not in (1, 2, 3):
-            duracion = 1
+        if duracion not in DURACIONES:
+            duracion = DURACIONES[0]
+
+        cancha_id = leer_cancha(request.form.get("cancha_id"), obtener_canchas())
+        tabla_dia = CALENDARIO.tabla(fecha_reserva)
+        if not len(tabla_dia):
+            session["form_data"] = request.form.to_dict()
+            flash("La cancha está cerrada en la fecha elegida.", "warning")
+            return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
-        horas_libres = obtener_horas_libres(dia, duracion, fecha_reserva)
+        horas_libres = obtener_horas_libres(dia, duracion, fecha_reserva, cancha_id)
 
-        if hora_inicio not in HORAS_DISPONIBLES:
+        if tabla_dia.indice(hora_inicio) is None:
             session["form_data"] = request.form.to_dict()
-            flash("Selecciona una hora válida en punto.", "warning")
+            flash("Selecciona una hora de inicio válida.", "warning")
             return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
         if hora_inicio not in horas_libres:
@@ -506,65 +1618,64 @@ def reservar():
             flash("El bloque elegido no está completamente disponible para la duración seleccionada.", "danger")
             return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
-        # Convertimos los horarios a objetos datetime.time para compararlos.
-        formato_hora = "%H:%M"
-        inicio_dt_full = datetime.strptime(hora_inicio, formato_hora)
-        inicio_dt = inicio_dt_full.time()
-        fin_dt_full = inicio_dt_full + timedelta(hours=duracion)
-        fin_dt = fin_dt_full.time()
-        hora_fin = fin_dt_full.strftime(formato_hora)
-
-        # comprobar que no exceda horario de cierre (22:00)
-        cierre = datetime.strptime(HORAS_DISPONIBLES[-1], formato_hora) + timedelta(hours=1)
-        if fin_dt_full > cierre:
+        # Calculamos la hora de fin (en minutos) según la duración elegida.
+        fin_minutos = horarios.fin_de(hora_inicio, duracion)
+        hora_fin = horarios.a_texto(fin_minutos)
+
+        # comprobar que no exceda el horario de cierre de la fecha
+        if fin_minutos > tabla_dia.cierre:
             session["form_data"] = request.form.to_dict()
-            flash(f"La reserva excede el horario de cierre ({cierre.strftime(formato_hora)}).", "danger")
+            flash(f"La reserva excede el horario de cierre ({horarios.a_texto(tabla_dia.cierre)}).", "danger")
             return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
-        # Buscamos si ya existe una reserva que se cruza con el horario indicado.
-        reservas_existentes = []
-        if DB_AVAILABLE:
-            try:
-                reservas_existentes = db.obtener_reservas(fecha_reserva)
-            except Exception as exc:
-                print("No se pudieron obtener reservas para la validación:", exc)
+        if not DB_AVAILABLE:
+            flash("La base de datos no está disponible, no se puede persistir la reserva.", "danger")
+            return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
-        for reserva in reservas_existentes:
-            if reserva["dia"] == dia:
-                if horarios_se_cruzan(inicio_dt, fin_dt, reserva["inicio"], reserva["fin"]):
-                    flash(
-                        f"El intervalo elegido se cruza con la reserva de {reserva['nombre']} ("
-                        f"{reserva['hora_inicio']} - {reserva['hora_fin']}).",
-                        "danger",
-                    )
-                    session["form_data"] = request.form.to_dict()
-                    return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
+        # La comprobación de solapamiento y la inserción se hacen en una sola
+        # transacción en la base de datos, así dos envíos simultáneos no pueden
+        # quedarse con el mismo bloque.
+        try:
+            resultado = db.reservar_si_libre(
+                usuario_id=user.get("id"),
+                usuario_username=user.get("username"),
+                nombre_mostrado=nombre_usuario,
+                fecha_reserva=fecha_reserva,
+                dia=dia,
+                hora_inicio=hora_inicio,
+                hora_fin=hora_fin,
+                duracion_horas=duracion,
+                cancha_id=cancha_id,
+            )
+        except Exception as exc:
+            session["form_data"] = request.form.to_dict()
+            flash("No se pudo guardar la reserva en la base de datos.", "danger")
+            print("Error al crear reserva:", exc)
+            return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
-        # Si todo está correcto, guardamos la nueva reserva en memoria.
-        if DB_AVAILABLE:
-            try:
-                db.crear_reserva(
-                    usuario_id=user.get("id"),
-                    usuario_username=user.get("username"),
-                    nombre_mostrado=nombre_usuario,
-                    fecha_reserva=fecha_reserva,
-                    dia=dia,
-                    hora_inicio=hora_inicio,
-                    hora_fin=hora_fin,
-                    duracion_horas=duracion,
+        if not resultado["creada"]:
+            conflicto = resultado["conflicto"]
+            # La caché estaba desactualizada (p. ej. reserva hecha desde otra instancia).
+            cache_disponibilidad.invalidar(fecha_reserva)
+            cache_resumen.invalidar_semana(fragmentos.semana_iso(fecha_reserva))
+            if conflicto["es_bloqueo"]:
+                flash(
+                    f"El intervalo elegido no está disponible ({conflicto['nombre']}, "
+                    f"{conflicto['hora_inicio']} - {conflicto['hora_fin']}).",
+                    "danger",
                 )
-            except Exception as exc:
-                session["form_data"] = request.form.to_dict()
-                flash("No se pudo guardar la reserva en la base de datos.", "danger")
-                print("Error al crear reserva:", exc)
-                return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
-        else:
-            flash("La base de datos no está disponible, no se puede persistir la reserva.", "danger")
+            else:
+                flash(
+                    f"El intervalo elegido se cruza con la reserva de {conflicto['nombre']} ("
+                    f"{conflicto['hora_inicio']} - {conflicto['hora_fin']}).",
+                    "danger",
+                )
+            session["form_data"] = request.form.to_dict()
             return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
 
         session.pop("form_data", None)
         flash("Reserva creada con éxito.", "success")
-        return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA)))
+        return redirect(url_for("inicio", dia=dia, fecha=fecha_reserva.strftime(FORMATO_FECHA), cancha=cancha_id))
 
     return render_template(
         "reservar.html",
@@ -573,21 +1684,175 @@ def reservar():
         usuario=user,
         nombre_usuario=nombre_usuario,
         fecha_reserva=date.today().strftime(FORMATO_FECHA),
+        duraciones=DURACIONES,
+        horario_dia=describir_horario(CALENDARIO.tabla(date.today())),
     )
 
 
 
 
+# Límite de semanas para una reserva recurrente (una temporada).
+MAX_SEMANAS_RECURRENTES = 52
+
+
+def generar_fechas_recurrentes(dia, fecha_desde, semanas=None, fecha_hasta=None):
+    """Fechas que caen en `dia` a partir de `fecha_desde`.
+
+    Se detiene tras `semanas` ocurrencias o al pasar `fecha_hasta` (lo que
+    ocurra primero), con un máximo de `MAX_SEMANAS_RECURRENTES`.
+    """
+    indice = DIAS_SEMANA.index(dia)
+    fecha = fecha_desde + timedelta(days=(indice - fecha_desde.weekday()) % 7)
+    limite = min(semanas or MAX_SEMANAS_RECURRENTES, MAX_SEMANAS_RECURRENTES)
+    fechas = []
+    while len(fechas) < limite and (fecha_hasta is None or fecha <= fecha_hasta):
+        fechas.append(fecha)
+        fecha += timedelta(weeks=1)
+    return fechas
+
+
+@app.route("/reservar/recurrente", methods=["GET", "POST"])
+def reservar_recurrente():
+    """Reserva el mismo horario cada semana durante varias semanas."""
+    user = usuario_actual()
+    if not user:
+        flash("Debes iniciar sesión para reservar.", "warning")
+        return redirect(url_for("login"))
+
+    nombre_usuario = obtener_nombre_usuario(user)
+    canchas = obtener_canchas()
+    form_data = {
+        "dia": obtener_dia_actual(),
+        "fecha_desde": date.today().strftime(FORMATO_FECHA),
+        "semanas": 4,
+        "duracion": DURACIONES[0],
+        "cancha_id": canchas[0]["id"],
+    }
+
+    def responder(resultados=None):
+        return render_template(
+            "reservar_recurrente.html",
+            dias=DIAS_SEMANA,
+            horas=HORAS_DISPONIBLES,
+            canchas=canchas,
+            form_data=form_data,
+            resultados=resultados,
+            duraciones=DURACIONES,
+            max_semanas=MAX_SEMANAS_RECURRENTES,
+            usuario=user,
+            nombre_usuario=nombre_usuario,
+        )
+
+    if request.method == "GET":
+        return responder()
+
+    form_data.update(request.form.to_dict())
+    dia = request.form.get("dia")
+    hora_inicio = request.form.get("hora_inicio")
+    cancha_id = leer_cancha(request.form.get("cancha_id"), canchas)
+    form_data["cancha_id"] = cancha_id
+
+    if dia not in DIAS_SEMANA or hora_inicio not in HORAS_DISPONIBLES:
+        flash("Selecciona un día y una hora válidos.", "warning")
+        return responder()
+
+    try:
+        duracion = int(request.form.get("duracion", "1"))
+    except (ValueError, TypeError):
+        duracion = 1
+    if duracion not in DURACIONES:
+        duracion = DURACIONES[0]
+
+    try:
+        fecha_desde = datetime.strptime(request.form.get("fecha_desde", ""), FORMATO_FECHA).date()
+        fecha_hasta_texto = request.form.get("fecha_hasta")
+        fecha_hasta = datetime.strptime(fecha_hasta_texto, FORMATO_FECHA).date() if fecha_hasta_texto else None
+        semanas_texto = request.form.get("semanas")
+        semanas = int(semanas_texto) if semanas_texto else None
+    except (ValueError, TypeError):
+        flash("Revisa las fechas y el número de semanas.", "warning")
+        return responder()
+
+    if not semanas and not fecha_hasta:
+        flash("Indica el número de semanas o la fecha final.", "warning")
+        return responder()
+
+    fin_minutos = horarios.fin_de(hora_inicio, duracion)
+    hora_fin = horarios.a_texto(fin_minutos)
+
+    fechas = generar_fechas_recurrentes(dia, fecha_desde, semanas, fecha_hasta)
+    if not fechas:
+        flash("El rango indicado no contiene ninguna fecha para ese día.", "warning")
+        return responder()
+
+    # Las fechas en que el horario elegido cae fuera del horario de apertura
+    # (feriados, horarios especiales) se informan sin intentar reservarlas.
+    cerradas = [
+        fecha for fecha in fechas
+        if CALENDARIO.tabla(fecha).indice(hora_inicio) is None or fin_minutos > CALENDARIO.tabla(fecha).cierre
+    ]
+    fechas = [fecha for fecha in fechas if fecha not in cerradas]
+    resultados_cerradas = [{"fecha": fecha, "creada": False, "conflicto": None, "cerrada": True} for fecha in cerradas]
+    if not fechas:
+        flash("El horario elegido queda fuera del horario de apertura en todas las fechas.", "warning")
+        return responder(resultados_cerradas)
+
+    if not DB_AVAILABLE:
+        flash("La base de datos no está disponible, no se puede persistir la reserva.", "danger")
+        return responder()
+
+    pedidas = [
+        {
+            "usuario_id": user.get("id"),
+            "usuario_username": user.get("username"),
+            "nombre_mostrado": nombre_usuario,
+            "fecha_reserva": fecha,
+            "dia": dia,
+            "hora_inicio": hora_inicio,
+            "hora_fin": hora_fin,
+            "duracion_horas": duracion,
+        }
+        for fecha in fechas
+    ]
+    try:
+        resultado = db.crear_reservas_lote(pedidas, cancha_id)
+    except Exception as exc:
+        flash("No se pudieron guardar las reservas en la base de datos.", "danger")
+        print("Error al crear reservas recurrentes:", exc)
+        return responder()
+
+    resultados = [
+        {"fecha": reserva["fecha_reserva"], "creada": True, "conflicto": None}
+        for reserva in resultado["creadas"]
+    ] + [
+        {"fecha": pedida["fecha_reserva"], "creada": False, "conflicto": conflicto}
+        for pedida, conflicto in resultado["conflictos"]
+    ] + resultados_cerradas
+    resultados.sort(key=lambda r: r["fecha"])
+
+    if resultado["conflictos"] or cerradas:
+        flash(
+            f"Se crearon {len(resultado['creadas'])} de {len(pedidas) + len(cerradas)} reservas; "
+            f"{len(resultado['conflictos'])} fechas tienen conflictos y {len(cerradas)} quedan fuera del horario.",
+            "warning",
+        )
+    else:
+        flash(f"Se crearon {len(resultado['creadas'])} reservas.", "success")
+    return responder(resultados)
+
+
 # Vista detallada eliminada: la ruta /consultar ya no existe
 
 
 if __name__ == "__main__":
     # Ejecuta la aplicación en modo debug para desarrollo local.
     # Si existe la variable de entorno para SQL Server, intentamos inicializar tablas.
-    if os.environ.get('MSSQL_CONN'):
+    if DB_AVAILABLE and db.EMBEBIDO:
+        print(f"Usando el backend embebido '{almacenamiento.BACKEND}'.")
+    elif os.environ.get('MSSQL_CONN'):
         try:
-            db.init_db()
-            print('Inicializada la base de datos (users).')
+            version = db.init_db()
+            print(f'Esquema de la base de datos en la versión {version}.')
         except Exception as e:
             print('No se pudo inicializar la base de datos:', e)
     else:
@@ -0,0 +1,233 @@
+"""Benchmark de carga y latencia de los flujos principales de reserva.
+
+Siembra usuarios y reservas en un backend local (`memoria` o `sqlite`), recorre
+`GET /`, `GET /reservar`, `POST /reservar` y `POST /login` con el cliente de
+pruebas de Flask y reporta, por ruta, p50/p95/p99 de latencia, throughput y
+consultas al backend por petición. Cada ruta se mide primero con un solo
+cliente (latencia sin contención) y luego con varios clientes concurrentes.
+
+Uso:
+    python benchmarks/bench_carga.py [--backend memoria] [--usuarios 200]
+        [--reservas 8000] [--peticiones 400] [--clientes 8] [--semilla 42]
+
+Los resultados son reproducibles con la misma semilla y los mismos parámetros.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+PASSWORD = "clave-de-prueba"
+
+
+def configurar_entorno(args):
+    """Variables que los módulos de la aplicación leen al importarse."""
+    os.environ["DB_BACKEND"] = args.backend
+    if args.backend == "sqlite":
+        os.environ["DB_SQLITE_RUTA"] = os.path.join(tempfile.mkdtemp(prefix="bench_carga_"), "reservas.db")
+    # El costo de scrypt dominaría todas las cifras de /login; se mide aparte con --hash-metodo.
+    os.environ.setdefault("HASH_METODO", args.hash_metodo)
+
+
+def sembrar(app, args, rng):
+    """Crea usuarios y reservas sin solapamientos repartidas alrededor de hoy."""
+    db = app.db
+    password_hash = app.seguridad.generar_hash(PASSWORD)
+    usuarios = [
+        {"username": f"user{i:05d}", "password_hash": password_hash, "nombres": f"Nombre{i}",
+         "apellidos": "Prueba", "dni": None, "role": "client"}
+        for i in range(args.usuarios)
+    ]
+    db.crear_usuarios_lote(usuarios)
+    ids = [db.get_user_by_username(u["username"])["id"] for u in usuarios]
+
+    horas = app.HORAS_DISPONIBLES
+    primer_dia = date.today() - timedelta(days=args.dias // 2)
+    pedidas = []
+    intentos = 0
+    ocupados = set()
+    while len(pedidas) < args.reservas and intentos < args.reservas * 4:
+        intentos += 1
+        fecha = primer_dia + timedelta(days=rng.randrange(args.dias))
+        indice = rng.randrange(len(horas))
+        if (fecha, indice) in ocupados:
+            continue
+        ocupados.add((fecha, indice))
+        usuario = rng.randrange(len(ids))
+        pedidas.append(
+            {
+                "usuario_id": ids[usuario],
+                "usuario_username": usuarios[usuario]["username"],
+                "nombre_mostrado": f"Nombre{usuario} Prueba",
+                "fecha_reserva": fecha,
+                "dia": app.obtener_dia_desde_fecha(fecha),
+                "hora_inicio": horas[indice],
+                "hora_fin": app.horarios.a_texto(app.horarios.fin_de(horas[indice], 1)),
+                "duracion_horas": 1,
+            }
+        )
+    creadas = 0
+    for inicio in range(0, len(pedidas), 1000):
+        creadas += len(db.crear_reservas_lote(pedidas[inicio:inicio + 1000])["creadas"])
+    return ids, creadas
+
+
+class ContadorConsultas:
+    """Envuelve las operaciones del backend y cuenta las llamadas del hilo actual."""
+
+    def __init__(self, db, operaciones):
+        self._local = threading.local()
+        for nombre in operaciones:
+            if nombre in ("init_db", "registrar_oyente_reserva"):
+                continue
+            setattr(db, nombre, self._envolver(getattr(db, nombre)))
+
+    def _envolver(self, funcion):
+        def envuelta(*args, **kwargs):
+            # Una operación que llama a otra del backend cuenta una sola vez.
+            if getattr(self._local, "dentro", False):
+                return funcion(*args, **kwargs)
+            self._local.cuenta = getattr(self._local, "cuenta", 0) + 1
+            self._local.dentro = True
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                self._local.dentro = False
+        return envuelta
+
+    def reiniciar(self):
+        self._local.cuenta = 0
+
+    def leer(self):
+        return getattr(self._local, "cuenta", 0)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def construir_escenarios(app, ids, args, rng):
+    hoy = date.today()
+    horas = app.HORAS_DISPONIBLES
+
+    def fecha_aleatoria():
+        return (hoy + timedelta(days=rng.randrange(-args.dias // 2, args.dias // 2))).isoformat()
+
+    def get_inicio(cliente):
+        return cliente.get(f"/?fecha={fecha_aleatoria()}")
+
+    def get_reservar(cliente):
+        return cliente.get(f"/reservar?fecha={fecha_aleatoria()}&duracion={rng.choice((1, 2))}")
+
+    def post_reservar(cliente):
+        return cliente.post(
+            "/reservar",
+            data={"dia": "Lunes", "fecha": fecha_aleatoria(), "hora_inicio": rng.choice(horas), "duracion": "1"},
+        )
+
+    def post_login(cliente):
+        return cliente.post("/login", data={"username": f"user{rng.randrange(len(ids)):05d}", "password": PASSWORD})
+
+    return [
+        ("GET /", get_inicio, True),
+        ("GET /reservar", get_reservar, True),
+        ("POST /reservar", post_reservar, True),
+        ("POST /login", post_login, False),
+    ]
+
+
+def nuevo_cliente(app, ids, con_sesion):
+    cliente = app.app.test_client()
+    if con_sesion:
+        with cliente.session_transaction() as sesion:
+            sesion["user_id"] = ids[0]
+            sesion["username"] = "user00000"
+            sesion["role"] = "client"
+            sesion["nombres"] = "Nombre0"
+            sesion["apellidos"] = "Prueba"
+    return cliente
+
+
+def medir(app, ids, contador, accion, con_sesion, peticiones, clientes):
+    """Ejecuta `peticiones` llamadas con `clientes` hilos; devuelve métricas."""
+    locales = threading.local()
+    latencias = []
+    consultas = []
+    errores = []
+    lock = threading.Lock()
+
+    def una(_):
+        if not hasattr(locales, "cliente"):
+            locales.cliente = nuevo_cliente(app, ids, con_sesion)
+        contador.reiniciar()
+        inicio = time.perf_counter()
+        respuesta = accion(locales.cliente)
+        duracion = (time.perf_counter() - inicio) * 1000
+        with lock:
+            latencias.append(duracion)
+            consultas.append(contador.leer())
+            if respuesta.status_code >= 400:
+                errores.append(respuesta.status_code)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as executor:
+        list(executor.map(una, range(peticiones)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "p50": percentil(latencias, 50),
+        "p95": percentil(latencias, 95),
+        "p99": percentil(latencias, 99),
+        "throughput": peticiones / total,
+        "consultas": sum(consultas) / len(consultas),
+        "errores": len(errores),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("memoria", "sqlite"), default="memoria")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--reservas", type=int, default=8000)
+    parser.add_argument("--dias", type=int, default=730, help="días alrededor de hoy donde se reparten las reservas")
+    parser.add_argument("--peticiones", type=int, default=400, help="peticiones por ruta y modo")
+    parser.add_argument("--clientes", type=int, default=8, help="clientes concurrentes")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--hash-metodo", default="pbkdf2:sha256:1000",
+                        help="método de hash para los usuarios sembrados (HASH_METODO)")
+    args = parser.parse_args()
+
+    configurar_entorno(args)
+    import almacenamiento
+    import app
+
+    rng = random.Random(args.semilla)
+    inicio = time.perf_counter()
+    ids, creadas = sembrar(app, args, rng)
+    print(f"Backend {args.backend}: {len(ids)} usuarios y {creadas} reservas sembradas "
+          f"en {time.perf_counter() - inicio:.1f} s")
+
+    contador = ContadorConsultas(app.db, almacenamiento.OPERACIONES)
+    print(f"{'ruta':16s} {'modo':13s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} "
+          f"{'pet/s':>8s} {'consultas':>9s} {'errores':>7s}")
+    for nombre, accion, con_sesion in construir_escenarios(app, ids, args, rng):
+        for modo, clientes in (("1 cliente", 1), (f"{args.clientes} clientes", args.clientes)):
+            app.cache_disponibilidad.invalidar()
+            m = medir(app, ids, contador, accion, con_sesion, args.peticiones, clientes)
+            print(f"{nombre:16s} {modo:13s} {m['p50']:8.2f} {m['p95']:8.2f} {m['p99']:8.2f} "
+                  f"{m['throughput']:8.1f} {m['consultas']:9.2f} {m['errores']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Memoria y tiempo de construir filas de reserva: dict anterior vs `almacenamiento.Reserva`.
+
+Mide con `tracemalloc` 100.000 filas (configurable) construidas desde tuplas
+como las que devuelve el driver, y luego recorre la misma cantidad desde
+SQLite con `iterar_reservas_rango` (lotes con `fetchmany`) frente a cargar
+la lista completa con `obtener_reservas_rango`.
+
+Uso:
+    python benchmarks/bench_filas.py [--filas 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, time as hora, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def fila_a_dict(row):
+    """Conversión anterior: dict de 12 claves con las horas ya formateadas."""
+    fecha_reserva = row[4]
+    hora_inicio = row[6]
+    hora_fin = row[7]
+    return {
+        "id": row[0],
+        "usuario_id": row[1],
+        "usuario_username": row[2],
+        "nombre": row[3],
+        "fecha_reserva": fecha_reserva,
+        "dia": row[5],
+        "inicio": hora_inicio,
+        "fin": hora_fin,
+        "hora_inicio": hora_inicio.strftime("%H:%M"),
+        "hora_fin": hora_fin.strftime("%H:%M"),
+        "duracion": row[8],
+        "cancha_id": row[9],
+    }
+
+
+def generar_filas(cantidad):
+    base = date(2025, 1, 1)
+    horas = [hora(h) for h in range(6, 23)]
+    usuarios = [(i, f"user{i:05d}", f"Nombre{i} Apellido") for i in range(500)]
+    filas = []
+    for i in range(cantidad):
+        usuario = usuarios[i % len(usuarios)]
+        fecha = base + timedelta(days=i // 16)
+        filas.append((i + 1, usuario[0], usuario[1], usuario[2], fecha, "Lunes",
+                      horas[i % 16], horas[i % 16 + 1], 1, 1))
+    return filas
+
+
+def medir(convertir, filas):
+    """Memoria retenida por la lista convertida y tiempo (medido sin tracemalloc)."""
+    inicio = time.perf_counter()
+    resultado = [convertir(row) for row in filas]
+    duracion = time.perf_counter() - inicio
+    del resultado
+    tracemalloc.start()
+    resultado = [convertir(row) for row in filas]
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resultado
+    return actual, duracion
+
+
+def medir_pico(funcion):
+    """Pico de memoria durante `funcion()` y tiempo (medido sin tracemalloc)."""
+    inicio = time.perf_counter()
+    funcion()
+    duracion = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico, duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100000)
+    args = parser.parse_args()
+
+    os.environ["DB_SQLITE_RUTA"] = os.path.join(tempfile.mkdtemp(prefix="bench_filas_"), "reservas.db")
+    import almacenamiento
+    import db_sqlite
+
+    filas = generar_filas(args.filas)
+    print(f"{args.filas} filas construidas desde tuplas del driver:")
+    for nombre, convertir in (("dict anterior", fila_a_dict), ("Reserva", almacenamiento.fila_a_reserva)):
+        memoria, duracion = medir(convertir, filas)
+        print(f"  {nombre:14s} {memoria / 1024 / 1024:7.1f} MB  {duracion * 1000:7.1f} ms")
+
+    db_sqlite.init_db()
+    with db_sqlite.conexion() as conn:
+        conn.execute("INSERT INTO users (username, password, role) VALUES ('bench', 'x', 'client')")
+        conn.executemany(
+            "INSERT INTO reservas (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,"
+            " hora_inicio, hora_fin, duracion_horas, cancha_id) VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f[2], f[3], f[4].isoformat(), f[5], f[6].strftime("%H:%M"), f[7].strftime("%H:%M"), f[8], f[9])
+             for f in filas],
+        )
+
+    def recorrer_lista():
+        for _ in db_sqlite.obtener_reservas_rango():
+            pass
+
+    def recorrer_lotes():
+        for _ in db_sqlite.iterar_reservas_rango():
+            pass
+
+    print(f"Recorrer {args.filas} reservas desde SQLite (pico de memoria):")
+    for nombre, funcion in (("lista completa", recorrer_lista), ("fetchmany", recorrer_lotes)):
+        pico, duracion = medir_pico(funcion)
+        print(f"  {nombre:14s} {pico / 1024 / 1024:7.1f} MB  {duracion * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
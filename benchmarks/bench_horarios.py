@@ -0,0 +1,122 @@
+"""Micro-benchmark del cálculo de bloques horarios.
+
+Compara la implementación anterior basada en `strptime`/`strftime` con el
+modelo de minutos de `horarios.py`, para el trabajo que hace una petición
+típica: segmentos del día, horas libres y horas inicio/fin para 1-3 horas.
+
+Uso:
+    python benchmarks/bench_horarios.py [repeticiones]
+"""
+import os
+import sys
+import timeit
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+FORMATO = "%H:%M"
+HORAS = app.HORAS_DISPONIBLES
+FECHA = date(2025, 3, 10)
+RESERVAS = [
+    {"fecha_reserva": FECHA, "inicio": time(8), "fin": time(10), "hora_inicio": "08:00", "hora_fin": "10:00"},
+    {"fecha_reserva": FECHA, "inicio": time(13), "fin": time(14), "hora_inicio": "13:00", "hora_fin": "14:00"},
+    {"fecha_reserva": FECHA, "inicio": time(18), "fin": time(21), "hora_inicio": "18:00", "hora_fin": "21:00"},
+]
+
+
+def _segmentos_anterior(reservas_dia):
+    segmentos = []
+    for hora_inicio_str in HORAS:
+        hora_actual = datetime.strptime(hora_inicio_str, FORMATO)
+        siguiente_hora = hora_actual + timedelta(hours=1)
+        reserva_segmento = next(
+            (
+                r for r in reservas_dia
+                if hora_actual.time() < r["fin"] and siguiente_hora.time() > r["inicio"]
+            ),
+            None,
+        )
+        segmentos.append({
+            "hora_inicio": hora_actual.strftime(FORMATO),
+            "hora_fin": siguiente_hora.strftime(FORMATO),
+            "estado": "Reservado" if reserva_segmento else "Disponible",
+            "reserva": reserva_segmento,
+        })
+    return segmentos
+
+
+def _horas_libres_anterior(reservas_fecha, duracion):
+    horas_ocupadas = set()
+    for reserva in reservas_fecha:
+        curr = datetime.strptime(reserva["hora_inicio"], FORMATO)
+        fin_dt = datetime.strptime(reserva["hora_fin"], FORMATO)
+        while curr < fin_dt:
+            horas_ocupadas.add(curr.strftime(FORMATO))
+            curr += timedelta(hours=1)
+    horas_validas = []
+    for hora in HORAS:
+        inicio_dt = datetime.strptime(hora, FORMATO)
+        fin_dt = inicio_dt + timedelta(hours=duracion)
+        cierre = datetime.strptime(HORAS[-1], FORMATO) + timedelta(hours=1)
+        if fin_dt > cierre:
+            continue
+        curr = inicio_dt
+        disponible = True
+        while curr < fin_dt:
+            if curr.strftime(FORMATO) in horas_ocupadas:
+                disponible = False
+                break
+            curr += timedelta(hours=1)
+        if disponible:
+            horas_validas.append(hora)
+    return horas_validas
+
+
+def _inicio_fin_anterior(reservas_fecha, duracion):
+    result = []
+    for hora in _horas_libres_anterior(reservas_fecha, duracion):
+        inicio_dt = datetime.strptime(hora, FORMATO)
+        fin_dt = inicio_dt + timedelta(hours=duracion)
+        result.append({"hora_inicio": inicio_dt.strftime(FORMATO), "hora_fin": fin_dt.strftime(FORMATO)})
+    return result
+
+
+def peticion_anterior():
+    _segmentos_anterior(RESERVAS)
+    for duracion in (1, 2, 3):
+        _inicio_fin_anterior(RESERVAS, duracion)
+
+
+def peticion_minutos():
+    tabla = app.CALENDARIO.tabla(FECHA)
+    app.generar_segmentos_horarios(RESERVAS, tabla)
+    cache = app.cache_disponibilidad
+    mascara = cache.mascara_de(RESERVAS, tabla)
+    for duracion in (1, 2, 3):
+        [
+            {"hora_inicio": hora, "hora_fin": app.horarios.a_texto(app.horarios.fin_de(hora, duracion))}
+            for hora in cache.horas_libres_desde_mascara(mascara, duracion, tabla)
+        ]
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tabla = app.CALENDARIO.tabla(FECHA)
+    for duracion in (1, 2, 3):
+        esperado = _horas_libres_anterior(RESERVAS, duracion)
+        obtenido = app.cache_disponibilidad.horas_libres_desde_mascara(
+            app.cache_disponibilidad.mascara_de(RESERVAS, tabla), duracion, tabla
+        )
+        assert esperado == obtenido, (duracion, esperado, obtenido)
+
+    anterior = min(timeit.repeat(peticion_anterior, number=repeticiones, repeat=3)) / repeticiones
+    nuevo = min(timeit.repeat(peticion_minutos, number=repeticiones, repeat=3)) / repeticiones
+    print(f"strptime/strftime : {anterior * 1e6:8.1f} us por petición")
+    print(f"minutos enteros   : {nuevo * 1e6:8.1f} us por petición")
+    print(f"ahorro            : {(anterior - nuevo) * 1e6:8.1f} us ({anterior / nuevo:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark de la búsqueda de huecos libres (`app.buscar_huecos_libres`).
+
+Siembra un horizonte de días casi lleno (cada bloque ocupado con
+probabilidad `--ocupacion`) y mide la búsqueda completa: la consulta única
+del rango más el recorrido de máscaras. El peor caso pide una hora y un día
+de la semana que sólo quedan libres al final del horizonte.
+
+Uso:
+    python benchmarks/bench_huecos.py [--backend sqlite] [--dias 90] [--ocupacion 0.9]
+        [--repeticiones 200] [--semilla 42]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+
+def sembrar(app, args, rng):
+    """Reserva cada bloque del horizonte con probabilidad `ocupacion`; deja libre sólo el último día a las 20:00."""
+    db = app.db
+    db.create_user("bench", "x")
+    usuario = db.get_user_by_username("bench")
+    horas = app.HORAS_DISPONIBLES
+    ultimo = date.today() + timedelta(days=args.dias - 1)
+    pedidas = []
+    for desplazamiento in range(args.dias):
+        fecha = date.today() + timedelta(days=desplazamiento)
+        for hora in horas:
+            libre = fecha == ultimo and hora == "20:00"
+            if not libre and (hora == "20:00" or rng.random() < args.ocupacion):
+                pedidas.append(
+                    {
+                        "usuario_id": usuario["id"],
+                        "usuario_username": "bench",
+                        "nombre_mostrado": "Bench",
+                        "fecha_reserva": fecha,
+                        "dia": app.obtener_dia_desde_fecha(fecha),
+                        "hora_inicio": hora,
+                        "hora_fin": app.horarios.a_texto(app.horarios.fin_de(hora, 1)),
+                        "duracion_horas": 1,
+                    }
+                )
+    creadas = 0
+    for inicio in range(0, len(pedidas), 1000):
+        creadas += len(db.crear_reservas_lote(pedidas[inicio:inicio + 1000])["creadas"])
+    return creadas, ultimo
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("memoria", "sqlite"), default="sqlite")
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--ocupacion", type=float, default=0.9)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DB_BACKEND"] = args.backend
+    if args.backend == "sqlite":
+        os.environ["DB_SQLITE_RUTA"] = os.path.join(tempfile.mkdtemp(prefix="bench_huecos_"), "reservas.db")
+    import app  # noqa: E402
+
+    creadas, ultimo = sembrar(app, args, random.Random(args.semilla))
+    canchas = [cancha["id"] for cancha in app.obtener_canchas()]
+    print(f"Backend {args.backend}: {creadas} reservas en {args.dias} días ({args.ocupacion:.0%} de ocupación).")
+
+    casos = {
+        "primeros 5, cualquier horario": dict(limite=5),
+        "20:00 (sólo libre el último día)": dict(horas=["20:00"], limite=1),
+        f"20:00 los {app.DIAS_SEMANA[ultimo.weekday()]}": dict(horas=["20:00"], dias_semana={ultimo.weekday()}, limite=1),
+        "3 horas seguidas, 10 huecos": dict(limite=10),
+    }
+    for nombre, opciones in casos.items():
+        duracion = 3 if nombre.startswith("3 horas") else 1
+        huecos = app.buscar_huecos_libres(date.today(), args.dias, duracion, canchas, **opciones)
+        p50, p95 = medir(
+            lambda: app.buscar_huecos_libres(date.today(), args.dias, duracion, canchas, **opciones), args.repeticiones
+        )
+        primero = f"{huecos[0]['fecha']} {huecos[0]['hora_inicio']}" if huecos else "ninguno"
+        print(f"  {nombre:<36} p50 {p50:6.2f} ms  p95 {p95:6.2f} ms  ({len(huecos)} huecos, primero {primero})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compara el throughput de las vistas de lectura en modo secuencial y concurrente.
+
+Sustituye el módulo `db` de la aplicación por uno que simula la latencia de
+ida y vuelta a SQL Server (`--latencia` ms por consulta) y lanza peticiones
+concurrentes a `GET /` y `GET /api/disponibilidad` con el cliente de pruebas
+de Flask. En `GET /`, con el día elegido fuera de caché, el modo concurrente
+pide la semana y la ocupación del día a la vez. Se miden dos escenarios:
+
+- "fría": cachés de canchas y disponibilidad con TTL 0, cada petición consulta.
+- "estable": TTL por defecto, como en producción tras el primer acceso.
+
+Uso:
+    python benchmarks/bench_lectura.py [--latencia 5] [--clientes 16] [--peticiones 400]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+import lectura  # noqa: E402
+
+
+class DBConLatencia:
+    """Implementa las lecturas usadas por las vistas con una espera fija por consulta."""
+
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.consultas = 0
+        self._lock = threading.Lock()
+
+    def _consulta(self):
+        with self._lock:
+            self.consultas += 1
+        time.sleep(self.latencia)
+
+    def obtener_ocupacion_rango(self, fecha_inicio, fecha_fin, cancha_id=None):
+        self._consulta()
+        return []
+
+    def obtener_canchas(self, solo_activas=True):
+        self._consulta()
+        return [{"id": 1, "nombre": "Cancha 1"}, {"id": 2, "nombre": "Cancha 2"}]
+
+
+def _cliente():
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["user_id"] = 1
+        sesion["username"] = "bench"
+        sesion["role"] = "client"
+        sesion["nombres"] = "Bench"
+    return cliente
+
+
+def medir(rutas, clientes, peticiones):
+    locales = threading.local()
+
+    def una(indice):
+        if not hasattr(locales, "cliente"):
+            locales.cliente = _cliente()
+        respuesta = locales.cliente.get(rutas[indice % len(rutas)])
+        assert respuesta.status_code == 200, respuesta.status_code
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as executor:
+        list(executor.map(una, range(peticiones)))
+    return peticiones / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latencia", type=float, default=5.0, help="ms por consulta simulada")
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=400)
+    args = parser.parse_args()
+
+    falso = DBConLatencia(args.latencia / 1000)
+    app.db = falso
+    app.DB_AVAILABLE = True
+    hoy = date.today().isoformat()
+    rutas = [f"/?fecha={hoy}", f"/api/disponibilidad?fecha={hoy}&duracion=2"]
+
+    ttl_canchas = app.CANCHAS_TTL_SEGUNDOS
+    ttl_disponibilidad = app.cache_disponibilidad.ttl_segundos
+    for escenario, fria in (("fría", True), ("estable", False)):
+        app.CANCHAS_TTL_SEGUNDOS = 0 if fria else ttl_canchas
+        app.cache_disponibilidad.ttl_segundos = 0 if fria else ttl_disponibilidad
+        for modo, concurrente in (("secuencial", False), ("concurrente", True)):
+            lectura.LECTURA_CONCURRENTE = concurrente
+            app.cache_disponibilidad.invalidar()
+            app._canchas_cache["canchas"] = None
+            falso.consultas = 0
+            throughput = medir(rutas, args.clientes, args.peticiones)
+            print(
+                f"{escenario:8s} {modo:12s} {throughput:8.1f} peticiones/s"
+                f"  ({falso.consultas / args.peticiones:.2f} consultas por petición)"
+            )
+
+
+if __name__ == "__main__":
+    main()
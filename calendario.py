@@ -0,0 +1,175 @@
+"""Calendario de apertura de las canchas.
+
+Define el horario de cada día de la semana, el tamaño de los bloques (por
+ejemplo 30 minutos), las duraciones de reserva permitidas, los feriados
+(cerrado todo el día) y las fechas con horario especial. Las plantillas de
+bloques (`horarios.TablaHorarios`) se construyen una sola vez por (día de la
+semana, versión del calendario) y se reutilizan en todas las peticiones.
+
+Se configura con un archivo JSON indicado en `HORARIO_ARCHIVO`:
+
+    {
+      "minutos_bloque": 30,
+      "duraciones": [1, 2, 3],
+      "dias": {"lunes": ["08:00", "22:00"], "sabado": ["09:00", "20:00"], "domingo": null},
+      "feriados": ["2026-12-25"],
+      "especiales": {"2026-12-24": ["08:00", "14:00"]}
+    }
+
+Los días que no aparecen en "dias" abren de 06:00 a 22:00; `null` es cerrado.
+"""
+import hashlib
+import json
+import threading
+import unicodedata
+from datetime import date
+
+import horarios
+
+NOMBRES_DIAS = ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")
+HORARIO_PREDETERMINADO = ("06:00", "22:00")
+DURACIONES_PREDETERMINADAS = (1, 2, 3)
+# Tamaños de bloque que dividen una hora exacta.
+MINUTOS_BLOQUE_VALIDOS = (10, 15, 20, 30, 60)
+
+TABLA_CERRADA = horarios.TablaHorarios(())
+
+# (día de la semana o fecha especial, versión) -> TablaHorarios.
+_plantillas = {}
+_lock_plantillas = threading.Lock()
+
+
+def _normalizar_dia(nombre):
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode()
+    return sin_tildes.strip().casefold()
+
+
+def _plantilla(clave, horario, minutos_bloque):
+    """Devuelve la tabla de `clave`, construyéndola sólo la primera vez."""
+    with _lock_plantillas:
+        tabla = _plantillas.get(clave)
+        if tabla is None:
+            if horario is None:
+                tabla = TABLA_CERRADA
+            else:
+                tabla = horarios.TablaHorarios.desde_rango(horario[0], horario[1], minutos_bloque)
+            _plantillas[clave] = tabla
+        return tabla
+
+
+def _leer_horario(valor, contexto, minutos_bloque):
+    """Convierte ["HH:MM", "HH:MM"] (o None) a (apertura, cierre) en minutos."""
+    if valor is None:
+        return None
+    try:
+        apertura, cierre = (horarios.a_minutos(hora) for hora in valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Horario inválido para {contexto}: usa [\"HH:MM\", \"HH:MM\"] o null.")
+    # Como en los bloqueos, el cierre no puede ser "24:00": el fin del último bloque
+    # debe poder guardarse como hora del día (TIME en SQL, `datetime.time`).
+    if not 0 <= apertura < cierre < 24 * horarios.MINUTOS_POR_HORA:
+        raise ValueError(
+            f"Horario inválido para {contexto}: la apertura debe ser anterior al cierre y el cierre anterior a las 24:00."
+        )
+    if apertura % minutos_bloque or cierre % minutos_bloque:
+        raise ValueError(f"El horario de {contexto} no coincide con bloques de {minutos_bloque} minutos.")
+    return apertura, cierre
+
+
+class Calendario:
+    """Horario de apertura por día de la semana, con feriados y fechas especiales.
+
+    `semana` es una lista de siete (apertura, cierre) en minutos, o None para
+    un día cerrado; `especiales` un dict fecha -> (apertura, cierre) o None.
+    """
+
+    def __init__(self, semana=None, minutos_bloque=60, duraciones=DURACIONES_PREDETERMINADAS, feriados=(),
+                 especiales=None):
+        if minutos_bloque not in MINUTOS_BLOQUE_VALIDOS:
+            raise ValueError(f"minutos_bloque debe ser uno de {MINUTOS_BLOQUE_VALIDOS}.")
+        duraciones = tuple(sorted(set(duraciones)))
+        if not duraciones or any(not isinstance(d, int) or d < 1 for d in duraciones):
+            raise ValueError("Las duraciones deben ser horas enteras positivas.")
+        if semana is None:
+            horario = tuple(horarios.a_minutos(hora) for hora in HORARIO_PREDETERMINADO)
+            semana = [horario] * len(NOMBRES_DIAS)
+        especiales = dict(especiales or {})
+        for feriado in feriados:
+            especiales[feriado] = None
+
+        self.minutos_bloque = minutos_bloque
+        self.duraciones = duraciones
+        self.semana = tuple(semana)
+        self.especiales = especiales
+        self.version = hashlib.sha1(
+            json.dumps(
+                [minutos_bloque, duraciones, self.semana, sorted((f.isoformat(), h) for f, h in especiales.items())]
+            ).encode()
+        ).hexdigest()[:12]
+
+        self._semana = tuple(
+            _plantilla((indice, self.version), horario, minutos_bloque) for indice, horario in enumerate(self.semana)
+        )
+        self._especiales = {
+            fecha: _plantilla((fecha, self.version), horario, minutos_bloque) for fecha, horario in especiales.items()
+        }
+
+        abiertas = [tabla for tabla in self._semana + tuple(self._especiales.values()) if len(tabla)]
+        if abiertas:
+            # Grilla que abarca todos los horarios: columnas de la analítica y horas de los formularios.
+            self.tabla_general = horarios.TablaHorarios.desde_rango(
+                min(tabla.apertura for tabla in abiertas), max(tabla.cierre for tabla in abiertas), minutos_bloque
+            )
+        else:
+            self.tabla_general = TABLA_CERRADA
+        self.horas = tuple(hora for hora in self.tabla_general.horas if any(tabla.indice(hora) is not None
+                                                                           for tabla in abiertas))
+
+    def tabla(self, fecha):
+        """`TablaHorarios` de una fecha; vacía si la cancha está cerrada ese día."""
+        tabla = self._especiales.get(fecha)
+        return self._semana[fecha.weekday()] if tabla is None else tabla
+
+    def tabla_dia_semana(self, dia_semana):
+        """Plantilla habitual de un día de la semana (lunes = 0), sin contar fechas especiales."""
+        return self._semana[dia_semana]
+
+    def abierto(self, fecha):
+        return len(self.tabla(fecha)) > 0
+
+    def especiales_en(self, fecha_inicio, fecha_fin):
+        """Fechas especiales (incluidos feriados) del rango con su tabla, en orden."""
+        return sorted(
+            (fecha, tabla) for fecha, tabla in self._especiales.items() if fecha_inicio <= fecha <= fecha_fin
+        )
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """Construye el calendario a partir de la configuración JSON ya leída."""
+        minutos_bloque = int(datos.get("minutos_bloque", 60))
+        if minutos_bloque not in MINUTOS_BLOQUE_VALIDOS:
+            raise ValueError(f"minutos_bloque debe ser uno de {MINUTOS_BLOQUE_VALIDOS}.")
+        predeterminado = tuple(horarios.a_minutos(hora) for hora in HORARIO_PREDETERMINADO)
+        semana = [predeterminado] * len(NOMBRES_DIAS)
+        for nombre, valor in (datos.get("dias") or {}).items():
+            clave = _normalizar_dia(nombre)
+            if clave not in NOMBRES_DIAS:
+                raise ValueError(f"Día de la semana desconocido en el horario: {nombre}.")
+            semana[NOMBRES_DIAS.index(clave)] = _leer_horario(valor, nombre, minutos_bloque)
+        try:
+            feriados = [date.fromisoformat(texto) for texto in datos.get("feriados", [])]
+            especiales = {
+                date.fromisoformat(texto): _leer_horario(valor, texto, minutos_bloque)
+                for texto, valor in (datos.get("especiales") or {}).items()
+            }
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Fecha inválida en el horario ({exc}); usa AAAA-MM-DD.")
+        return cls(semana, minutos_bloque, datos.get("duraciones", DURACIONES_PREDETERMINADAS), feriados, especiales)
+
+
+def cargar(ruta=None):
+    """Lee el calendario del archivo JSON `ruta`; sin ruta devuelve el horario predeterminado."""
+    if not ruta:
+        return Calendario()
+    with open(ruta, encoding="utf-8") as archivo:
+        return Calendario.desde_dict(json.load(archivo))
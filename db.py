@@ -1,11 +1,64 @@
-import pyodbc
-from datetime import datetime
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 
-# Usuario y contraseña 'sa'
-SA_PASSWORD = 'sa'
-DB_SERVER = '80CLSOP13'
-DB_NAME = 'SIS_RESERVAS_CANCHA'
-DB_DRIVER = '{ODBC Driver 17 for SQL Server}'
+import almacenamiento
+from almacenamiento import (
+    a_hora as _a_hora,
+    agregar_bloqueos,
+    fila_a_reserva as _fila_a_reserva,
+    notificar_reserva_creada as _notificar_reserva_creada,
+    registrar_oyente_reserva,
+    reserva_de_bloqueo,
+    separar_conflictos,
+)
+
+# Usuario y contraseña 'sa' por defecto; se pueden cambiar por variables de entorno.
+DB_USER = os.environ.get('DB_USER', 'sa')
+SA_PASSWORD = os.environ.get('DB_PASSWORD', 'sa')
+DB_SERVER = os.environ.get('DB_SERVER', '80CLSOP13')
+DB_NAME = os.environ.get('DB_NAME', 'SIS_RESERVAS_CANCHA')
+DB_DRIVER = os.environ.get('DB_DRIVER', '{ODBC Driver 17 for SQL Server}')
+
+# SQL Server corre fuera del proceso: `init_db` se ejecuta explícitamente.
+EMBEBIDO = False
+
+# Parámetros del pool de conexiones (se pueden ajustar por variables de entorno).
+POOL_TAMANO = int(os.environ.get('DB_POOL_TAMANO', '5'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+POOL_RECICLAR_SEGUNDOS = float(os.environ.get('DB_POOL_RECICLAR', '1800'))
+POOL_VERIFICAR_INACTIVA = float(os.environ.get('DB_POOL_VERIFICAR_INACTIVA', '30'))
+# Filas por viaje al leer reservas con `fetchmany`.
+FETCH_TAMANO_LOTE = int(os.environ.get('DB_FETCH_LOTE', '1000'))
+
+CANCHA_PREDETERMINADA = almacenamiento.CANCHA_PREDETERMINADA
+
+if importlib.util.find_spec('pyodbc') is None:
+    raise ImportError("pyodbc no está instalado; es necesario para el backend de SQL Server.")
+
+
+class _DriverDiferido:
+    """Importa pyodbc la primera vez que se usa, no al cargar el módulo.
+
+    Importar el driver ODBC cuesta tiempo de arranque que no hace falta hasta
+    la primera conexión.
+    """
+
+    def __getattr__(self, nombre):
+        global pyodbc
+        pyodbc = importlib.import_module('pyodbc')
+        return getattr(pyodbc, nombre)
+
+
+pyodbc = _DriverDiferido()
+
+
+_log = logging.getLogger(__name__)
 
 
 def get_db_connection():
@@ -14,13 +67,13 @@ def get_db_connection():
         f'DRIVER={DB_DRIVER};'
         f'SERVER={DB_SERVER};'
         f'DATABASE={DB_NAME};'
-        'UID=sa;'
+        f'UID={DB_USER};'
         f'PWD={SA_PASSWORD};'
     )
 
     try:
         conn = pyodbc.connect(connection_string, autocommit=True)
-        print("Conexión a SQL Server exitosa.")
+        _log.debug("Conexión a SQL Server abierta.")
         return conn
     except pyodbc.Error as ex:
         sqlstate = ex.args[0] if ex.args else 'DESCONOCIDO'
@@ -29,28 +82,209 @@ def get_db_connection():
         return None
 
 
+class PoolAgotadoError(RuntimeError):
+    """Se lanza cuando no hay conexiones libres dentro del tiempo de espera."""
+
+
+class PoolConexiones:
+    """Pool de conexiones reutilizables y seguro para hilos.
+
+    Mantiene como máximo `tamano` conexiones abiertas. Al prestar una conexión
+    la recicla si superó `reciclar_segundos` de vida y, si estuvo inactiva más
+    de `verificar_inactiva` segundos, comprueba que siga viva con `SELECT 1`.
+    """
+
+    def __init__(self, crear_conexion, tamano=5, timeout=10.0, reciclar_segundos=1800.0, verificar_inactiva=30.0):
+        self._crear_conexion = crear_conexion
+        self.tamano = tamano
+        self.timeout = timeout
+        self.reciclar_segundos = reciclar_segundos
+        self.verificar_inactiva = verificar_inactiva
+        self._cond = threading.Condition()
+        self._libres = []  # pila LIFO de (conn, creada_en, devuelta_en)
+        self._creadas_en = {}
+        self._abiertas = 0
+        self._en_uso = 0
+        self._stats = {
+            "prestamos": 0,
+            "conexiones_creadas": 0,
+            "recicladas": 0,
+            "descartadas": 0,
+            "fallos_verificacion": 0,
+            "timeouts": 0,
+            "espera_total_ms": 0.0,
+            "apertura_total_ms": 0.0,
+            "apertura_max_ms": 0.0,
+        }
+
+    def obtener(self):
+        """Presta una conexión del pool, creando una nueva si hay cupo."""
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        with self._cond:
+            while True:
+                if self._libres:
+                    conn, creada_en, devuelta_en = self._libres.pop()
+                    break
+                if self._abiertas < self.tamano:
+                    self._abiertas += 1
+                    conn = None
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolAgotadoError(
+                        f"No hay conexiones libres en el pool tras {self.timeout} segundos."
+                    )
+                self._cond.wait(restante)
+            self._en_uso += 1
+            self._stats["prestamos"] += 1
+            self._stats["espera_total_ms"] += (time.monotonic() - inicio) * 1000
+
+        try:
+            if conn is not None:
+                ahora = time.monotonic()
+                if self.reciclar_segundos and ahora - creada_en > self.reciclar_segundos:
+                    self._cerrar(conn)
+                    self._contar("recicladas")
+                    conn = None
+                elif ahora - devuelta_en > self.verificar_inactiva and not self._esta_viva(conn):
+                    self._cerrar(conn)
+                    self._contar("fallos_verificacion")
+                    conn = None
+            if conn is None:
+                conn = self._nueva_conexion()
+        except Exception:
+            with self._cond:
+                self._abiertas -= 1
+                self._en_uso -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve una conexión al pool; si `descartar` es True la cierra."""
+        with self._cond:
+            self._en_uso -= 1
+            if descartar:
+                self._abiertas -= 1
+                self._stats["descartadas"] += 1
+                creada_en = self._creadas_en.pop(id(conn), None)
+            else:
+                creada_en = self._creadas_en.get(id(conn), time.monotonic())
+                self._libres.append((conn, creada_en, time.monotonic()))
+            self._cond.notify()
+        if descartar:
+            self._cerrar(conn)
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool."""
+        with self._cond:
+            libres = self._libres
+            self._libres = []
+            self._abiertas -= len(libres)
+        for conn, _, _ in libres:
+            self._creadas_en.pop(id(conn), None)
+            self._cerrar(conn)
+
+    def estadisticas(self):
+        """Devuelve un dict con el estado y los contadores del pool."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                {
+                    "tamano": self.tamano,
+                    "abiertas": self._abiertas,
+                    "libres": len(self._libres),
+                    "en_uso": self._en_uso,
+                }
+            )
+        return stats
+
+    def _nueva_conexion(self):
+        inicio = time.monotonic()
+        conn = self._crear_conexion()
+        if conn is None:
+            raise RuntimeError("No se pudo establecer conexión con SQL Server.")
+        apertura_ms = (time.monotonic() - inicio) * 1000
+        with self._cond:
+            self._creadas_en[id(conn)] = time.monotonic()
+            self._stats["conexiones_creadas"] += 1
+            self._stats["apertura_total_ms"] += apertura_ms
+            self._stats["apertura_max_ms"] = max(self._stats["apertura_max_ms"], apertura_ms)
+        return conn
+
+    def _esta_viva(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _cerrar(self, conn):
+        self._creadas_en.pop(id(conn), None)
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def _contar(self, clave):
+        with self._cond:
+            self._stats[clave] += 1
+
+
+_pool = PoolConexiones(
+    get_db_connection,
+    tamano=POOL_TAMANO,
+    timeout=POOL_TIMEOUT,
+    reciclar_segundos=POOL_RECICLAR_SEGUNDOS,
+    verificar_inactiva=POOL_VERIFICAR_INACTIVA,
+)
+
+
+@contextmanager
+def conexion():
+    """Presta una conexión del pool y la devuelve al terminar el bloque.
+
+    Si dentro del bloque ocurre un error de pyodbc la conexión se descarta,
+    ya que puede haber quedado en un estado inválido.
+    """
+    conn = _pool.obtener()
+    descartar = False
+    try:
+        yield conn
+    except pyodbc.Error:
+        descartar = True
+        raise
+    finally:
+        _pool.devolver(conn, descartar=descartar)
+
+
+def estadisticas_pool():
+    """Devuelve las estadísticas actuales del pool de conexiones."""
+    return _pool.estadisticas()
+
+
+def cerrar_pool():
+    """Cierra las conexiones libres del pool (útil al apagar la aplicación)."""
+    _pool.cerrar()
+
+
 ########################################################################
 
 
 
 
 
-def init_db():
-    """Crea la tabla `users` si no existe."""
-    create_table_sql = (
-        "IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='users' AND xtype='U')"
-        " CREATE TABLE users ("
-        " id INT IDENTITY(1,1) PRIMARY KEY,") + (
-            " username NVARCHAR(150) NOT NULL UNIQUE,"
-            " password NVARCHAR(255) NOT NULL,"
-            " nombres NVARCHAR(150) NOT NULL,"
-            " apellidos NVARCHAR(150) NOT NULL,"
-            " dni NVARCHAR(20) NULL,"
-            " role NVARCHAR(50) NOT NULL"
-        ")"
-    )
-    # Build combined string since earlier concatenation had an issue
-    create_table_sql = (
+# Migraciones del esquema en orden: (version, descripcion, sentencias).
+# La 1 es el esquema completo escrito de forma idempotente, así sirve tanto
+# para bases nuevas como para las creadas antes de versionar el esquema.
+# Nunca se modifica una migración aplicada: los cambios van en una nueva.
+MIGRACIONES = [
+    (1, "esquema inicial", [
         "IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='users' AND xtype='U')"
         " CREATE TABLE users ("
         " id INT IDENTITY(1,1) PRIMARY KEY,"
@@ -60,27 +294,19 @@ def init_db():
         " apellidos NVARCHAR(150) NOT NULL,"
         " dni NVARCHAR(20) NULL,"
         " role NVARCHAR(50) NOT NULL"
-        ")"
-    )
-
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo establecer conexión con SQL Server.")
-    cursor = conn.cursor()
-    cursor.execute(create_table_sql)
-
-    alter_commands = [
+        ")",
         "IF COL_LENGTH('users', 'nombres') IS NULL ALTER TABLE users ADD nombres NVARCHAR(150) NOT NULL DEFAULT ''",
         "IF COL_LENGTH('users', 'apellidos') IS NULL ALTER TABLE users ADD apellidos NVARCHAR(150) NOT NULL DEFAULT ''",
         "IF COL_LENGTH('users', 'dni') IS NULL ALTER TABLE users ADD dni NVARCHAR(20) NULL",
         "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='UQ_users_dni' AND object_id = OBJECT_ID('dbo.users'))"
-        " CREATE UNIQUE INDEX UQ_users_dni ON dbo.users (dni) WHERE dni IS NOT NULL"
-    ]
-
-    for command in alter_commands:
-        cursor.execute(command)
-
-    create_reservas_sql = (
+        " CREATE UNIQUE INDEX UQ_users_dni ON dbo.users (dni) WHERE dni IS NOT NULL",
+        "IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='canchas' AND xtype='U')"
+        " CREATE TABLE canchas ("
+        " id INT IDENTITY(1,1) PRIMARY KEY,"
+        " nombre NVARCHAR(100) NOT NULL UNIQUE,"
+        " activa BIT NOT NULL DEFAULT 1"
+        ")",
+        "IF NOT EXISTS (SELECT 1 FROM canchas) INSERT INTO canchas (nombre) VALUES ('Cancha 1')",
         "IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='reservas' AND xtype='U')"
         " CREATE TABLE reservas ("
         " id INT IDENTITY(1,1) PRIMARY KEY,"
@@ -92,62 +318,153 @@ def init_db():
         " hora_inicio TIME(0) NOT NULL,"
         " hora_fin TIME(0) NOT NULL,"
         " duracion_horas TINYINT NOT NULL,"
+        " cancha_id INT NOT NULL CONSTRAINT DF_reservas_cancha_id DEFAULT 1 REFERENCES canchas(id),"
         " creado_en DATETIME2 NOT NULL DEFAULT SYSDATETIME()"
-        ")"
-    )
-    cursor.execute(create_reservas_sql)
-
-    alter_reservas_commands = [
+        ")",
         "IF COL_LENGTH('reservas', 'usuario_username') IS NULL ALTER TABLE reservas ADD usuario_username NVARCHAR(150) NOT NULL DEFAULT ''",
         "IF COL_LENGTH('reservas', 'nombre_mostrado') IS NULL ALTER TABLE reservas ADD nombre_mostrado NVARCHAR(300) NOT NULL DEFAULT ''",
         "IF COL_LENGTH('reservas', 'fecha_reserva') IS NULL ALTER TABLE reservas ADD fecha_reserva DATE NOT NULL DEFAULT CAST(GETDATE() AS DATE)",
         "IF COL_LENGTH('reservas', 'dia') IS NULL ALTER TABLE reservas ADD dia NVARCHAR(15) NOT NULL DEFAULT 'Lunes'",
         "IF COL_LENGTH('reservas', 'duracion_horas') IS NULL ALTER TABLE reservas ADD duracion_horas TINYINT NOT NULL DEFAULT 1",
+        # Las reservas anteriores a la multi-cancha quedan en la primera cancha.
+        "IF COL_LENGTH('reservas', 'cancha_id') IS NULL ALTER TABLE reservas ADD cancha_id INT NOT NULL"
+        " CONSTRAINT DF_reservas_cancha_id DEFAULT 1 CONSTRAINT FK_reservas_canchas REFERENCES canchas(id)",
         "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_reservas_fecha_hora' AND object_id = OBJECT_ID('dbo.reservas'))"
         " CREATE UNIQUE INDEX IX_reservas_fecha_hora ON dbo.reservas (fecha_reserva, hora_inicio, hora_fin, usuario_id)",
-    ]
+        # Índice de cobertura para las consultas por rango de fechas (vista semanal).
+        "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_reservas_fecha_reserva' AND object_id = OBJECT_ID('dbo.reservas'))"
+        " CREATE INDEX IX_reservas_fecha_reserva ON dbo.reservas (fecha_reserva, hora_inicio)"
+        " INCLUDE (usuario_id, usuario_username, nombre_mostrado, dia, hora_fin, duracion_horas, cancha_id)",
+        # Índice para la verificación de solapamientos por cancha.
+        "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_reservas_cancha_fecha' AND object_id = OBJECT_ID('dbo.reservas'))"
+        " CREATE INDEX IX_reservas_cancha_fecha ON dbo.reservas (cancha_id, fecha_reserva, hora_inicio) INCLUDE (hora_fin)",
+        # Reservas creadas antes de guardar el username: se completa una única vez.
+        "UPDATE r SET usuario_username = u.username FROM reservas AS r JOIN users AS u ON u.id = r.usuario_id"
+        " WHERE r.usuario_username = ''",
+    ]),
+    # Bloqueos de la administración (mantenimiento, torneos): una fila por regla,
+    # aplicada a cada fecha del rango cuyo día de la semana está en `dias_semana`
+    # (bit 0 = lunes). `cancha_id` NULL bloquea todas las canchas.
+    (2, "bloqueos de horarios", [
+        "IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='bloqueos' AND xtype='U')"
+        " CREATE TABLE bloqueos ("
+        " id INT IDENTITY(1,1) PRIMARY KEY,"
+        " fecha_desde DATE NOT NULL,"
+        " fecha_hasta DATE NOT NULL,"
+        " dias_semana TINYINT NOT NULL DEFAULT 127,"
+        " hora_inicio TIME(0) NOT NULL,"
+        " hora_fin TIME(0) NOT NULL,"
+        " cancha_id INT NULL REFERENCES canchas(id),"
+        " motivo NVARCHAR(200) NOT NULL DEFAULT '',"
+        " creado_por NVARCHAR(150) NOT NULL DEFAULT '',"
+        " creado_en DATETIME2 NOT NULL DEFAULT SYSDATETIME(),"
+        " CONSTRAINT CK_bloqueos_rango CHECK (fecha_desde <= fecha_hasta AND hora_inicio < hora_fin)"
+        ")",
+        "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_bloqueos_fechas' AND object_id = OBJECT_ID('dbo.bloqueos'))"
+        " CREATE INDEX IX_bloqueos_fechas ON dbo.bloqueos (fecha_hasta, fecha_desde)"
+        " INCLUDE (dias_semana, hora_inicio, hora_fin, cancha_id, motivo)",
+    ]),
+    # Historial de cada usuario con paginación por clave (fecha_reserva, hora_inicio, id).
+    (3, "indice de reservas por usuario", [
+        "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_reservas_usuario_fecha' AND object_id = OBJECT_ID('dbo.reservas'))"
+        " CREATE INDEX IX_reservas_usuario_fecha ON dbo.reservas (usuario_id, fecha_reserva, hora_inicio, id)"
+        " INCLUDE (usuario_username, nombre_mostrado, dia, hora_fin, duracion_horas, cancha_id)",
+    ]),
+]
 
-    for command in alter_reservas_commands:
-        cursor.execute(command)
+# Día de la semana con lunes = 0 sin depender de SET DATEFIRST (el 1900-01-01 fue lunes).
+_SQL_DIA_SEMANA = "DATEDIFF(day, '19000101', {}) % 7"
 
-    if not _reservas_tiene_usuario_username(cursor):
-        cursor.execute("UPDATE reservas SET usuario_username = (SELECT username FROM users WHERE users.id = reservas.usuario_id)")
+# Una sola consulta: -1 si la tabla de versiones aún no existe.
+_SQL_VERSION_ESQUEMA = (
+    "IF OBJECT_ID('dbo.schema_version', 'U') IS NULL SELECT -1"
+    " ELSE SELECT ISNULL(MAX(version), 0) FROM dbo.schema_version"
+)
 
-    cursor.close()
-    conn.close()
 
+def version_esquema():
+    """Versión de esquema aplicada (0 si no hay ninguna, -1 si no existe la tabla)."""
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_VERSION_ESQUEMA)
+        version = cursor.fetchone()[0]
+        cursor.close()
+    return version
 
-def _reservas_tiene_usuario_username(cursor):
-    try:
-        cursor.execute("SELECT TOP 1 usuario_username FROM reservas")
-        cursor.fetchone()
-        return True
-    except pyodbc.Error:
-        return False
+
+def init_db():
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema.
+
+    Con la base al día sólo se ejecuta la lectura de la versión. Si hay
+    migraciones pendientes se toma primero un bloqueo de aplicación y, dentro
+    de esa misma transacción, se crea `schema_version` si falta, se vuelve a
+    leer la versión y se aplican las migraciones junto con su registro. Así
+    dos procesos que arrancan a la vez no crean la tabla ni aplican una
+    migración dos veces; si una falla no queda ninguna a medias.
+    """
+    ultima = MIGRACIONES[-1][0]
+    actual = version_esquema()
+    if actual >= ultima:
+        return actual
+
+    with conexion() as conn:
+        cursor = conn.cursor()
+        conn.autocommit = False
+        try:
+            cursor.execute(
+                "EXEC sp_getapplock @Resource = 'schema_version', @LockMode = 'Exclusive',"
+                " @LockOwner = 'Transaction', @LockTimeout = 60000"
+            )
+            cursor.execute(
+                "IF OBJECT_ID('dbo.schema_version', 'U') IS NULL"
+                " CREATE TABLE dbo.schema_version ("
+                " version INT NOT NULL PRIMARY KEY,"
+                " descripcion NVARCHAR(200) NOT NULL,"
+                " aplicada_en DATETIME2 NOT NULL DEFAULT SYSDATETIME()"
+                ")"
+            )
+            # Otro proceso pudo aplicar migraciones mientras se esperaba el bloqueo.
+            cursor.execute("SELECT ISNULL(MAX(version), 0) FROM dbo.schema_version")
+            actual = cursor.fetchone()[0]
+            aplicadas = []
+            for version, descripcion, sentencias in MIGRACIONES:
+                if version <= actual:
+                    continue
+                for sentencia in sentencias:
+                    cursor.execute(sentencia)
+                cursor.execute(
+                    "INSERT INTO dbo.schema_version (version, descripcion) VALUES (?, ?)", (version, descripcion)
+                )
+                aplicadas.append((version, descripcion))
+                actual = version
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+            cursor.close()
+    for version, descripcion in aplicadas:
+        print(f"Migración {version} aplicada: {descripcion}.")
+    return actual
 
 
 def create_user(username, password_hash, role="client", nombres="", apellidos="", dni=None):
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo establecer conexión con SQL Server.")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO users (username, password, nombres, apellidos, dni, role) VALUES (?, ?, ?, ?, ?, ?)",
-        (username, password_hash, nombres, apellidos, dni, role),
-    )
-    cursor.close()
-    conn.close()
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (username, password, nombres, apellidos, dni, role) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, password_hash, nombres, apellidos, dni, role),
+        )
+        cursor.close()
 
 
 def get_user_by_username(username):
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo establecer conexión con SQL Server.")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username, password, role, nombres, apellidos, dni FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username, password, role, nombres, apellidos, dni FROM users WHERE username = ?", (username,))
+        row = cursor.fetchone()
+        cursor.close()
     if row:
         return {
             "id": row[0],
@@ -161,70 +478,592 @@ def get_user_by_username(username):
     return None
 
 
-def crear_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas):
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo establecer conexión con SQL Server.")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO reservas (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas)"
-        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas)
-    )
-    cursor.close()
-    conn.close()
+def actualizar_password(user_id, password_hash):
+    """Reemplaza el hash de contraseña guardado de un usuario."""
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+        cursor.close()
+
+
+def _patron_prefijo(texto):
+    """Patrón LIKE que busca `texto` como prefijo, con sus comodines escapados."""
+    for caracter in ("\\", "%", "_", "["):
+        texto = texto.replace(caracter, "\\" + caracter)
+    return texto + "%"
 
 
-def obtener_reservas(fecha=None):
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo establecer conexión con SQL Server.")
-    cursor = conn.cursor()
-    if fecha:
+def listar_usuarios(username=None, dni=None, despues=None, limite=20):
+    """Hasta `limite` usuarios ordenados por username, sin el hash de contraseña.
+
+    `username` y `dni` filtran por prefijo con LIKE 'texto%', que SQL Server
+    resuelve buscando en el índice único de cada columna. Paginación por
+    clave: `despues` es el username de la última fila de la página anterior.
+    """
+    sql = "SELECT TOP (?) id, username, role, nombres, apellidos, dni FROM users"
+    condiciones = []
+    parametros = [limite]
+    if username:
+        condiciones.append("username LIKE ? ESCAPE '\\'")
+        parametros.append(_patron_prefijo(username))
+    if dni:
+        # `dni IS NOT NULL` permite usar el índice filtrado UQ_users_dni.
+        condiciones.append("dni IS NOT NULL AND dni LIKE ? ESCAPE '\\'")
+        parametros.append(_patron_prefijo(dni))
+    if despues:
+        condiciones.append("username > ?")
+        parametros.append(despues)
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY username"
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, parametros)
+        rows = cursor.fetchall()
+        cursor.close()
+    return [
+        {"id": row[0], "username": row[1], "role": row[2], "nombres": row[3], "apellidos": row[4], "dni": row[5]}
+        for row in rows
+    ]
+
+
+def buscar_usuarios_existentes(usernames, dnis):
+    """Devuelve (usernames, dnis) que ya existen en `users`, en una sola consulta.
+
+    Las listas se envían como JSON y se expanden con OPENJSON, así la consulta
+    no depende del límite de parámetros de SQL Server.
+    """
+    with conexion() as conn:
+        cursor = conn.cursor()
         cursor.execute(
-            "SELECT id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas"
-            " FROM reservas WHERE fecha_reserva = ?", (fecha,)
+            "SELECT username, dni FROM users"
+            " WHERE username IN (SELECT value FROM OPENJSON(?))"
+            " OR dni IN (SELECT value FROM OPENJSON(?))",
+            (json.dumps(list(usernames)), json.dumps([dni for dni in dnis if dni])),
         )
-    else:
+        rows = cursor.fetchall()
+        cursor.close()
+    return {row[0] for row in rows}, {row[1] for row in rows if row[1]}
+
+
+def crear_usuarios_lote(usuarios, tamano_lote=500):
+    """Inserta usuarios en lotes con `fast_executemany` dentro de una transacción.
+
+    `usuarios` es una lista de dicts con username, password_hash, nombres,
+    apellidos, dni y role. Si algún lote falla no se inserta ninguno.
+    """
+    filas = [
+        (u["username"], u["password_hash"], u["nombres"], u["apellidos"], u.get("dni"), u.get("role", "client"))
+        for u in usuarios
+    ]
+    with conexion() as conn:
+        conn.autocommit = False
+        try:
+            cursor = conn.cursor()
+            cursor.fast_executemany = True
+            for inicio in range(0, len(filas), tamano_lote):
+                cursor.executemany(
+                    "INSERT INTO users (username, password, nombres, apellidos, dni, role) VALUES (?, ?, ?, ?, ?, ?)",
+                    filas[inicio:inicio + tamano_lote],
+                )
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    return len(filas)
+
+
+def obtener_canchas(solo_activas=True):
+    """Devuelve las canchas registradas como dicts {'id', 'nombre'} ordenadas por id."""
+    sql = "SELECT id, nombre FROM canchas"
+    if solo_activas:
+        sql += " WHERE activa = 1"
+    sql += " ORDER BY id"
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        cursor.close()
+    return [{"id": row[0], "nombre": row[1]} for row in rows]
+
+
+_COLUMNAS_RESERVA = (
+    "id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id"
+)
+
+
+_SQL_INSERTAR_RESERVA = (
+    "INSERT INTO reservas (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id)"
+    "{salida}"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def crear_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                  cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta una reserva, avisa a los oyentes registrados y devuelve su id."""
+    with conexion() as conn:
+        cursor = conn.cursor()
         cursor.execute(
-            "SELECT id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas"
-            " FROM reservas"
+            _SQL_INSERTAR_RESERVA.format(salida=" OUTPUT INSERTED.id"),
+            (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id)
         )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    reservas = []
-    for row in rows:
-        fecha_reserva = row[4]
-        hora_inicio = row[6]
-        hora_fin = row[7]
-        reservas.append(
-            {
-                "id": row[0],
-                "usuario_id": row[1],
-                "usuario_username": row[2],
-                "nombre": row[3],
-                "fecha_reserva": fecha_reserva,
-                "dia": row[5],
-                "inicio": hora_inicio,
-                "fin": hora_fin,
-                "hora_inicio": hora_inicio.strftime("%H:%M"),
-                "hora_fin": hora_fin.strftime("%H:%M"),
-                "duracion": row[8],
-            }
+        reserva_id = cursor.fetchone()[0]
+        cursor.close()
+
+    _notificar_reserva_creada(
+        _fila_a_reserva(
+            (reserva_id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+             _a_hora(hora_inicio), _a_hora(hora_fin), duracion_horas, cancha_id)
         )
-    return reservas
+    )
+    return reserva_id
+
+
+_SQL_RESERVAR_SI_LIBRE = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @cancha INT = ?, @fecha DATE = ?, @inicio TIME(0) = ?, @fin TIME(0) = ?;
+DECLARE @conflicto_id INT, @bloqueo_id INT, @nuevo_id INT;
+BEGIN TRANSACTION;
+SELECT TOP 1 @conflicto_id = id
+  FROM reservas WITH (UPDLOCK, HOLDLOCK)
+ WHERE cancha_id = @cancha AND fecha_reserva = @fecha AND hora_inicio < @fin AND hora_fin > @inicio
+ ORDER BY hora_inicio;
+IF @conflicto_id IS NULL
+    SELECT TOP 1 @bloqueo_id = id
+      FROM bloqueos WITH (UPDLOCK, HOLDLOCK)
+     WHERE (cancha_id IS NULL OR cancha_id = @cancha) AND fecha_desde <= @fecha AND fecha_hasta >= @fecha
+       AND dias_semana & POWER(2, """ + _SQL_DIA_SEMANA.format("@fecha") + """) <> 0
+       AND hora_inicio < @fin AND hora_fin > @inicio
+     ORDER BY hora_inicio;
+IF @conflicto_id IS NULL AND @bloqueo_id IS NULL
+BEGIN
+    INSERT INTO reservas (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id)
+    VALUES (?, ?, ?, @fecha, ?, @inicio, @fin, ?, @cancha);
+    SET @nuevo_id = CAST(SCOPE_IDENTITY() AS INT);
+END;
+COMMIT TRANSACTION;
+SELECT @nuevo_id, r.id, r.usuario_id, r.usuario_username, r.nombre_mostrado, r.fecha_reserva, r.dia,
+       r.hora_inicio, r.hora_fin, r.duracion_horas, r.cancha_id,
+       b.id, b.motivo, b.hora_inicio, b.hora_fin
+  FROM (SELECT 1 AS uno) AS x
+  LEFT JOIN reservas AS r ON r.id = @conflicto_id
+  LEFT JOIN bloqueos AS b ON b.id = @bloqueo_id;
+"""
+
+
+def reservar_si_libre(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                      cancha_id=CANCHA_PREDETERMINADA):
+    """Crea la reserva sólo si no se cruza con otra de la misma cancha y fecha ni con un bloqueo.
+
+    La verificación y la inserción se ejecutan en una única transacción y un
+    solo viaje a SQL Server; el bloqueo UPDLOCK/HOLDLOCK sobre el rango de la
+    cancha y fecha (índice `IX_reservas_cancha_fecha`) evita que dos
+    solicitudes concurrentes reserven el mismo horario, y el mismo bloqueo
+    sobre los bloqueos de la fecha (índice `IX_bloqueos_fechas`) impide que
+    se cree un bloqueo entre la verificación y la inserción.
+
+    Devuelve un dict con `creada`, `id` y `conflicto` (la reserva o el
+    bloqueo con el que se cruza, o None).
+    """
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            _SQL_RESERVAR_SI_LIBRE,
+            (cancha_id, fecha_reserva, hora_inicio, hora_fin,
+             usuario_id, usuario_username, nombre_mostrado, dia, duracion_horas),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+
+    reserva_id = row[0]
+    if reserva_id is None:
+        if row[1] is None:
+            conflicto = reserva_de_bloqueo(row[11], row[12], fecha_reserva, row[13], row[14], cancha_id)
+        else:
+            conflicto = _fila_a_reserva(row[1:11])
+        return {"creada": False, "id": None, "conflicto": conflicto}
+
+    _notificar_reserva_creada(
+        _fila_a_reserva(
+            (reserva_id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+             _a_hora(hora_inicio), _a_hora(hora_fin), duracion_horas, cancha_id)
+        )
+    )
+    return {"creada": True, "id": reserva_id, "conflicto": None}
+
+
+_SQL_BLOQUEOS_CANCHA = (
+    "SELECT id, fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, motivo"
+    " FROM bloqueos WITH (UPDLOCK, HOLDLOCK)"
+    " WHERE (cancha_id IS NULL OR cancha_id = ?) AND fecha_desde <= ? AND fecha_hasta >= ?"
+)
+
+
+def crear_reservas_lote(reservas, cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta en una sola transacción las reservas que no se crucen con otras ni con un bloqueo.
+
+    `reservas` es una lista de dicts con las claves de `crear_reserva`
+    (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+    hora_inicio, hora_fin, duracion_horas), todas de la misma cancha.
+
+    Las reservas existentes del rango de fechas se leen con una sola consulta
+    que bloquea el rango (UPDLOCK/HOLDLOCK) hasta el commit, los bloqueos de
+    la cancha en el rango con otra que los bloquea igual, y las filas sin
+    conflicto se insertan con `fast_executemany`. Devuelve un dict con
+    `creadas` (lista de reservas) y `conflictos` (lista de pares
+    (reserva_pedida, reserva_existente)).
+    """
+    if not reservas:
+        return {"creadas": [], "conflictos": []}
+
+    fecha_inicio = min(r["fecha_reserva"] for r in reservas)
+    fecha_fin = max(r["fecha_reserva"] for r in reservas)
+
+    with conexion() as conn:
+        conn.autocommit = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {_COLUMNAS_RESERVA} FROM reservas WITH (UPDLOCK, HOLDLOCK)"
+                " WHERE cancha_id = ? AND fecha_reserva BETWEEN ? AND ?",
+                (cancha_id, fecha_inicio, fecha_fin),
+            )
+            existentes = {}
+            for row in cursor.fetchall():
+                reserva = _fila_a_reserva(row)
+                existentes.setdefault(reserva["fecha_reserva"], []).append(reserva)
+            cursor.execute(_SQL_BLOQUEOS_CANCHA, (cancha_id, fecha_fin, fecha_inicio))
+            agregar_bloqueos(existentes, {r["fecha_reserva"] for r in reservas}, cursor.fetchall(), cancha_id)
+
+            nuevas, conflictos = separar_conflictos(reservas, existentes, cancha_id)
+
+            if nuevas:
+                cursor.fast_executemany = True
+                cursor.executemany(
+                    _SQL_INSERTAR_RESERVA.format(salida=""),
+                    [
+                        (r["usuario_id"], r["usuario_username"], r["nombre"], r["fecha_reserva"], r["dia"],
+                         r["inicio"], r["fin"], r["duracion"], cancha_id)
+                        for r in nuevas
+                    ],
+                )
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+    for reserva in nuevas:
+        _notificar_reserva_creada(reserva)
+    return {"creadas": nuevas, "conflictos": conflictos}
+
+
+def _iterar_reservas(sql, parametros=(), tamano_lote=None):
+    """Ejecuta `sql` y entrega las filas como `Reserva` leyéndolas en lotes con `fetchmany`.
 
+    La conexión queda prestada mientras se itera; al agotar o cerrar el
+    generador vuelve al pool.
+    """
+    with conexion() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, parametros)
+            while True:
+                rows = cursor.fetchmany(tamano_lote or FETCH_TAMANO_LOTE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _fila_a_reserva(row)
+        finally:
+            cursor.close()
 
 
+def obtener_reservas(fecha):
+    """Reservas de una fecha ordenadas por hora de inicio.
 
+    Para rangos se usa `obtener_reservas_rango` y para listados completos
+    `listar_reservas`, que pagina; nunca se lee la tabla entera.
+    """
+    sql = f"SELECT {_COLUMNAS_RESERVA} FROM reservas WHERE fecha_reserva = ? ORDER BY hora_inicio"
+    return list(_iterar_reservas(sql, (fecha,)))
 
 
+def iterar_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None, usuario_id=None,
+                          tamano_lote=None):
+    """Como `obtener_reservas_rango`, pero entrega las reservas a medida que llegan.
 
+    Lee `tamano_lote` filas por viaje (`DB_FETCH_LOTE`, por defecto 1000), así
+    la memoria no depende del tamaño del rango. `usuario_id` filtra además por
+    quien reservó. Mantiene una conexión del pool ocupada hasta que se agota o
+    se cierra el generador.
+    """
+    condiciones = []
+    parametros = []
+    if fecha_inicio:
+        condiciones.append("fecha_reserva >= ?")
+        parametros.append(fecha_inicio)
+    if fecha_fin:
+        condiciones.append("fecha_reserva <= ?")
+        parametros.append(fecha_fin)
+    if dia:
+        condiciones.append("dia = ?")
+        parametros.append(dia)
+    if cancha_id is not None:
+        condiciones.append("cancha_id = ?")
+        parametros.append(cancha_id)
+    if usuario_id is not None:
+        condiciones.append("usuario_id = ?")
+        parametros.append(usuario_id)
 
+    sql = f"SELECT {_COLUMNAS_RESERVA} FROM reservas"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY fecha_reserva, hora_inicio"
+    return _iterar_reservas(sql, parametros, tamano_lote)
 
 
+def obtener_reservas_usuario(usuario_id, despues=None, limite=20, descendente=False):
+    """Hasta `limite` reservas de un usuario ordenadas por (fecha_reserva, hora_inicio, id).
+
+    Ver `listar_reservas`; la página se busca en el índice `IX_reservas_usuario_fecha`.
+    """
+    return listar_reservas(usuario_id=usuario_id, despues=despues, limite=limite, descendente=descendente)
+
+
+def listar_reservas(fecha_inicio=None, fecha_fin=None, usuario_id=None, cancha_id=None, despues=None, limite=20,
+                    descendente=False):
+    """Hasta `limite` reservas ordenadas por (fecha_reserva, hora_inicio, id).
+
+    Paginación por clave: `despues` es la tupla (fecha, hora_inicio, id) de
+    la última fila de la página anterior y sólo se devuelven las que le
+    siguen en el orden pedido (`descendente` invierte el orden). Con
+    `usuario_id` cada página es una búsqueda en `IX_reservas_usuario_fecha` y
+    sin él en `IX_reservas_fecha_reserva`, así que cuesta lo mismo la primera
+    que la centésima. Los demás filtros son opcionales.
+    """
+    operador, sentido = ("<", "DESC") if descendente else (">", "ASC")
+    condiciones = []
+    parametros = [limite]
+    if usuario_id is not None:
+        condiciones.append("usuario_id = ?")
+        parametros.append(usuario_id)
+    if fecha_inicio:
+        condiciones.append("fecha_reserva >= ?")
+        parametros.append(fecha_inicio)
+    if fecha_fin:
+        condiciones.append("fecha_reserva <= ?")
+        parametros.append(fecha_fin)
+    if cancha_id is not None:
+        condiciones.append("cancha_id = ?")
+        parametros.append(cancha_id)
+    if despues is not None:
+        fecha, hora, reserva_id = despues
+        # `fecha_reserva >= ?` (o `<=`) es redundante, pero es lo que permite a SQL
+        # Server buscar en el índice desde el cursor: el OR por sí solo no es sargable.
+        condiciones.append(
+            f"fecha_reserva {operador}= ? AND (fecha_reserva {operador} ? OR (fecha_reserva = ?"
+            f" AND (hora_inicio {operador} ? OR (hora_inicio = ? AND id {operador} ?))))"
+        )
+        parametros += [fecha, fecha, fecha, hora, hora, reserva_id]
+    sql = f"SELECT TOP (?) {_COLUMNAS_RESERVA} FROM reservas"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += f" ORDER BY fecha_reserva {sentido}, hora_inicio {sentido}, id {sentido}"
+    return list(_iterar_reservas(sql, parametros))
+
+
+def obtener_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None):
+    """Devuelve las reservas entre `fecha_inicio` y `fecha_fin` (inclusive).
+
+    El filtro se resuelve en SQL Server usando el índice `IX_reservas_fecha_reserva`,
+    por lo que el costo depende del rango pedido y no del histórico completo.
+    Cualquiera de los límites puede omitirse; `dia` filtra además por día de la
+    semana y `cancha_id` por cancha (si se omite se devuelven todas las canchas
+    en una sola consulta). Las reservas se devuelven ordenadas por fecha y hora
+    de inicio.
+    """
+    return list(iterar_reservas_rango(fecha_inicio, fecha_fin, dia, cancha_id))
+
+
+_SQL_OCUPACION = """
+WITH fechas AS (
+    SELECT CAST(? AS DATE) AS fecha
+    UNION ALL
+    SELECT DATEADD(day, 1, fecha) FROM fechas WHERE fecha < ?
+)
+SELECT """ + _COLUMNAS_RESERVA + """
+  FROM reservas
+ WHERE fecha_reserva BETWEEN ? AND ?{filtro_reservas}
+UNION ALL
+SELECT b.id, NULL, NULL, b.motivo, f.fecha, NULL, b.hora_inicio, b.hora_fin, NULL, c.id
+  FROM bloqueos AS b
+  JOIN fechas AS f ON f.fecha BETWEEN b.fecha_desde AND b.fecha_hasta
+  JOIN canchas AS c ON b.cancha_id IS NULL OR c.id = b.cancha_id
+ WHERE b.fecha_desde <= ? AND b.fecha_hasta >= ?
+   AND b.dias_semana & POWER(2, """ + _SQL_DIA_SEMANA.format("f.fecha") + """) <> 0{filtro_bloqueos}
+ ORDER BY fecha_reserva, hora_inicio
+OPTION (MAXRECURSION 0);
+"""
+
+
+def _fila_ocupacion(row):
+    """Convierte una fila de `_SQL_OCUPACION`: las de bloqueos no tienen usuario."""
+    if row[1] is None:
+        return reserva_de_bloqueo(row[0], row[3], row[4], row[6], row[7], row[9])
+    return _fila_a_reserva(row)
+
+
+def obtener_ocupacion_rango(fecha_inicio, fecha_fin, cancha_id=None):
+    """Reservas y bloqueos entre dos fechas (inclusive), en una sola consulta.
+
+    Los bloqueos se expanden en SQL a una fila por fecha y cancha que cubren
+    (con una CTE de fechas del rango) y se unen a las reservas con UNION ALL;
+    llegan como `Reserva` con `es_bloqueo` verdadero. Ordenadas por fecha y
+    hora de inicio; `cancha_id` filtra por cancha.
+    """
+    parametros = [fecha_inicio, fecha_fin, fecha_inicio, fecha_fin]
+    filtro_reservas = filtro_bloqueos = ""
+    if cancha_id is not None:
+        filtro_reservas = " AND cancha_id = ?"
+        parametros.append(cancha_id)
+    parametros += [fecha_fin, fecha_inicio]
+    if cancha_id is not None:
+        filtro_bloqueos = " AND c.id = ?"
+        parametros.append(cancha_id)
+
+    sql = _SQL_OCUPACION.format(filtro_reservas=filtro_reservas, filtro_bloqueos=filtro_bloqueos)
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, parametros)
+        rows = cursor.fetchall()
+        cursor.close()
+    return [_fila_ocupacion(row) for row in rows]
+
+
+_SQL_OCUPACION_AGREGADA = """
+SET NOCOUNT ON;
+SELECT """ + _SQL_DIA_SEMANA.format("fecha_reserva") + """ AS dia_semana, hora_inicio, hora_fin, COUNT(*)
+  FROM reservas
+ WHERE fecha_reserva BETWEEN ? AND ?
+ GROUP BY """ + _SQL_DIA_SEMANA.format("fecha_reserva") + """, hora_inicio, hora_fin;
+SELECT usuario_id, MAX(usuario_username), COUNT(*), SUM(DATEDIFF(minute, hora_inicio, hora_fin))
+  FROM reservas
+ WHERE fecha_reserva BETWEEN ? AND ?
+ GROUP BY usuario_id;
+"""
+
+
+def obtener_ocupacion_agregada(fecha_inicio, fecha_fin):
+    """Reservas entre dos fechas (inclusive) agrupadas en SQL, para la analítica.
+
+    Devuelve {'franjas', 'usuarios'}: cuántas reservas hay por día de la
+    semana (lunes = 0) y horario, y cuántas reservas y minutos suma cada
+    usuario. Ambos resultados llegan en un solo viaje; el volumen depende de
+    los horarios distintos y de los usuarios, no del número de reservas.
+    """
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_OCUPACION_AGREGADA, (fecha_inicio, fecha_fin, fecha_inicio, fecha_fin))
+        franjas = [
+            {"dia_semana": row[0], "inicio": row[1], "fin": row[2], "reservas": row[3]}
+            for row in cursor.fetchall()
+        ]
+        cursor.nextset()
+        usuarios = [
+            {"usuario_id": row[0], "username": row[1], "reservas": row[2], "minutos": row[3]}
+            for row in cursor.fetchall()
+        ]
+        cursor.close()
+    return {"franjas": franjas, "usuarios": usuarios}
+
+
+_SQL_CREAR_BLOQUEO = """
+SET NOCOUNT ON;
+DECLARE @desde DATE = ?, @hasta DATE = ?, @dias TINYINT = ?, @inicio TIME(0) = ?, @fin TIME(0) = ?, @cancha INT = ?;
+INSERT INTO bloqueos (fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id, motivo, creado_por)
+VALUES (@desde, @hasta, @dias, @inicio, @fin, @cancha, ?, ?);
+SELECT CAST(SCOPE_IDENTITY() AS INT);
+SELECT """ + _COLUMNAS_RESERVA + """
+  FROM reservas
+ WHERE fecha_reserva BETWEEN @desde AND @hasta AND (@cancha IS NULL OR cancha_id = @cancha)
+   AND hora_inicio < @fin AND hora_fin > @inicio
+   AND @dias & POWER(2, """ + _SQL_DIA_SEMANA.format("fecha_reserva") + """) <> 0
+ ORDER BY fecha_reserva, hora_inicio;
+"""
+
+
+def crear_bloqueo(fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id=None, motivo="",
+                  creado_por=""):
+    """Guarda un bloqueo y devuelve {'id', 'conflictos'} con las reservas existentes que cubre.
+
+    Un único INSERT registra la regla para todo el rango (no se crea una fila
+    por fecha) y, en el mismo viaje, se leen las reservas que ya ocupan esos
+    horarios. Las reservas en conflicto no se tocan: quedan a criterio de la
+    administración.
+    """
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            _SQL_CREAR_BLOQUEO,
+            (fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id, motivo, creado_por),
+        )
+        bloqueo_id = cursor.fetchone()[0]
+        cursor.nextset()
+        conflictos = [_fila_a_reserva(row) for row in cursor.fetchall()]
+        cursor.close()
+    return {"id": bloqueo_id, "conflictos": conflictos}
+
+
+def eliminar_bloqueos(ids):
+    """Elimina con un solo DELETE los bloqueos indicados y devuelve cuántos existían."""
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM bloqueos WHERE id IN (SELECT CAST(value AS INT) FROM OPENJSON(?))",
+            (json.dumps([int(bloqueo_id) for bloqueo_id in ids]),),
+        )
+        eliminados = cursor.rowcount
+        cursor.close()
+    return eliminados
+
+
+def obtener_bloqueos(vigentes_desde=None):
+    """Bloqueos ordenados por fecha de inicio; con `vigentes_desde`, sólo los que terminan desde esa fecha."""
+    sql = (
+        "SELECT id, fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id, motivo, creado_por"
+        " FROM bloqueos"
+    )
+    parametros = ()
+    if vigentes_desde:
+        sql += " WHERE fecha_hasta >= ?"
+        parametros = (vigentes_desde,)
+    sql += " ORDER BY fecha_desde, id"
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, parametros)
+        rows = cursor.fetchall()
+        cursor.close()
+    return [
+        {
+            "id": row[0],
+            "fecha_desde": row[1],
+            "fecha_hasta": row[2],
+            "dias_semana": row[3],
+            "hora_inicio": row[4].strftime("%H:%M"),
+            "hora_fin": row[5].strftime("%H:%M"),
+            "cancha_id": row[6],
+            "motivo": row[7],
+            "creado_por": row[8],
+        }
+        for row in rows
+    ]
 
 
 #########################################################################################
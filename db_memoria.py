@@ -0,0 +1,508 @@
+"""Backend de almacenamiento en memoria (`DB_BACKEND=memoria`).
+
+Guarda usuarios, canchas, reservas y bloqueos en estructuras de Python
+protegidas por un lock. No persiste nada: está pensado para desarrollo, demostraciones y
+pruebas de carga sin SQL Server. Las reservas se indexan por fecha (lista de
+fechas ordenada + dict fecha -> reservas ordenadas por hora), así que las
+consultas por rango no recorren el histórico completo.
+"""
+import bisect
+import itertools
+import threading
+from datetime import date, timedelta
+
+import almacenamiento
+import horarios
+from almacenamiento import (
+    a_hora as _a_hora,
+    bloqueo_aplica,
+    fila_a_reserva as _fila_a_reserva,
+    notificar_reserva_creada as _notificar_reserva_creada,
+    registrar_oyente_reserva,
+    reserva_de_bloqueo,
+    separar_conflictos,
+)
+
+# Todo vive en el proceso: `init_db` se ejecuta al arrancar la aplicación.
+EMBEBIDO = True
+CANCHA_PREDETERMINADA = almacenamiento.CANCHA_PREDETERMINADA
+
+_lock = threading.RLock()
+_usuarios = {}  # id -> dict
+_usuarios_por_username = {}  # username.casefold() -> id
+_usernames = []  # username.casefold() de todos los usuarios, ordenados
+_canchas = {}  # id -> {"id", "nombre", "activa"}
+_reservas_por_fecha = {}  # fecha -> lista de reservas ordenada por hora de inicio
+_fechas = []  # fechas con reservas, ordenadas
+# usuario_id -> (claves (fecha, inicio, id) ordenadas, reservas en el mismo orden)
+_reservas_por_usuario = {}
+_bloqueos = {}  # id -> dict con fecha_desde, fecha_hasta, dias_semana, inicio, fin, cancha_id, motivo, creado_por
+_siguiente_id = {"users": 1, "reservas": 1, "canchas": 1, "bloqueos": 1}
+
+
+def _nuevo_id(tabla):
+    valor = _siguiente_id[tabla]
+    _siguiente_id[tabla] += 1
+    return valor
+
+
+def init_db():
+    """Crea la cancha predeterminada si todavía no hay canchas.
+
+    No hay esquema que migrar; devuelve 0 como versión para coincidir con los
+    demás backends.
+    """
+    with _lock:
+        if not _canchas:
+            cancha_id = _nuevo_id("canchas")
+            _canchas[cancha_id] = {"id": cancha_id, "nombre": "Cancha 1", "activa": True}
+    return 0
+
+
+def vaciar():
+    """Elimina todos los datos (útil entre pruebas o benchmarks)."""
+    with _lock:
+        _usuarios.clear()
+        _usuarios_por_username.clear()
+        _usernames.clear()
+        _canchas.clear()
+        _reservas_por_fecha.clear()
+        _fechas.clear()
+        _reservas_por_usuario.clear()
+        _bloqueos.clear()
+        _siguiente_id.update({"users": 1, "reservas": 1, "canchas": 1, "bloqueos": 1})
+
+
+def _insertar_usuario(username, password_hash, role, nombres, apellidos, dni):
+    if username.casefold() in _usuarios_por_username:
+        raise ValueError(f"El usuario {username} ya existe.")
+    if dni and any(u["dni"] == dni for u in _usuarios.values()):
+        raise ValueError(f"El DNI {dni} ya está registrado.")
+    user_id = _nuevo_id("users")
+    _usuarios[user_id] = {
+        "id": user_id,
+        "username": username,
+        "password_hash": password_hash,
+        "role": role,
+        "nombres": nombres,
+        "apellidos": apellidos,
+        "dni": dni,
+    }
+    _usuarios_por_username[username.casefold()] = user_id
+    bisect.insort(_usernames, username.casefold())
+    return user_id
+
+
+def create_user(username, password_hash, role="client", nombres="", apellidos="", dni=None):
+    with _lock:
+        _insertar_usuario(username, password_hash, role, nombres, apellidos, dni)
+
+
+def get_user_by_username(username):
+    with _lock:
+        user_id = _usuarios_por_username.get(username.casefold())
+        return dict(_usuarios[user_id]) if user_id is not None else None
+
+
+def actualizar_password(user_id, password_hash):
+    """Reemplaza el hash de contraseña guardado de un usuario."""
+    with _lock:
+        if user_id in _usuarios:
+            _usuarios[user_id]["password_hash"] = password_hash
+
+
+def listar_usuarios(username=None, dni=None, despues=None, limite=20):
+    """Hasta `limite` usuarios ordenados por username, con los filtros de la versión de SQL Server.
+
+    Los usernames se mantienen ordenados, así que el prefijo de username y el
+    cursor `despues` se ubican con `bisect`; el de DNI se comprueba por fila.
+    """
+    with _lock:
+        inicio = bisect.bisect_right(_usernames, despues.casefold()) if despues else 0
+        if username:
+            inicio = max(inicio, bisect.bisect_left(_usernames, username.casefold()))
+        pagina = []
+        for clave in itertools.islice(_usernames, inicio, None):
+            if username and not clave.startswith(username.casefold()):
+                break
+            usuario = _usuarios[_usuarios_por_username[clave]]
+            if dni and not (usuario["dni"] or "").startswith(dni):
+                continue
+            pagina.append({campo: valor for campo, valor in usuario.items() if campo != "password_hash"})
+            if len(pagina) == limite:
+                break
+        return pagina
+
+
+def buscar_usuarios_existentes(usernames, dnis):
+    """Devuelve (usernames, dnis) que ya existen entre los usuarios."""
+    dnis = {dni for dni in dnis if dni}
+    with _lock:
+        usernames_existentes = {
+            _usuarios[_usuarios_por_username[u.casefold()]]["username"]
+            for u in usernames
+            if u.casefold() in _usuarios_por_username
+        }
+        dnis_existentes = {u["dni"] for u in _usuarios.values() if u["dni"] in dnis}
+    return usernames_existentes, dnis_existentes
+
+
+def crear_usuarios_lote(usuarios, tamano_lote=500):
+    """Inserta todos los usuarios o ninguno si alguno está repetido."""
+    with _lock:
+        usernames = [u["username"].casefold() for u in usuarios]
+        dnis = [u.get("dni") for u in usuarios if u.get("dni")]
+        existentes, dnis_existentes = buscar_usuarios_existentes(usernames, dnis)
+        if existentes or dnis_existentes or len(set(usernames)) < len(usernames) or len(set(dnis)) < len(dnis):
+            raise ValueError("Hay usuarios o DNI repetidos en el lote.")
+        for u in usuarios:
+            _insertar_usuario(u["username"], u["password_hash"], u.get("role", "client"),
+                              u["nombres"], u["apellidos"], u.get("dni"))
+    return len(usuarios)
+
+
+def obtener_canchas(solo_activas=True):
+    """Devuelve las canchas registradas como dicts {'id', 'nombre'} ordenadas por id."""
+    with _lock:
+        return [
+            {"id": cancha["id"], "nombre": cancha["nombre"]}
+            for cancha in sorted(_canchas.values(), key=lambda c: c["id"])
+            if cancha["activa"] or not solo_activas
+        ]
+
+
+def _guardar(reserva):
+    fecha = reserva["fecha_reserva"]
+    if fecha not in _reservas_por_fecha:
+        _reservas_por_fecha[fecha] = []
+        bisect.insort(_fechas, fecha)
+    del_dia = _reservas_por_fecha[fecha]
+    posicion = bisect.bisect_right([r["inicio"] for r in del_dia], reserva["inicio"])
+    del_dia.insert(posicion, reserva)
+
+    claves, reservas = _reservas_por_usuario.setdefault(reserva["usuario_id"], ([], []))
+    clave = (fecha, reserva["inicio"], reserva["id"])
+    posicion = bisect.bisect_right(claves, clave)
+    claves.insert(posicion, clave)
+    reservas.insert(posicion, reserva)
+
+
+def _nueva_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin,
+                   duracion_horas, cancha_id):
+    return _fila_a_reserva(
+        (_nuevo_id("reservas"), usuario_id, usuario_username, nombre_mostrado, _a_fecha(fecha_reserva), dia,
+         _a_hora(hora_inicio), _a_hora(hora_fin), duracion_horas, cancha_id)
+    )
+
+
+def _a_fecha(valor):
+    if isinstance(valor, str):
+        return date.fromisoformat(valor)
+    return valor
+
+
+def crear_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                  cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta una reserva, avisa a los oyentes registrados y devuelve su id."""
+    with _lock:
+        reserva = _nueva_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+                                 hora_inicio, hora_fin, duracion_horas, cancha_id)
+        _guardar(reserva)
+    _notificar_reserva_creada(reserva.copia())
+    return reserva["id"]
+
+
+def reservar_si_libre(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                      cancha_id=CANCHA_PREDETERMINADA):
+    """Crea la reserva sólo si no se cruza con otra de la misma cancha y fecha ni con un bloqueo.
+
+    La verificación y la inserción se hacen bajo el mismo lock. Devuelve un
+    dict con `creada`, `id` y `conflicto`.
+    """
+    inicio = _a_hora(hora_inicio)
+    fin = _a_hora(hora_fin)
+    with _lock:
+        del_dia = _reservas_por_fecha.get(_a_fecha(fecha_reserva), [])
+        conflicto = next(
+            (
+                r for r in del_dia + _bloqueos_en(_a_fecha(fecha_reserva), cancha_id)
+                if r["cancha_id"] == cancha_id and r["inicio"] < fin and r["fin"] > inicio
+            ),
+            None,
+        )
+        if conflicto:
+            return {"creada": False, "id": None, "conflicto": conflicto.copia()}
+        reserva = _nueva_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+                                 inicio, fin, duracion_horas, cancha_id)
+        _guardar(reserva)
+    _notificar_reserva_creada(reserva.copia())
+    return {"creada": True, "id": reserva["id"], "conflicto": None}
+
+
+def crear_reservas_lote(reservas, cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta bajo un mismo lock las reservas que no se crucen con otras ni con un bloqueo.
+
+    Devuelve un dict con `creadas` y `conflictos`, como en SQL Server.
+    """
+    if not reservas:
+        return {"creadas": [], "conflictos": []}
+
+    with _lock:
+        existentes = {}
+        for pedida in reservas:
+            if pedida["fecha_reserva"] not in existentes:
+                existentes[pedida["fecha_reserva"]] = [
+                    r for r in _reservas_por_fecha.get(_a_fecha(pedida["fecha_reserva"]), [])
+                    if r["cancha_id"] == cancha_id
+                ] + _bloqueos_en(_a_fecha(pedida["fecha_reserva"]), cancha_id)
+        nuevas, conflictos = separar_conflictos(reservas, existentes, cancha_id)
+        for reserva in nuevas:
+            reserva["id"] = _nuevo_id("reservas")
+            reserva["fecha_reserva"] = _a_fecha(reserva["fecha_reserva"])
+            _guardar(reserva.copia())
+
+    for reserva in nuevas:
+        _notificar_reserva_creada(reserva)
+    return {"creadas": nuevas, "conflictos": conflictos}
+
+
+def obtener_reservas(fecha):
+    return obtener_reservas_rango(fecha, fecha)
+
+
+def iterar_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None, usuario_id=None,
+                          tamano_lote=None):
+    """Como `obtener_reservas_rango`, pero entrega las reservas de a una.
+
+    Toma el lock sólo para copiar la lista de fechas del rango; cada fecha se
+    lee después por separado.
+    """
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    with _lock:
+        desde = bisect.bisect_left(_fechas, fecha_inicio) if fecha_inicio else 0
+        hasta = bisect.bisect_right(_fechas, fecha_fin) if fecha_fin else len(_fechas)
+        fechas = _fechas[desde:hasta]
+    for fecha in fechas:
+        with _lock:
+            del_dia = [
+                reserva.copia()
+                for reserva in _reservas_por_fecha.get(fecha, ())
+                if (not dia or reserva["dia"] == dia) and (cancha_id is None or reserva["cancha_id"] == cancha_id)
+                and (usuario_id is None or reserva["usuario_id"] == usuario_id)
+            ]
+        yield from del_dia
+
+
+def obtener_reservas_usuario(usuario_id, despues=None, limite=20, descendente=False):
+    """Hasta `limite` reservas de un usuario, paginadas por clave (fecha_reserva, hora_inicio, id)."""
+    return listar_reservas(usuario_id=usuario_id, despues=despues, limite=limite, descendente=descendente)
+
+
+def _recorrer_reservas(usuario_id, fecha_inicio, fecha_fin, despues, descendente):
+    """Recorre las reservas en el orden de la paginación, empezando después de `despues`.
+
+    Con `usuario_id` se usan las claves ordenadas del usuario y sin él las
+    fechas ordenadas; en ambos casos el punto de partida se ubica con `bisect`.
+    """
+    if usuario_id is not None:
+        claves, reservas = _reservas_por_usuario.get(usuario_id, ((), ()))
+        inicio = bisect.bisect_left(claves, (fecha_inicio,)) if fecha_inicio else 0
+        fin = bisect.bisect_left(claves, (fecha_fin + timedelta(days=1),)) if fecha_fin else len(claves)
+        if despues is not None and descendente:
+            fin = min(fin, bisect.bisect_left(claves, despues))
+        elif despues is not None:
+            inicio = max(inicio, bisect.bisect_right(claves, despues))
+        indices = range(fin - 1, inicio - 1, -1) if descendente else range(inicio, fin)
+        for indice in indices:
+            yield reservas[indice]
+        return
+
+    if despues is not None and descendente:
+        fecha_fin = min(fecha_fin, despues[0]) if fecha_fin else despues[0]
+    elif despues is not None:
+        fecha_inicio = max(fecha_inicio, despues[0]) if fecha_inicio else despues[0]
+    desde = bisect.bisect_left(_fechas, fecha_inicio) if fecha_inicio else 0
+    hasta = bisect.bisect_right(_fechas, fecha_fin) if fecha_fin else len(_fechas)
+    fechas = _fechas[desde:hasta]
+    for fecha in reversed(fechas) if descendente else fechas:
+        # Las reservas del día están ordenadas por hora de inicio y, a igual hora, por id.
+        del_dia = _reservas_por_fecha[fecha]
+        for reserva in reversed(del_dia) if descendente else del_dia:
+            clave = (fecha, reserva["inicio"], reserva["id"])
+            if despues is None or (clave < despues if descendente else clave > despues):
+                yield reserva
+
+
+def listar_reservas(fecha_inicio=None, fecha_fin=None, usuario_id=None, cancha_id=None, despues=None, limite=20,
+                    descendente=False):
+    """Hasta `limite` reservas paginadas por clave, con los filtros de la versión de SQL Server."""
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    if despues is not None:
+        despues = (_a_fecha(despues[0]), _a_hora(despues[1]), despues[2])
+    with _lock:
+        pagina = []
+        for reserva in _recorrer_reservas(usuario_id, fecha_inicio, fecha_fin, despues, descendente):
+            if cancha_id is not None and reserva["cancha_id"] != cancha_id:
+                continue
+            pagina.append(reserva.copia())
+            if len(pagina) == limite:
+                break
+        return pagina
+
+
+def obtener_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None):
+    """Devuelve las reservas entre `fecha_inicio` y `fecha_fin` (inclusive).
+
+    Mismos filtros y orden que la versión de SQL Server.
+    """
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    with _lock:
+        desde = bisect.bisect_left(_fechas, fecha_inicio) if fecha_inicio else 0
+        hasta = bisect.bisect_right(_fechas, fecha_fin) if fecha_fin else len(_fechas)
+        return [
+            reserva.copia()
+            for fecha in _fechas[desde:hasta]
+            for reserva in _reservas_por_fecha[fecha]
+            if (not dia or reserva["dia"] == dia) and (cancha_id is None or reserva["cancha_id"] == cancha_id)
+        ]
+
+
+def _bloqueos_en(fecha, cancha_id=None, bloqueos=None):
+    """Filas de ocupación de los bloqueos que cubren `fecha`, una por cancha afectada."""
+    filas = []
+    for bloqueo in _bloqueos.values() if bloqueos is None else bloqueos:
+        if not bloqueo["fecha_desde"] <= fecha <= bloqueo["fecha_hasta"] or not bloqueo_aplica(bloqueo["dias_semana"], fecha):
+            continue
+        canchas = sorted(_canchas) if bloqueo["cancha_id"] is None else [bloqueo["cancha_id"]]
+        filas.extend(
+            reserva_de_bloqueo(bloqueo["id"], bloqueo["motivo"], fecha, bloqueo["inicio"], bloqueo["fin"], id_cancha)
+            for id_cancha in canchas
+            if cancha_id is None or id_cancha == cancha_id
+        )
+    return filas
+
+
+def obtener_ocupacion_rango(fecha_inicio, fecha_fin, cancha_id=None):
+    """Reservas y bloqueos entre dos fechas (inclusive), ordenados por fecha y hora.
+
+    Cada bloqueo se expande a una fila por fecha y cancha que cubre, con el
+    formato de `Reserva` y `es_bloqueo` verdadero.
+    """
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    with _lock:
+        desde = bisect.bisect_left(_fechas, fecha_inicio)
+        hasta = bisect.bisect_right(_fechas, fecha_fin)
+        ocupacion = [
+            reserva.copia()
+            for fecha in _fechas[desde:hasta]
+            for reserva in _reservas_por_fecha[fecha]
+            if cancha_id is None or reserva["cancha_id"] == cancha_id
+        ]
+        vigentes = [b for b in _bloqueos.values() if b["fecha_desde"] <= fecha_fin and b["fecha_hasta"] >= fecha_inicio]
+        if vigentes:
+            fecha = max(fecha_inicio, min(b["fecha_desde"] for b in vigentes))
+            ultima = min(fecha_fin, max(b["fecha_hasta"] for b in vigentes))
+            while fecha <= ultima:
+                ocupacion.extend(_bloqueos_en(fecha, cancha_id, vigentes))
+                fecha += timedelta(days=1)
+    ocupacion.sort(key=lambda r: (r["fecha_reserva"], r["inicio"]))
+    return ocupacion
+
+
+def obtener_ocupacion_agregada(fecha_inicio, fecha_fin):
+    """Reservas entre dos fechas agrupadas por día de la semana y horario, y por usuario.
+
+    Devuelve {'franjas', 'usuarios'} con el mismo formato que SQL Server.
+    """
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    franjas = {}
+    usuarios = {}
+    with _lock:
+        desde = bisect.bisect_left(_fechas, fecha_inicio)
+        hasta = bisect.bisect_right(_fechas, fecha_fin)
+        for fecha in _fechas[desde:hasta]:
+            for reserva in _reservas_por_fecha[fecha]:
+                clave = (fecha.weekday(), reserva["inicio"], reserva["fin"])
+                franjas[clave] = franjas.get(clave, 0) + 1
+                usuario = usuarios.get(reserva["usuario_id"])
+                if usuario is None:
+                    usuario = usuarios[reserva["usuario_id"]] = {
+                        "usuario_id": reserva["usuario_id"], "username": reserva["usuario_username"],
+                        "reservas": 0, "minutos": 0,
+                    }
+                usuario["reservas"] += 1
+                usuario["minutos"] += horarios.a_minutos(reserva["fin"]) - horarios.a_minutos(reserva["inicio"])
+    return {
+        "franjas": [
+            {"dia_semana": dia, "inicio": inicio, "fin": fin, "reservas": cantidad}
+            for (dia, inicio, fin), cantidad in franjas.items()
+        ],
+        "usuarios": list(usuarios.values()),
+    }
+
+
+def _bloqueo_a_dict(bloqueo):
+    return {
+        "id": bloqueo["id"],
+        "fecha_desde": bloqueo["fecha_desde"],
+        "fecha_hasta": bloqueo["fecha_hasta"],
+        "dias_semana": bloqueo["dias_semana"],
+        "hora_inicio": bloqueo["inicio"].strftime("%H:%M"),
+        "hora_fin": bloqueo["fin"].strftime("%H:%M"),
+        "cancha_id": bloqueo["cancha_id"],
+        "motivo": bloqueo["motivo"],
+        "creado_por": bloqueo["creado_por"],
+    }
+
+
+def crear_bloqueo(fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id=None, motivo="",
+                  creado_por=""):
+    """Guarda un bloqueo y devuelve {'id', 'conflictos'} con las reservas existentes que cubre.
+
+    Las reservas en conflicto no se tocan: quedan a criterio de la administración.
+    """
+    bloqueo = {
+        "fecha_desde": _a_fecha(fecha_desde),
+        "fecha_hasta": _a_fecha(fecha_hasta),
+        "dias_semana": dias_semana,
+        "inicio": _a_hora(hora_inicio),
+        "fin": _a_hora(hora_fin),
+        "cancha_id": cancha_id,
+        "motivo": motivo,
+        "creado_por": creado_por,
+    }
+    with _lock:
+        bloqueo["id"] = _nuevo_id("bloqueos")
+        _bloqueos[bloqueo["id"]] = bloqueo
+        desde = bisect.bisect_left(_fechas, bloqueo["fecha_desde"])
+        hasta = bisect.bisect_right(_fechas, bloqueo["fecha_hasta"])
+        conflictos = [
+            reserva.copia()
+            for fecha in _fechas[desde:hasta] if bloqueo_aplica(dias_semana, fecha)
+            for reserva in _reservas_por_fecha[fecha]
+            if (cancha_id is None or reserva["cancha_id"] == cancha_id)
+            and reserva["inicio"] < bloqueo["fin"] and reserva["fin"] > bloqueo["inicio"]
+        ]
+    return {"id": bloqueo["id"], "conflictos": conflictos}
+
+
+def eliminar_bloqueos(ids):
+    """Elimina los bloqueos indicados y devuelve cuántos existían."""
+    with _lock:
+        return sum(1 for bloqueo_id in set(ids) if _bloqueos.pop(bloqueo_id, None) is not None)
+
+
+def obtener_bloqueos(vigentes_desde=None):
+    """Bloqueos ordenados por fecha de inicio; con `vigentes_desde`, sólo los que terminan desde esa fecha."""
+    vigentes_desde = _a_fecha(vigentes_desde)
+    with _lock:
+        bloqueos = [
+            _bloqueo_a_dict(bloqueo) for bloqueo in _bloqueos.values()
+            if vigentes_desde is None or bloqueo["fecha_hasta"] >= vigentes_desde
+        ]
+    return sorted(bloqueos, key=lambda b: (b["fecha_desde"], b["id"]))
@@ -0,0 +1,647 @@
+"""Backend SQLite embebido (`DB_BACKEND=sqlite`).
+
+Usa un archivo SQLite (`DB_SQLITE_RUTA`, por defecto `reservas.db`) en modo
+WAL, de modo que las lecturas no bloquean a la escritura en curso. Cada hilo
+mantiene su propia conexión. Fechas y horas se guardan como texto ISO
+("AAAA-MM-DD" y "HH:MM"), que se ordena y compara igual que los valores.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import almacenamiento
+from almacenamiento import (
+    a_hora as _a_hora,
+    agregar_bloqueos,
+    fila_a_reserva,
+    notificar_reserva_creada as _notificar_reserva_creada,
+    registrar_oyente_reserva,
+    reserva_de_bloqueo,
+    separar_conflictos,
+)
+
+DB_SQLITE_RUTA = os.environ.get("DB_SQLITE_RUTA", "reservas.db")
+# Milisegundos que una escritura espera a que se libere el bloqueo de otra.
+DB_SQLITE_BUSY_TIMEOUT = int(os.environ.get("DB_SQLITE_BUSY_TIMEOUT", "5000"))
+# Filas por lectura al recorrer reservas con `fetchmany`.
+FETCH_TAMANO_LOTE = int(os.environ.get("DB_FETCH_LOTE", "1000"))
+
+# La base vive junto a la aplicación: `init_db` se ejecuta al arrancar.
+EMBEBIDO = True
+CANCHA_PREDETERMINADA = almacenamiento.CANCHA_PREDETERMINADA
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {"conexiones_creadas": 0, "apertura_total_ms": 0.0, "apertura_max_ms": 0.0}
+
+
+def _nueva_conexion():
+    inicio = time.monotonic()
+    conn = sqlite3.connect(DB_SQLITE_RUTA, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA busy_timeout={DB_SQLITE_BUSY_TIMEOUT}")
+    apertura_ms = (time.monotonic() - inicio) * 1000
+    with _lock:
+        _stats["conexiones_creadas"] += 1
+        _stats["apertura_total_ms"] += apertura_ms
+        _stats["apertura_max_ms"] = max(_stats["apertura_max_ms"], apertura_ms)
+    return conn
+
+
+def estadisticas_pool():
+    """Contadores de las conexiones abiertas (una por hilo), con los mismos nombres que el pool de SQL Server."""
+    with _lock:
+        return dict(_stats)
+
+
+@contextmanager
+def conexion():
+    """Devuelve la conexión del hilo actual, creándola la primera vez."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _nueva_conexion()
+    yield conn
+
+
+@contextmanager
+def _transaccion(inmediata=False):
+    """Ejecuta el bloque en una transacción; `inmediata` toma el bloqueo de escritura al inicio."""
+    with conexion() as conn:
+        conn.execute("BEGIN IMMEDIATE" if inmediata else "BEGIN")
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def _texto_fecha(valor):
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+def _texto_hora(valor):
+    return _a_hora(valor).strftime("%H:%M")
+
+
+def _fila_a_reserva(row):
+    return fila_a_reserva(
+        row[:4] + (date.fromisoformat(row[4]), row[5], _a_hora(row[6]), _a_hora(row[7])) + row[8:]
+    )
+
+
+# Migraciones del esquema en orden: (version, descripcion, sentencias). La
+# versión aplicada se guarda en `PRAGMA user_version`, que se lee sin tocar
+# ninguna tabla. Nunca se modifica una migración aplicada.
+MIGRACIONES = [
+    (1, "esquema inicial", [
+        "CREATE TABLE IF NOT EXISTS users ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " username TEXT NOT NULL UNIQUE COLLATE NOCASE,"
+        " password TEXT NOT NULL,"
+        " nombres TEXT NOT NULL DEFAULT '',"
+        " apellidos TEXT NOT NULL DEFAULT '',"
+        " dni TEXT NULL,"
+        " role TEXT NOT NULL"
+        ")",
+        "CREATE UNIQUE INDEX IF NOT EXISTS UQ_users_dni ON users (dni) WHERE dni IS NOT NULL",
+        "CREATE TABLE IF NOT EXISTS canchas ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " nombre TEXT NOT NULL UNIQUE,"
+        " activa INTEGER NOT NULL DEFAULT 1"
+        ")",
+        "INSERT INTO canchas (nombre) SELECT 'Cancha 1' WHERE NOT EXISTS (SELECT 1 FROM canchas)",
+        "CREATE TABLE IF NOT EXISTS reservas ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " usuario_id INTEGER NOT NULL REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE,"
+        " usuario_username TEXT NOT NULL,"
+        " nombre_mostrado TEXT NOT NULL,"
+        " fecha_reserva TEXT NOT NULL,"
+        " dia TEXT NOT NULL,"
+        " hora_inicio TEXT NOT NULL,"
+        " hora_fin TEXT NOT NULL,"
+        " duracion_horas INTEGER NOT NULL,"
+        " cancha_id INTEGER NOT NULL DEFAULT 1 REFERENCES canchas(id),"
+        " creado_en TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        ")",
+        "CREATE INDEX IF NOT EXISTS IX_reservas_fecha_reserva ON reservas (fecha_reserva, hora_inicio)",
+        "CREATE INDEX IF NOT EXISTS IX_reservas_cancha_fecha ON reservas (cancha_id, fecha_reserva, hora_inicio, hora_fin)",
+    ]),
+    # Bloqueos de la administración: una fila por regla (ver db.py).
+    (2, "bloqueos de horarios", [
+        "CREATE TABLE IF NOT EXISTS bloqueos ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " fecha_desde TEXT NOT NULL,"
+        " fecha_hasta TEXT NOT NULL,"
+        " dias_semana INTEGER NOT NULL DEFAULT 127,"
+        " hora_inicio TEXT NOT NULL,"
+        " hora_fin TEXT NOT NULL,"
+        " cancha_id INTEGER NULL REFERENCES canchas(id),"
+        " motivo TEXT NOT NULL DEFAULT '',"
+        " creado_por TEXT NOT NULL DEFAULT '',"
+        " creado_en TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        " CHECK (fecha_desde <= fecha_hasta AND hora_inicio < hora_fin)"
+        ")",
+        "CREATE INDEX IF NOT EXISTS IX_bloqueos_fechas ON bloqueos (fecha_hasta, fecha_desde)",
+    ]),
+    (3, "indice de reservas por usuario", [
+        "CREATE INDEX IF NOT EXISTS IX_reservas_usuario_fecha ON reservas (usuario_id, fecha_reserva, hora_inicio, id)",
+    ]),
+]
+
+# Día de la semana con lunes = 0 (`%w` cuenta desde el domingo).
+_SQL_DIA_SEMANA = "((CAST(strftime('%w', {}) AS INTEGER) + 6) % 7)"
+
+
+def version_esquema():
+    """Versión de esquema aplicada (0 en una base nueva)."""
+    with conexion() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db():
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema.
+
+    Con la base al día sólo se lee `user_version`. Cada migración corre en
+    una transacción `BEGIN IMMEDIATE` que también actualiza la versión, así
+    que otro proceso que arranque a la vez espera y no la repite.
+    """
+    actual = version_esquema()
+    if actual >= MIGRACIONES[-1][0]:
+        return actual
+
+    for version, descripcion, sentencias in MIGRACIONES:
+        with _transaccion(inmediata=True) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            for sentencia in sentencias:
+                conn.execute(sentencia)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            print(f"Migración {version} aplicada: {descripcion}.")
+        actual = version
+    return actual
+
+
+def create_user(username, password_hash, role="client", nombres="", apellidos="", dni=None):
+    with conexion() as conn:
+        conn.execute(
+            "INSERT INTO users (username, password, nombres, apellidos, dni, role) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, password_hash, nombres, apellidos, dni, role),
+        )
+
+
+def get_user_by_username(username):
+    with conexion() as conn:
+        row = conn.execute(
+            "SELECT id, username, password, role, nombres, apellidos, dni FROM users WHERE username = ?", (username,)
+        ).fetchone()
+    if row:
+        return {
+            "id": row[0],
+            "username": row[1],
+            "password_hash": row[2],
+            "role": row[3],
+            "nombres": row[4],
+            "apellidos": row[5],
+            "dni": row[6],
+        }
+    return None
+
+
+def actualizar_password(user_id, password_hash):
+    """Reemplaza el hash de contraseña guardado de un usuario."""
+    with conexion() as conn:
+        conn.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+
+
+def listar_usuarios(username=None, dni=None, despues=None, limite=20):
+    """Hasta `limite` usuarios ordenados por username, con los filtros de la versión de SQL Server.
+
+    El prefijo se busca como rango (`col >= texto AND col < texto + U+10FFFF`)
+    en lugar de LIKE: así usa el índice de `username` (NOCASE) y también
+    `UQ_users_dni`, cuya intercalación binaria no sirve para el LIKE de SQLite.
+    """
+    sql = "SELECT id, username, role, nombres, apellidos, dni FROM users"
+    condiciones = []
+    parametros = []
+    for columna, prefijo in (("username", username), ("dni", dni)):
+        if prefijo:
+            condiciones.append(f"{columna} >= ? AND {columna} < ?")
+            parametros += [prefijo, prefijo + "\U0010ffff"]
+    if despues:
+        condiciones.append("username > ?")
+        parametros.append(despues)
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY username LIMIT ?"
+    parametros.append(limite)
+    with conexion() as conn:
+        rows = conn.execute(sql, parametros).fetchall()
+    return [
+        {"id": row[0], "username": row[1], "role": row[2], "nombres": row[3], "apellidos": row[4], "dni": row[5]}
+        for row in rows
+    ]
+
+
+def buscar_usuarios_existentes(usernames, dnis):
+    """Devuelve (usernames, dnis) que ya existen en `users`, en una sola consulta (json_each)."""
+    with conexion() as conn:
+        rows = conn.execute(
+            "SELECT username, dni FROM users"
+            " WHERE username IN (SELECT value FROM json_each(?))"
+            " OR dni IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(usernames)), json.dumps([dni for dni in dnis if dni])),
+        ).fetchall()
+    return {row[0] for row in rows}, {row[1] for row in rows if row[1]}
+
+
+def crear_usuarios_lote(usuarios, tamano_lote=500):
+    """Inserta los usuarios en una transacción; si alguno falla no se inserta ninguno."""
+    filas = [
+        (u["username"], u["password_hash"], u["nombres"], u["apellidos"], u.get("dni"), u.get("role", "client"))
+        for u in usuarios
+    ]
+    with _transaccion(inmediata=True) as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password, nombres, apellidos, dni, role) VALUES (?, ?, ?, ?, ?, ?)",
+            filas,
+        )
+    return len(filas)
+
+
+def obtener_canchas(solo_activas=True):
+    """Devuelve las canchas registradas como dicts {'id', 'nombre'} ordenadas por id."""
+    sql = "SELECT id, nombre FROM canchas"
+    if solo_activas:
+        sql += " WHERE activa = 1"
+    sql += " ORDER BY id"
+    with conexion() as conn:
+        rows = conn.execute(sql).fetchall()
+    return [{"id": row[0], "nombre": row[1]} for row in rows]
+
+
+_COLUMNAS_RESERVA = (
+    "id, usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id"
+)
+
+_SQL_INSERTAR_RESERVA = (
+    "INSERT INTO reservas (usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas, cancha_id)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _parametros_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin,
+                        duracion_horas, cancha_id):
+    return (usuario_id, usuario_username, nombre_mostrado, _texto_fecha(fecha_reserva), dia,
+            _texto_hora(hora_inicio), _texto_hora(hora_fin), duracion_horas, cancha_id)
+
+
+def crear_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                  cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta una reserva, avisa a los oyentes registrados y devuelve su id."""
+    parametros = _parametros_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+                                     hora_inicio, hora_fin, duracion_horas, cancha_id)
+    with conexion() as conn:
+        reserva_id = conn.execute(_SQL_INSERTAR_RESERVA, parametros).lastrowid
+    _notificar_reserva_creada(_fila_a_reserva((reserva_id,) + parametros))
+    return reserva_id
+
+
+def reservar_si_libre(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia, hora_inicio, hora_fin, duracion_horas,
+                      cancha_id=CANCHA_PREDETERMINADA):
+    """Crea la reserva sólo si no se cruza con otra de la misma cancha y fecha ni con un bloqueo.
+
+    `BEGIN IMMEDIATE` toma el bloqueo de escritura antes de verificar, así dos
+    solicitudes concurrentes no pueden reservar el mismo horario. Devuelve un
+    dict con `creada`, `id` y `conflicto`.
+    """
+    parametros = _parametros_reserva(usuario_id, usuario_username, nombre_mostrado, fecha_reserva, dia,
+                                     hora_inicio, hora_fin, duracion_horas, cancha_id)
+    with _transaccion(inmediata=True) as conn:
+        conflicto = conn.execute(
+            f"SELECT {_COLUMNAS_RESERVA} FROM reservas"
+            " WHERE cancha_id = ? AND fecha_reserva = ? AND hora_inicio < ? AND hora_fin > ?"
+            " ORDER BY hora_inicio LIMIT 1",
+            (cancha_id, parametros[3], parametros[6], parametros[5]),
+        ).fetchone()
+        if conflicto is not None:
+            conflicto = _fila_a_reserva(conflicto)
+        else:
+            fecha = date.fromisoformat(parametros[3])
+            conflicto = next(
+                (
+                    bloqueo for bloqueo in agregar_bloqueos(
+                        {}, [fecha], _bloqueos_cancha(conn, cancha_id, fecha, fecha), cancha_id
+                    )[fecha]
+                    if bloqueo["inicio"] < _a_hora(parametros[6]) and bloqueo["fin"] > _a_hora(parametros[5])
+                ),
+                None,
+            )
+        if conflicto is None:
+            reserva_id = conn.execute(_SQL_INSERTAR_RESERVA, parametros).lastrowid
+
+    if conflicto is not None:
+        return {"creada": False, "id": None, "conflicto": conflicto}
+    _notificar_reserva_creada(_fila_a_reserva((reserva_id,) + parametros))
+    return {"creada": True, "id": reserva_id, "conflicto": None}
+
+
+def _bloqueos_cancha(conn, cancha_id, fecha_inicio, fecha_fin):
+    """Bloqueos que afectan a la cancha entre dos fechas, como tuplas para `agregar_bloqueos`."""
+    return [
+        (row[0], date.fromisoformat(row[1]), date.fromisoformat(row[2])) + row[3:]
+        for row in conn.execute(
+            "SELECT id, fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, motivo FROM bloqueos"
+            " WHERE (cancha_id IS NULL OR cancha_id = ?) AND fecha_desde <= ? AND fecha_hasta >= ?",
+            (cancha_id, _texto_fecha(fecha_fin), _texto_fecha(fecha_inicio)),
+        )
+    ]
+
+
+def crear_reservas_lote(reservas, cancha_id=CANCHA_PREDETERMINADA):
+    """Inserta en una sola transacción las reservas que no se crucen con otras ni con un bloqueo.
+
+    Devuelve un dict con `creadas` y `conflictos`, como en SQL Server.
+    """
+    if not reservas:
+        return {"creadas": [], "conflictos": []}
+
+    fecha_inicio = min(r["fecha_reserva"] for r in reservas)
+    fecha_fin = max(r["fecha_reserva"] for r in reservas)
+
+    with _transaccion(inmediata=True) as conn:
+        existentes = {}
+        for row in conn.execute(
+            f"SELECT {_COLUMNAS_RESERVA} FROM reservas WHERE cancha_id = ? AND fecha_reserva BETWEEN ? AND ?",
+            (cancha_id, _texto_fecha(fecha_inicio), _texto_fecha(fecha_fin)),
+        ):
+            reserva = _fila_a_reserva(row)
+            existentes.setdefault(reserva["fecha_reserva"], []).append(reserva)
+        agregar_bloqueos(existentes, {r["fecha_reserva"] for r in reservas},
+                         _bloqueos_cancha(conn, cancha_id, fecha_inicio, fecha_fin), cancha_id)
+
+        nuevas, conflictos = separar_conflictos(reservas, existentes, cancha_id)
+        for reserva in nuevas:
+            reserva["id"] = conn.execute(
+                _SQL_INSERTAR_RESERVA,
+                _parametros_reserva(reserva["usuario_id"], reserva["usuario_username"], reserva["nombre"],
+                                    reserva["fecha_reserva"], reserva["dia"], reserva["inicio"], reserva["fin"],
+                                    reserva["duracion"], cancha_id),
+            ).lastrowid
+
+    for reserva in nuevas:
+        _notificar_reserva_creada(reserva)
+    return {"creadas": nuevas, "conflictos": conflictos}
+
+
+def obtener_reservas(fecha):
+    return obtener_reservas_rango(fecha, fecha)
+
+
+def iterar_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None, usuario_id=None,
+                          tamano_lote=None):
+    """Como `obtener_reservas_rango`, pero entrega las reservas leyendo en lotes con `fetchmany`."""
+    condiciones = []
+    parametros = []
+    if fecha_inicio:
+        condiciones.append("fecha_reserva >= ?")
+        parametros.append(_texto_fecha(fecha_inicio))
+    if fecha_fin:
+        condiciones.append("fecha_reserva <= ?")
+        parametros.append(_texto_fecha(fecha_fin))
+    if dia:
+        condiciones.append("dia = ?")
+        parametros.append(dia)
+    if cancha_id is not None:
+        condiciones.append("cancha_id = ?")
+        parametros.append(cancha_id)
+    if usuario_id is not None:
+        condiciones.append("usuario_id = ?")
+        parametros.append(usuario_id)
+
+    sql = f"SELECT {_COLUMNAS_RESERVA} FROM reservas"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY fecha_reserva, hora_inicio"
+
+    with conexion() as conn:
+        cursor = conn.execute(sql, parametros)
+        try:
+            while True:
+                rows = cursor.fetchmany(tamano_lote or FETCH_TAMANO_LOTE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _fila_a_reserva(row)
+        finally:
+            cursor.close()
+
+
+def obtener_reservas_usuario(usuario_id, despues=None, limite=20, descendente=False):
+    """Hasta `limite` reservas de un usuario, paginadas por clave como en SQL Server."""
+    return listar_reservas(usuario_id=usuario_id, despues=despues, limite=limite, descendente=descendente)
+
+
+def listar_reservas(fecha_inicio=None, fecha_fin=None, usuario_id=None, cancha_id=None, despues=None, limite=20,
+                    descendente=False):
+    """Hasta `limite` reservas paginadas por clave, con los filtros de la versión de SQL Server.
+
+    La comparación de la clave (fecha_reserva, hora_inicio, id) usa valores de
+    fila de SQLite, que se resuelven con `IX_reservas_usuario_fecha` o
+    `IX_reservas_fecha_reserva` según se filtre o no por usuario.
+    """
+    operador, sentido = ("<", "DESC") if descendente else (">", "ASC")
+    condiciones = []
+    parametros = []
+    if usuario_id is not None:
+        condiciones.append("usuario_id = ?")
+        parametros.append(usuario_id)
+    if fecha_inicio:
+        condiciones.append("fecha_reserva >= ?")
+        parametros.append(_texto_fecha(fecha_inicio))
+    if fecha_fin:
+        condiciones.append("fecha_reserva <= ?")
+        parametros.append(_texto_fecha(fecha_fin))
+    if cancha_id is not None:
+        condiciones.append("cancha_id = ?")
+        parametros.append(cancha_id)
+    if despues is not None:
+        fecha, hora, reserva_id = despues
+        # La cota sobre `fecha_reserva` repite la de la fila para que el índice se
+        # recorra desde el cursor también cuando hay otros filtros de fecha.
+        condiciones.append(f"fecha_reserva {operador}= ? AND (fecha_reserva, hora_inicio, id) {operador} (?, ?, ?)")
+        parametros += [_texto_fecha(fecha), _texto_fecha(fecha), _texto_hora(hora), reserva_id]
+    sql = f"SELECT {_COLUMNAS_RESERVA} FROM reservas"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += f" ORDER BY fecha_reserva {sentido}, hora_inicio {sentido}, id {sentido} LIMIT ?"
+    parametros.append(limite)
+    with conexion() as conn:
+        rows = conn.execute(sql, parametros).fetchall()
+    return [_fila_a_reserva(row) for row in rows]
+
+
+def obtener_reservas_rango(fecha_inicio=None, fecha_fin=None, dia=None, cancha_id=None):
+    """Devuelve las reservas entre `fecha_inicio` y `fecha_fin` (inclusive).
+
+    Mismos filtros y orden que la versión de SQL Server; usa el índice
+    `IX_reservas_fecha_reserva`.
+    """
+    return list(iterar_reservas_rango(fecha_inicio, fecha_fin, dia, cancha_id))
+
+
+_SQL_OCUPACION = """
+WITH RECURSIVE fechas(fecha) AS (
+    SELECT ?
+    UNION ALL
+    SELECT date(fecha, '+1 day') FROM fechas WHERE fecha < ?
+)
+SELECT """ + _COLUMNAS_RESERVA + """
+  FROM reservas
+ WHERE fecha_reserva BETWEEN ? AND ?{filtro_reservas}
+UNION ALL
+SELECT b.id, NULL, NULL, b.motivo, f.fecha, NULL, b.hora_inicio, b.hora_fin, NULL, c.id
+  FROM bloqueos AS b
+  JOIN fechas AS f ON f.fecha BETWEEN b.fecha_desde AND b.fecha_hasta
+  JOIN canchas AS c ON b.cancha_id IS NULL OR c.id = b.cancha_id
+ WHERE b.fecha_desde <= ? AND b.fecha_hasta >= ?
+   AND (b.dias_semana >> """ + _SQL_DIA_SEMANA.format("f.fecha") + """) & 1{filtro_bloqueos}
+ ORDER BY fecha_reserva, hora_inicio
+"""
+
+
+def obtener_ocupacion_rango(fecha_inicio, fecha_fin, cancha_id=None):
+    """Reservas y bloqueos entre dos fechas (inclusive), en una sola consulta.
+
+    Igual que en SQL Server: los bloqueos se expanden con una CTE recursiva
+    de fechas y llegan como `Reserva` con `es_bloqueo` verdadero.
+    """
+    desde = _texto_fecha(fecha_inicio)
+    hasta = _texto_fecha(fecha_fin)
+    parametros = [desde, hasta, desde, hasta]
+    filtro_reservas = filtro_bloqueos = ""
+    if cancha_id is not None:
+        filtro_reservas = " AND cancha_id = ?"
+        parametros.append(cancha_id)
+    parametros += [hasta, desde]
+    if cancha_id is not None:
+        filtro_bloqueos = " AND c.id = ?"
+        parametros.append(cancha_id)
+
+    sql = _SQL_OCUPACION.format(filtro_reservas=filtro_reservas, filtro_bloqueos=filtro_bloqueos)
+    with conexion() as conn:
+        rows = conn.execute(sql, parametros).fetchall()
+    return [
+        reserva_de_bloqueo(row[0], row[3], date.fromisoformat(row[4]), row[6], row[7], row[9])
+        if row[1] is None else _fila_a_reserva(row)
+        for row in rows
+    ]
+
+
+_SQL_MINUTOS = "(CAST(substr({0}, 1, 2) AS INTEGER) * 60 + CAST(substr({0}, 4, 2) AS INTEGER))"
+
+_SQL_FRANJAS_AGREGADAS = (
+    "SELECT " + _SQL_DIA_SEMANA.format("fecha_reserva") + ", hora_inicio, hora_fin, COUNT(*)"
+    " FROM reservas WHERE fecha_reserva BETWEEN ? AND ?"
+    " GROUP BY 1, hora_inicio, hora_fin"
+)
+_SQL_USUARIOS_AGREGADOS = (
+    "SELECT usuario_id, MAX(usuario_username), COUNT(*),"
+    " SUM(" + _SQL_MINUTOS.format("hora_fin") + " - " + _SQL_MINUTOS.format("hora_inicio") + ")"
+    " FROM reservas WHERE fecha_reserva BETWEEN ? AND ?"
+    " GROUP BY usuario_id"
+)
+
+
+def obtener_ocupacion_agregada(fecha_inicio, fecha_fin):
+    """Reservas entre dos fechas agrupadas por día de la semana y horario, y por usuario.
+
+    Mismo resultado que en SQL Server; son dos consultas sobre la misma
+    conexión, porque SQLite no devuelve varios conjuntos de resultados.
+    """
+    parametros = (_texto_fecha(fecha_inicio), _texto_fecha(fecha_fin))
+    with conexion() as conn:
+        franjas = conn.execute(_SQL_FRANJAS_AGREGADAS, parametros).fetchall()
+        usuarios = conn.execute(_SQL_USUARIOS_AGREGADOS, parametros).fetchall()
+    return {
+        "franjas": [
+            {"dia_semana": row[0], "inicio": _a_hora(row[1]), "fin": _a_hora(row[2]), "reservas": row[3]}
+            for row in franjas
+        ],
+        "usuarios": [
+            {"usuario_id": row[0], "username": row[1], "reservas": row[2], "minutos": row[3]}
+            for row in usuarios
+        ],
+    }
+
+
+def crear_bloqueo(fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id=None, motivo="",
+                  creado_por=""):
+    """Guarda un bloqueo y devuelve {'id', 'conflictos'} con las reservas existentes que cubre.
+
+    El INSERT de la regla y la lectura de las reservas en conflicto corren en
+    la misma transacción; las reservas no se tocan.
+    """
+    desde = _texto_fecha(fecha_desde)
+    hasta = _texto_fecha(fecha_hasta)
+    inicio = _texto_hora(hora_inicio)
+    fin = _texto_hora(hora_fin)
+    with _transaccion(inmediata=True) as conn:
+        bloqueo_id = conn.execute(
+            "INSERT INTO bloqueos (fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id, motivo,"
+            " creado_por) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (desde, hasta, dias_semana, inicio, fin, cancha_id, motivo, creado_por),
+        ).lastrowid
+        rows = conn.execute(
+            f"SELECT {_COLUMNAS_RESERVA} FROM reservas"
+            " WHERE fecha_reserva BETWEEN ? AND ? AND (? IS NULL OR cancha_id = ?)"
+            " AND hora_inicio < ? AND hora_fin > ?"
+            f" AND (? >> {_SQL_DIA_SEMANA.format('fecha_reserva')}) & 1"
+            " ORDER BY fecha_reserva, hora_inicio",
+            (desde, hasta, cancha_id, cancha_id, fin, inicio, dias_semana),
+        ).fetchall()
+    return {"id": bloqueo_id, "conflictos": [_fila_a_reserva(row) for row in rows]}
+
+
+def eliminar_bloqueos(ids):
+    """Elimina con un solo DELETE los bloqueos indicados y devuelve cuántos existían."""
+    with conexion() as conn:
+        return conn.execute(
+            "DELETE FROM bloqueos WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([int(bloqueo_id) for bloqueo_id in ids]),),
+        ).rowcount
+
+
+def obtener_bloqueos(vigentes_desde=None):
+    """Bloqueos ordenados por fecha de inicio; con `vigentes_desde`, sólo los que terminan desde esa fecha."""
+    sql = (
+        "SELECT id, fecha_desde, fecha_hasta, dias_semana, hora_inicio, hora_fin, cancha_id, motivo, creado_por"
+        " FROM bloqueos"
+    )
+    parametros = ()
+    if vigentes_desde:
+        sql += " WHERE fecha_hasta >= ?"
+        parametros = (_texto_fecha(vigentes_desde),)
+    sql += " ORDER BY fecha_desde, id"
+    with conexion() as conn:
+        rows = conn.execute(sql, parametros).fetchall()
+    return [
+        {
+            "id": row[0],
+            "fecha_desde": date.fromisoformat(row[1]),
+            "fecha_hasta": date.fromisoformat(row[2]),
+            "dias_semana": row[3],
+            "hora_inicio": row[4],
+            "hora_fin": row[5],
+            "cancha_id": row[6],
+            "motivo": row[7],
+            "creado_por": row[8],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,276 @@
+"""Caché en memoria de la disponibilidad de la cancha por fecha.
+
+La ocupación de cada fecha se guarda como una máscara de bits: el bit `i`
+está encendido cuando el bloque `i` de la `horarios.TablaHorarios` de esa
+fecha (según `calendario.Calendario`) está reservado.
+Con eso, saber qué horas de inicio admiten una reserva de `duracion`
+bloques se resuelve con operaciones de bits en lugar de recorrer filas.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import horarios
+
+
+# Cancha asignada a las reservas que no indican otra (igual que en `db`).
+CANCHA_PREDETERMINADA = 1
+
+
+class OcupacionCancha:
+    """Reservas (ordenadas por hora de inicio) y máscara de ocupación de una cancha."""
+
+    __slots__ = ("reservas", "mascara")
+
+    def __init__(self, reservas=(), mascara=0):
+        self.reservas = list(reservas)
+        self.mascara = mascara
+
+
+class EntradaDisponibilidad:
+    """Reservas de una fecha, su ocupación agrupada por cancha y la tabla de bloques del día."""
+
+    __slots__ = ("reservas", "canchas", "cargada_en", "version", "tabla")
+
+    def __init__(self, reservas, canchas, cargada_en, tabla):
+        self.reservas = reservas
+        self.canchas = canchas
+        self.cargada_en = cargada_en
+        self.tabla = tabla
+        self.version = version_reservas(reservas)
+
+    def ocupacion(self, cancha_id):
+        """`OcupacionCancha` de la cancha; vacía si no tiene reservas ese día."""
+        return self.canchas.get(cancha_id) or OcupacionCancha()
+
+    def mascara(self, cancha_id):
+        ocupacion = self.canchas.get(cancha_id)
+        return ocupacion.mascara if ocupacion else 0
+
+
+def cancha_de(reserva):
+    return reserva.get("cancha_id") or CANCHA_PREDETERMINADA
+
+
+def mascara_reserva(tabla, reserva):
+    """Máscara de los bloques de `tabla` que ocupa una reserva."""
+    return tabla.mascara_intervalo(horarios.a_minutos(reserva["inicio"]), horarios.a_minutos(reserva["fin"]))
+
+
+def version_reservas(reservas):
+    """Huella de las reservas de una fecha; cambia cuando se agrega o quita alguna."""
+    huella = hashlib.sha1()
+    for reserva in sorted(reservas, key=lambda r: (r.get("id") or 0, cancha_de(r), horarios.a_minutos(r["inicio"]))):
+        huella.update(
+            f"{reserva.get('id')}|{cancha_de(reserva)}|{horarios.a_minutos(reserva['inicio'])}"
+            f"|{horarios.a_minutos(reserva['fin'])};".encode()
+        )
+    return huella.hexdigest()[:20]
+
+
+class CacheDisponibilidad:
+    """Caché LRU de ocupación por fecha, segura para hilos.
+
+    `cargar_reservas(fecha)` se usa para leer de la base de datos las reservas
+    de todas las canchas de una fecha cuando no está en caché; `calendario`
+    da la tabla de bloques de cada fecha. `max_fechas` limita el número de
+    fechas guardadas y `ttl_segundos` el tiempo que una entrada se considera
+    vigente (otras instancias de la aplicación pueden haber reservado).
+    """
+
+    def __init__(self, cargar_reservas, calendario, max_fechas=400, ttl_segundos=60.0):
+        self._cargar_reservas = cargar_reservas
+        self.calendario = calendario
+        self.max_fechas = max_fechas
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0, "desalojos": 0, "actualizaciones": 0}
+
+    def mascara_de(self, reservas, tabla):
+        """Calcula la máscara de bloques de `tabla` ocupados por una lista de reservas."""
+        mascara = 0
+        for reserva in reservas:
+            mascara |= mascara_reserva(tabla, reserva)
+        return mascara
+
+    def ocupacion_por_cancha(self, reservas, tabla):
+        """Agrupa reservas por cancha con su máscara de ocupación en `tabla`."""
+        canchas = {}
+        for reserva in sorted(reservas, key=lambda r: horarios.a_minutos(r["inicio"])):
+            ocupacion = canchas.get(cancha_de(reserva))
+            if ocupacion is None:
+                ocupacion = canchas[cancha_de(reserva)] = OcupacionCancha()
+            ocupacion.reservas.append(reserva)
+            ocupacion.mascara |= mascara_reserva(tabla, reserva)
+        return canchas
+
+    def obtener(self, fecha):
+        """Devuelve la `EntradaDisponibilidad` de la fecha, cargándola si hace falta."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(fecha)
+            if entrada is not None and ahora - entrada.cargada_en <= self.ttl_segundos:
+                self._entradas.move_to_end(fecha)
+                self._stats["aciertos"] += 1
+                return entrada
+            self._stats["fallos"] += 1
+
+        # La consulta se hace fuera del lock para no bloquear otras fechas.
+        reservas = list(self._cargar_reservas(fecha))
+        return self.precargar(fecha, reservas)
+
+    def vigente(self, fecha):
+        """True si la fecha está en caché y no venció; no cuenta como acierto ni fallo."""
+        with self._lock:
+            entrada = self._entradas.get(fecha)
+            return entrada is not None and time.monotonic() - entrada.cargada_en <= self.ttl_segundos
+
+    def precargar(self, fecha, reservas):
+        """Guarda en caché las reservas ya leídas de una fecha."""
+        tabla = self.calendario.tabla(fecha)
+        entrada = EntradaDisponibilidad(reservas, self.ocupacion_por_cancha(reservas, tabla), time.monotonic(), tabla)
+        with self._lock:
+            self._entradas[fecha] = entrada
+            self._entradas.move_to_end(fecha)
+            while len(self._entradas) > self.max_fechas:
+                self._entradas.popitem(last=False)
+                self._stats["desalojos"] += 1
+        return entrada
+
+    def precargar_rango(self, fecha_inicio, fecha_fin, reservas):
+        """Guarda en caché cada fecha de un rango a partir de una sola consulta."""
+        por_fecha = {}
+        for reserva in reservas:
+            por_fecha.setdefault(reserva["fecha_reserva"], []).append(reserva)
+        fecha = fecha_inicio
+        while fecha <= fecha_fin:
+            self.precargar(fecha, por_fecha.get(fecha, []))
+            fecha += timedelta(days=1)
+
+    def horas_libres(self, fecha, duracion=1, cancha_id=CANCHA_PREDETERMINADA):
+        """Horas de inicio de la cancha y fecha con `duracion` horas consecutivas libres."""
+        entrada = self.obtener(fecha)
+        return self.horas_libres_desde_mascara(entrada.mascara(cancha_id), duracion, entrada.tabla)
+
+    def disponibilidad_canchas(self, fecha, cancha_ids, duracion=1):
+        """Horas de inicio libres de varias canchas de una fecha, con una sola carga.
+
+        Devuelve un dict {cancha_id: [horas]}.
+        """
+        entrada = self.obtener(fecha)
+        return {
+            cancha_id: self.horas_libres_desde_mascara(entrada.mascara(cancha_id), duracion, entrada.tabla)
+            for cancha_id in cancha_ids
+        }
+
+    def horas_libres_desde_mascara(self, mascara, duracion, tabla):
+        """Horas de inicio de `tabla` con `duracion` horas libres según una máscara de ocupación."""
+        validas = tabla.inicios_libres(mascara, duracion)
+        return [hora for indice, hora in enumerate(tabla.horas) if validas >> indice & 1]
+
+    def registrar_reserva(self, reserva):
+        """Actualiza la entrada de la fecha de una reserva recién creada."""
+        fecha = reserva["fecha_reserva"]
+        with self._lock:
+            entrada = self._entradas.get(fecha)
+            if entrada is None:
+                return
+            entrada.reservas = entrada.reservas + [reserva]
+            anterior = entrada.ocupacion(cancha_de(reserva))
+            reservas_cancha = sorted(anterior.reservas + [reserva], key=lambda r: horarios.a_minutos(r["inicio"]))
+            # Se reemplaza el objeto en lugar de mutarlo para no alterar lecturas en curso.
+            entrada.canchas = dict(entrada.canchas)
+            entrada.canchas[cancha_de(reserva)] = OcupacionCancha(
+                reservas_cancha, anterior.mascara | mascara_reserva(entrada.tabla, reserva)
+            )
+            entrada.version = version_reservas(entrada.reservas)
+            self._stats["actualizaciones"] += 1
+
+    def invalidar(self, fecha=None):
+        """Elimina una fecha de la caché, o todas si no se indica."""
+        with self._lock:
+            if fecha is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(fecha, None)
+
+    def estadisticas(self):
+        """Devuelve los contadores de la caché (aciertos, fallos, desalojos, tamaño)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["fechas"] = len(self._entradas)
+            stats["max_fechas"] = self.max_fechas
+        consultas = stats["aciertos"] + stats["fallos"]
+        stats["tasa_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+        return stats
+
+
+
+def buscar_huecos(reservas, fecha_inicio, fecha_fin, calendario, duracion, cancha_ids, dias_semana=None, horas=None,
+                  limite=5, minuto_minimo=0):
+    """Primeros `limite` huecos libres de `duracion` horas entre dos fechas.
+
+    `reservas` son las de todo el rango, leídas con una sola consulta. Se
+    arma la máscara de ocupación de cada (fecha, cancha) sobre la tabla de
+    bloques de la fecha y se recorren las fechas en orden resolviendo cada
+    una con operaciones de bits; los días cerrados se saltan.
+    `dias_semana` (lunes = 0) y `horas` ("HH:MM" de inicio) restringen la
+    búsqueda; `minuto_minimo` descarta en `fecha_inicio` los bloques que ya
+    empezaron. Devuelve dicts {fecha, hora_inicio, hora_fin, cancha_id}
+    ordenados por fecha, hora y cancha.
+    """
+    mascaras = {}
+    for reserva in reservas:
+        fecha = reserva["fecha_reserva"]
+        clave = (fecha, cancha_de(reserva))
+        mascaras[clave] = mascaras.get(clave, 0) | mascara_reserva(calendario.tabla(fecha), reserva)
+
+    # Bloques permitidos por `horas`, calculados una vez por plantilla.
+    permitidas_por_tabla = {}
+
+    def permitidas_en(tabla):
+        permitidas = permitidas_por_tabla.get(id(tabla))
+        if permitidas is None:
+            permitidas = tabla.completa
+            if horas:
+                permitidas = 0
+                for hora in horas:
+                    indice = tabla.indice(hora)
+                    if indice is not None:
+                        permitidas |= 1 << indice
+            permitidas_por_tabla[id(tabla)] = permitidas
+        return permitidas
+
+    huecos = []
+    fecha = fecha_inicio
+    while fecha <= fecha_fin and len(huecos) < limite:
+        tabla = calendario.tabla(fecha)
+        if len(tabla) and (dias_semana is None or fecha.weekday() in dias_semana):
+            filtro = permitidas_en(tabla)
+            if fecha == fecha_inicio:
+                for indice, inicio in enumerate(tabla.inicios):
+                    if inicio < minuto_minimo:
+                        filtro &= ~(1 << indice)
+            libres_por_cancha = [
+                (cancha_id, tabla.inicios_libres(mascaras.get((fecha, cancha_id), 0), duracion) & filtro)
+                for cancha_id in cancha_ids
+            ]
+            if any(libres for _, libres in libres_por_cancha):
+                for indice, hora in enumerate(tabla.horas):
+                    for cancha_id, libres in libres_por_cancha:
+                        if libres >> indice & 1:
+                            huecos.append(
+                                {
+                                    "fecha": fecha,
+                                    "hora_inicio": hora,
+                                    "hora_fin": horarios.a_texto(horarios.fin_de(hora, duracion)),
+                                    "cancha_id": cancha_id,
+                                }
+                            )
+                            if len(huecos) >= limite:
+                                return huecos
+        fecha += timedelta(days=1)
+    return huecos
@@ -0,0 +1,106 @@
+"""Difusión en el proceso de eventos de reservas hacia clientes SSE.
+
+Un único `Difusor` recibe cada reserva creada (como oyente de
+`db.registrar_oyente_reserva`) y la copia en la cola acotada de cada cliente
+conectado a `/stream`. Publicar nunca bloquea: si la cola de un cliente lento
+está llena se descarta su evento más antiguo y se le marca para que recargue
+la disponibilidad completa.
+"""
+import json
+import queue
+import threading
+
+
+class DemasiadosClientesError(RuntimeError):
+    """Se lanza cuando se alcanzó el máximo de clientes conectados."""
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado."""
+
+    __slots__ = ("cola", "desfasada")
+
+    def __init__(self, tamano_cola):
+        self.cola = queue.Queue(maxsize=tamano_cola)
+        self.desfasada = False
+
+    def siguiente(self, timeout):
+        """Devuelve el próximo evento o None si no llegó ninguno en `timeout` segundos."""
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Difusor:
+    """Reparte eventos a todas las suscripciones activas, seguro para hilos."""
+
+    def __init__(self, tamano_cola=100, max_clientes=200):
+        self.tamano_cola = tamano_cola
+        self.max_clientes = max_clientes
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self._stats = {"publicados": 0, "entregados": 0, "descartados": 0}
+
+    def suscribir(self):
+        with self._lock:
+            if len(self._suscripciones) >= self.max_clientes:
+                raise DemasiadosClientesError("Se alcanzó el máximo de clientes conectados al stream.")
+            suscripcion = Suscripcion(self.tamano_cola)
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, evento):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+            self._stats["publicados"] += 1
+        descartados = 0
+        for suscripcion in suscripciones:
+            while True:
+                try:
+                    suscripcion.cola.put_nowait(evento)
+                    break
+                except queue.Full:
+                    try:
+                        suscripcion.cola.get_nowait()
+                        suscripcion.desfasada = True
+                        descartados += 1
+                    except queue.Empty:
+                        pass
+        with self._lock:
+            self._stats["entregados"] += len(suscripciones)
+            self._stats["descartados"] += descartados
+
+    def publicar_reserva(self, reserva):
+        """Oyente de reservas creadas: publica el bloque que quedó ocupado."""
+        self.publicar(evento_reserva(reserva, "Reservado"))
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["clientes"] = len(self._suscripciones)
+        return stats
+
+
+def evento_reserva(reserva, estado):
+    """Datos públicos del evento: no incluye quién reservó."""
+    return {
+        "fecha": reserva["fecha_reserva"].isoformat(),
+        "hora_inicio": reserva["hora_inicio"],
+        "hora_fin": reserva["hora_fin"],
+        "cancha_id": reserva.get("cancha_id"),
+        "estado": estado,
+    }
+
+
+def formatear_sse(datos, evento=None):
+    """Serializa un evento en el formato de Server-Sent Events."""
+    lineas = []
+    if evento:
+        lineas.append(f"event: {evento}")
+    lineas.append(f"data: {json.dumps(datos, ensure_ascii=False)}")
+    return "\n".join(lineas) + "\n\n"
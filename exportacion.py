@@ -0,0 +1,93 @@
+"""Exportación de reservas a CSV o XLSX sin cargar el rango completo en memoria.
+
+Ambos formatos consumen un iterable de reservas (normalmente
+`db.iterar_reservas_rango`, que lee en lotes con `fetchmany`) y producen
+el archivo por partes. El CSV se envía a medida que se genera; el XLSX se
+escribe con openpyxl en modo `write_only` a un archivo temporal y se envía
+desde disco. openpyxl es opcional: sin él sólo está disponible el CSV.
+"""
+import csv
+import io
+import os
+import tempfile
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+ENCABEZADOS = ("id", "fecha", "dia", "hora_inicio", "hora_fin", "duracion_horas", "cancha_id",
+               "usuario_id", "usuario", "nombre")
+FORMATOS = ("csv", "xlsx")
+MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+# Filas que se acumulan antes de entregar un bloque de CSV.
+FILAS_POR_BLOQUE = 500
+TAMANO_LECTURA_XLSX = 64 * 1024
+
+
+def xlsx_disponible():
+    return openpyxl is not None
+
+
+def fila(reserva):
+    return (
+        reserva["id"],
+        reserva["fecha_reserva"].isoformat(),
+        reserva["dia"],
+        reserva["hora_inicio"],
+        reserva["hora_fin"],
+        reserva["duracion"],
+        reserva["cancha_id"],
+        reserva["usuario_id"],
+        reserva["usuario_username"],
+        reserva["nombre"],
+    )
+
+
+def generar_csv(reservas):
+    """Genera el CSV en bloques de texto; empieza con BOM para que Excel detecte UTF-8."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write("\ufeff")
+    escritor.writerow(ENCABEZADOS)
+    pendientes = 0
+    for reserva in reservas:
+        escritor.writerow(fila(reserva))
+        pendientes += 1
+        if pendientes >= FILAS_POR_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    yield buffer.getvalue()
+
+
+def generar_xlsx(reservas):
+    """Escribe el XLSX en un archivo temporal y lo entrega en bloques de bytes.
+
+    Con `write_only` openpyxl guarda las filas en disco a medida que llegan,
+    así la memoria no crece con el número de reservas. El temporal se borra
+    al terminar o si el cliente corta la descarga.
+    """
+    if openpyxl is None:
+        raise RuntimeError("La exportación a XLSX requiere el paquete openpyxl.")
+    descriptor, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(descriptor)
+    try:
+        libro = openpyxl.Workbook(write_only=True)
+        hoja = libro.create_sheet("Reservas")
+        hoja.append(ENCABEZADOS)
+        for reserva in reservas:
+            hoja.append(fila(reserva))
+        libro.save(ruta)
+        with open(ruta, "rb") as archivo:
+            while True:
+                bloque = archivo.read(TAMANO_LECTURA_XLSX)
+                if not bloque:
+                    break
+                yield bloque
+    finally:
+        os.remove(ruta)
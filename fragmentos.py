@@ -0,0 +1,136 @@
+"""Caché de fragmentos HTML ya renderizados.
+
+Se usa para el "Resumen semanal" de la página de inicio, que es igual para
+todos los usuarios que miran la misma semana. Cada semana ISO tiene un
+número de versión que cambia al crear una reserva en ella; la clave del
+fragmento incluye esa versión, así una reserva nueva deja obsoleto sólo el
+resumen de su semana.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def semana_iso(fecha):
+    """Par (año ISO, semana ISO) de una fecha."""
+    anio, semana, _ = fecha.isocalendar()
+    return anio, semana
+
+
+class CacheFragmentos:
+    """Caché LRU de fragmentos por semana, segura para hilos.
+
+    `max_entradas` y `max_bytes` limitan el número de fragmentos y el tamaño
+    total del HTML guardado; `ttl_segundos` acota cuánto puede quedar
+    desactualizado un fragmento si otra instancia de la aplicación reservó.
+    """
+
+    def __init__(self, max_entradas=64, max_bytes=2 * 1024 * 1024, ttl_segundos=60.0):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()  # (semana, versión, variante) -> (html, guardado_en)
+        # Cada invalidación toma un valor nuevo de `_contador`, que nunca se repite.
+        # `_versiones` guarda el de las semanas invalidadas que aún importan; las
+        # demás tienen la versión `_base`.
+        self._contador = 0
+        self._base = 0
+        self._versiones = {}  # semana -> versión
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0, "desalojos": 0, "invalidaciones": 0}
+
+    def version(self, semana):
+        """Versión actual de `semana`, para tomarla antes de leer los datos del fragmento."""
+        with self._lock:
+            return self._versiones.get(semana, self._base)
+
+    def obtener(self, semana, variante, renderizar, version=None):
+        """Devuelve el fragmento de `semana`, renderizándolo con `renderizar()` si hace falta.
+
+        `variante` distingue fragmentos de la misma semana que se dibujan
+        distinto (por ejemplo, según las canchas activas); debe ser hashable.
+        `version` es la de `version(semana)` tomada antes de leer los datos
+        que usa `renderizar`; si cambió desde entonces el fragmento no se
+        guarda. Sin ella se toma al buscar en la caché.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if version is None:
+                version = self._versiones.get(semana, self._base)
+            clave = (semana, version, variante)
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[1] <= self.ttl_segundos:
+                self._entradas.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada[0]
+            self._stats["fallos"] += 1
+
+        # Se renderiza fuera del lock; si dos hilos fallan a la vez ambos renderizan.
+        html = renderizar()
+        with self._lock:
+            if version != self._versiones.get(semana, self._base):
+                # Se creó una reserva mientras se leía o renderizaba: no se guarda.
+                return html
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior[0])
+            self._entradas[clave] = (html, time.monotonic())
+            self._bytes += len(html)
+            while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+                _, (desalojado, _) = self._entradas.popitem(last=False)
+                self._bytes -= len(desalojado)
+                self._stats["desalojos"] += 1
+        return html
+
+    def invalidar_semana(self, semana):
+        """Cambia la versión de la semana y descarta sus fragmentos."""
+        with self._lock:
+            self._contador += 1
+            self._versiones[semana] = self._contador
+            self._stats["invalidaciones"] += 1
+            for clave in [clave for clave in self._entradas if clave[0] == semana]:
+                self._bytes -= len(self._entradas.pop(clave)[0])
+            if len(self._versiones) > self.max_entradas:
+                self._podar_versiones()
+
+    def _podar_versiones(self):
+        """Olvida las versiones de semanas sin fragmentos guardados (con el lock tomado).
+
+        Las semanas olvidadas pasan a la versión `_base`, que se sube al valor
+        actual del contador: ninguna versión tomada antes coincide con ella
+        salvo la de la última invalidación, que sigue siendo vigente.
+        """
+        con_fragmentos = {clave[0] for clave in self._entradas}
+        self._versiones = {semana: self._versiones.get(semana, self._base) for semana in con_fragmentos}
+        self._base = self._contador
+
+    def registrar_reserva(self, reserva):
+        """Oyente de reservas creadas: invalida la semana de la reserva."""
+        self.invalidar_semana(semana_iso(reserva["fecha_reserva"]))
+
+    def invalidar(self):
+        """Descarta todos los fragmentos y cambia la versión de todas las semanas.
+
+        Así tampoco se guardan los fragmentos que se estén renderizando.
+        """
+        with self._lock:
+            self._contador += 1
+            self._base = self._contador
+            self._versiones.clear()
+            self._entradas.clear()
+            self._bytes = 0
+            self._stats["invalidaciones"] += 1
+
+    def estadisticas(self):
+        """Devuelve los contadores de la caché (aciertos, fallos, desalojos, tamaño)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["fragmentos"] = len(self._entradas)
+            stats["semanas_versionadas"] = len(self._versiones)
+            stats["bytes"] = self._bytes
+            stats["max_entradas"] = self.max_entradas
+            stats["max_bytes"] = self.max_bytes
+        consultas = stats["aciertos"] + stats["fallos"]
+        stats["tasa_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+        return stats
@@ -0,0 +1,104 @@
+"""Modelo de horarios basado en minutos desde medianoche.
+
+Las horas se representan como enteros (por ejemplo 06:30 -> 390), lo que
+permite comparar, sumar duraciones y detectar cruces sin pasar por
+`datetime.strptime`/`strftime` en cada iteración.
+"""
+from datetime import time
+
+MINUTOS_POR_HORA = 60
+
+
+def a_minutos(valor):
+    """Convierte un `datetime.time` o un texto "HH:MM" a minutos desde medianoche."""
+    if isinstance(valor, str):
+        horas, minutos = valor.split(":")
+        return int(horas) * 60 + int(minutos)
+    return valor.hour * 60 + valor.minute
+
+
+def a_texto(minutos):
+    """Convierte minutos desde medianoche a texto "HH:MM"."""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def a_hora(minutos):
+    """Convierte minutos desde medianoche a `datetime.time`."""
+    return time(minutos // 60, minutos % 60)
+
+
+def fin_de(hora, duracion):
+    """Minuto de fin de una reserva de `duracion` horas que empieza en `hora`."""
+    return a_minutos(hora) + duracion * MINUTOS_POR_HORA
+
+
+def se_cruzan(inicio_a, fin_a, inicio_b, fin_b):
+    """True si los intervalos [inicio_a, fin_a) y [inicio_b, fin_b) se sobreponen."""
+    return inicio_a < fin_b and fin_a > inicio_b
+
+
+def contiene(inicio, fin, inicio_interior, fin_interior):
+    """True si [inicio_interior, fin_interior) queda dentro de [inicio, fin)."""
+    return inicio <= inicio_interior and fin_interior <= fin
+
+
+class TablaHorarios:
+    """Tabla precalculada de bloques horarios contiguos de igual duración.
+
+    Se construye una sola vez a partir de la lista de horas de inicio
+    ("HH:MM") y expone los límites de cada bloque en minutos y en texto.
+    Una tabla sin horas representa un día cerrado. Las duraciones de las
+    reservas se expresan en horas; `bloques` las convierte a bloques.
+    """
+
+    def __init__(self, horas, minutos_bloque=MINUTOS_POR_HORA):
+        self.horas = tuple(horas)
+        self.minutos_bloque = minutos_bloque
+        self.inicios = tuple(a_minutos(hora) for hora in self.horas)
+        self.fines = tuple(inicio + minutos_bloque for inicio in self.inicios)
+        self.textos_fin = tuple(a_texto(fin) for fin in self.fines)
+        self.apertura = self.inicios[0] if self.inicios else 0
+        self.cierre = self.fines[-1] if self.fines else 0
+        self.completa = (1 << len(self.horas)) - 1
+        self._indices = {hora: indice for indice, hora in enumerate(self.horas)}
+
+    @classmethod
+    def desde_rango(cls, apertura, cierre, minutos_bloque=MINUTOS_POR_HORA):
+        """Tabla con bloques de `minutos_bloque` desde `apertura` hasta `cierre` (en minutos)."""
+        return cls([a_texto(inicio) for inicio in range(apertura, cierre - minutos_bloque + 1, minutos_bloque)],
+                   minutos_bloque)
+
+    def __len__(self):
+        return len(self.horas)
+
+    def bloques(self, duracion):
+        """Bloques que ocupa una reserva de `duracion` horas."""
+        return -(-duracion * MINUTOS_POR_HORA // self.minutos_bloque)
+
+    def indice(self, hora):
+        """Índice del bloque que empieza en `hora` ("HH:MM"), o None."""
+        return self._indices.get(hora)
+
+    def fin_de(self, hora, duracion):
+        """Minuto de fin de una reserva de `duracion` horas que empieza en `hora`."""
+        return fin_de(hora, duracion)
+
+    def dentro_de_horario(self, inicio, fin):
+        """True si el intervalo en minutos cabe entre la apertura y el cierre."""
+        return contiene(self.apertura, self.cierre, inicio, fin)
+
+    def mascara_intervalo(self, inicio, fin):
+        """Máscara de bits de los bloques que se cruzan con [inicio, fin) en minutos."""
+        primero = max(0, (inicio - self.apertura) // self.minutos_bloque)
+        ultimo = min(len(self.horas), -(-(fin - self.apertura) // self.minutos_bloque))
+        if ultimo <= primero:
+            return 0
+        return ((1 << (ultimo - primero)) - 1) << primero
+
+    def inicios_libres(self, mascara, duracion):
+        """Máscara de bloques donde empieza una reserva libre de `duracion` horas."""
+        libres = ~mascara & self.completa
+        validas = libres
+        for desplazamiento in range(1, self.bloques(duracion)):
+            validas &= libres >> desplazamiento
+        return validas
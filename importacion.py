@@ -0,0 +1,151 @@
+"""Importación masiva de usuarios desde un archivo CSV.
+
+El CSV debe tener cabecera con las columnas `username`, `password`,
+`nombres`, `apellidos` y, opcionalmente, `dni` y `role`.
+"""
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from werkzeug.security import generate_password_hash
+
+import seguridad
+
+COLUMNAS_OBLIGATORIAS = ("username", "password", "nombres", "apellidos")
+ROLES_VALIDOS = ("client", "admin")
+MAX_FILAS = 5000
+# Por debajo de este número de contraseñas no compensa levantar procesos.
+MIN_PARA_PROCESOS = 16
+
+
+def leer_csv(contenido):
+    """Lee el texto CSV y devuelve (filas, error).
+
+    Cada fila es un dict con la línea del archivo (`linea`) y los campos ya
+    recortados. `error` es un mensaje si el archivo no se puede procesar.
+    """
+    lector = csv.DictReader(io.StringIO(contenido))
+    if not lector.fieldnames:
+        return [], "El archivo está vacío."
+    columnas = [columna.strip().lower() for columna in lector.fieldnames]
+    faltantes = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in columnas]
+    if faltantes:
+        return [], f"Faltan columnas en la cabecera: {', '.join(faltantes)}."
+    lector.fieldnames = columnas
+
+    filas = []
+    for registro in lector:
+        if len(filas) >= MAX_FILAS:
+            return [], f"El archivo supera el máximo de {MAX_FILAS} filas."
+        fila = {clave: (valor or "").strip() for clave, valor in registro.items() if clave}
+        fila["linea"] = lector.line_num
+        filas.append(fila)
+    return filas, None
+
+
+def validar_filas(filas):
+    """Valida campos y duplicados dentro del archivo.
+
+    Devuelve (validas, resultados) donde `resultados` contiene un dict por
+    fila rechazada con `linea`, `username`, `estado` y `mensaje`.
+    """
+    validas = []
+    resultados = []
+    usernames = set()
+    dnis = set()
+    for fila in filas:
+        username = fila.get("username", "")
+        dni = fila.get("dni") or None
+        role = fila.get("role") or "client"
+        mensaje = None
+        if any(not fila.get(columna) for columna in COLUMNAS_OBLIGATORIAS):
+            mensaje = "Faltan usuario, contraseña, nombres o apellidos."
+        elif len(username) > 150 or len(fila["nombres"]) > 150 or len(fila["apellidos"]) > 150:
+            mensaje = "Usuario, nombres o apellidos superan los 150 caracteres."
+        elif dni and len(dni) > 20:
+            mensaje = "El DNI supera los 20 caracteres."
+        elif role not in ROLES_VALIDOS:
+            mensaje = f"Rol inválido: {role}."
+        elif username.casefold() in usernames:
+            mensaje = "Usuario repetido en el archivo."
+        elif dni and dni in dnis:
+            mensaje = "DNI repetido en el archivo."
+
+        if mensaje:
+            resultados.append({"linea": fila["linea"], "username": username, "estado": "Error", "mensaje": mensaje})
+            continue
+        usernames.add(username.casefold())
+        if dni:
+            dnis.add(dni)
+        validas.append(
+            {
+                "linea": fila["linea"],
+                "username": username,
+                "password": fila["password"],
+                "nombres": fila["nombres"],
+                "apellidos": fila["apellidos"],
+                "dni": dni,
+                "role": role,
+            }
+        )
+    return validas, resultados
+
+
+def hashear_passwords(passwords, procesos=None):
+    """Genera el hash de cada contraseña repartiendo el trabajo en varios procesos.
+
+    Usa el método configurado en `seguridad.HASH_METODO`. La derivación de
+    claves es costosa en CPU, así que se reparte en un pool de procesos; para
+    pocas contraseñas se calcula directamente.
+    """
+    passwords = list(passwords)
+    hashear = partial(generate_password_hash, method=seguridad.HASH_METODO)
+    if len(passwords) < MIN_PARA_PROCESOS:
+        return [hashear(password) for password in passwords]
+    procesos = procesos or os.cpu_count() or 1
+    tamano_bloque = max(1, len(passwords) // (procesos * 4))
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        return list(executor.map(hashear, passwords, chunksize=tamano_bloque))
+
+
+def importar_usuarios(contenido, db):
+    """Valida, hashea e inserta los usuarios del CSV.
+
+    Devuelve (resultados, error) donde `resultados` es el reporte por fila
+    ordenado por línea.
+    """
+    filas, error = leer_csv(contenido)
+    if error:
+        return [], error
+
+    validas, resultados = validar_filas(filas)
+    if validas:
+        usernames_existentes, dnis_existentes = db.buscar_usuarios_existentes(
+            [fila["username"] for fila in validas],
+            [fila["dni"] for fila in validas],
+        )
+        usernames_existentes = {username.casefold() for username in usernames_existentes}
+        nuevas = []
+        for fila in validas:
+            if fila["username"].casefold() in usernames_existentes:
+                resultados.append({"linea": fila["linea"], "username": fila["username"], "estado": "Error",
+                                   "mensaje": "El usuario ya existe."})
+            elif fila["dni"] and fila["dni"] in dnis_existentes:
+                resultados.append({"linea": fila["linea"], "username": fila["username"], "estado": "Error",
+                                   "mensaje": "El DNI ya está registrado."})
+            else:
+                nuevas.append(fila)
+
+        if nuevas:
+            for fila, password_hash in zip(nuevas, hashear_passwords(fila["password"] for fila in nuevas)):
+                fila["password_hash"] = password_hash
+            db.crear_usuarios_lote(nuevas)
+            resultados.extend(
+                {"linea": fila["linea"], "username": fila["username"], "estado": "Creado", "mensaje": ""}
+                for fila in nuevas
+            )
+
+    resultados.sort(key=lambda r: r["linea"])
+    return resultados, None
@@ -0,0 +1,45 @@
+"""Lecturas concurrentes a la base de datos para las vistas de consulta.
+
+Con `LECTURA_CONCURRENTE=1` las lecturas independientes de una petición (la
+consulta semanal y la ocupación del día elegido cuando no está en caché) se
+envían a la vez a un pool de hilos, de modo que la petición espera el viaje
+más lento en lugar de la suma de todos. pyodbc libera el GIL mientras espera
+a SQL Server, así que los hilos sí avanzan en paralelo.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LECTURA_CONCURRENTE = os.environ.get("LECTURA_CONCURRENTE", "0") == "1"
+LECTURA_HILOS = int(os.environ.get("LECTURA_HILOS", "8"))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LECTURA_HILOS, thread_name_prefix="lectura")
+    return _executor
+
+
+def en_paralelo(*tareas):
+    """Ejecuta funciones sin argumentos y devuelve sus resultados en el mismo orden.
+
+    En modo concurrente la primera tarea corre en el hilo actual y las demás en
+    el pool; si alguna falla se relanza su excepción. Con el modo desactivado
+    se ejecutan una tras otra. Las tareas del pool corren en una copia del
+    contexto actual, así sus operaciones cuentan para la petición en las
+    métricas.
+    """
+    if not LECTURA_CONCURRENTE or len(tareas) < 2:
+        return [tarea() for tarea in tareas]
+
+    executor = _obtener_executor()
+    futuros = [executor.submit(contextvars.copy_context().run, tarea) for tarea in tareas[1:]]
+    primero = tareas[0]()
+    return [primero] + [futuro.result() for futuro in futuros]
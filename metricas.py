@@ -0,0 +1,230 @@
+"""Métricas de la aplicación en formato de texto de Prometheus.
+
+Registrar una observación sólo suma en contadores e histogramas en memoria
+(un `perf_counter`, un `bisect` y un lock); el texto se genera únicamente
+cuando alguien consulta `/metrics`. Además de las métricas propias se pueden
+registrar "colectores": funciones que devuelven un dict de valores numéricos
+y que se leen en el momento de la consulta (estadísticas del pool, cachés,
+etc.).
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+PREFIJO = "reservas"
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+class Histograma:
+    """Histograma con buckets fijos por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = tuple(buckets)
+        self._series = {}  # valores de etiquetas -> [conteos por bucket..., +Inf], suma
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_etiquetas):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = [(clave, list(conteos), suma) for clave, (conteos, suma) in self._series.items()]
+        for clave, conteos, suma in sorted(series):
+            etiquetas = _etiquetas(self.etiquetas, clave)
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas}{"," if etiquetas else ""}le="{limite}"}} {acumulado}')
+            lineas.append(f"{self.nombre}_sum{{{etiquetas}}} {suma}")
+            lineas.append(f"{self.nombre}_count{{{etiquetas}}} {acumulado}")
+        return lineas
+
+
+class Contador:
+    """Contador monótono por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self._series[valores_etiquetas] = self._series.get(valores_etiquetas, 0) + cantidad
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for clave, valor in series:
+            lineas.append(f"{self.nombre}{{{_etiquetas(self.etiquetas, clave)}}} {valor}")
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores):
+    return ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores))
+
+
+peticiones_segundos = Histograma(
+    f"{PREFIJO}_http_peticion_segundos", "Duración de las peticiones HTTP.", ("ruta", "metodo")
+)
+peticiones_total = Contador(
+    f"{PREFIJO}_http_peticiones_total", "Peticiones HTTP atendidas por estado.", ("ruta", "metodo", "estado")
+)
+consultas_por_peticion = Histograma(
+    f"{PREFIJO}_http_consultas_por_peticion", "Operaciones del backend por petición HTTP.", ("ruta",),
+    buckets=BUCKETS_CONSULTAS,
+)
+operaciones_segundos = Histograma(
+    f"{PREFIJO}_db_operacion_segundos", "Duración de las operaciones del backend de almacenamiento.", ("operacion",)
+)
+operaciones_errores = Contador(
+    f"{PREFIJO}_db_errores_total", "Operaciones del backend que lanzaron una excepción.", ("operacion",)
+)
+
+_colectores = []
+# Contador de operaciones de la petición en curso. Es una variable de contexto:
+# el código que reparta trabajo de la petición en otros hilos debe ejecutarlo con
+# `contextvars.copy_context().run` para que sume en el mismo contador.
+_consultas = contextvars.ContextVar("consultas", default=None)
+# > 0 mientras corre una operación instrumentada, para no contar las anidadas.
+_profundidad = contextvars.ContextVar("profundidad", default=0)
+
+
+class _ConsultasPeticion:
+    """Operaciones del backend de una petición, compartidas entre sus hilos."""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def sumar(self):
+        with self._lock:
+            self.total += 1
+
+
+def registrar_colector(nombre, funcion):
+    """Registra `funcion()` -> dict; cada valor numérico se exporta como gauge `<nombre>_<clave>`."""
+    _colectores.append((nombre, funcion))
+
+
+def iniciar_peticion():
+    """Marca el inicio de una petición en el contexto actual."""
+    _consultas.set(_ConsultasPeticion())
+    _profundidad.set(0)
+    return time.perf_counter()
+
+
+def terminar_peticion(inicio, ruta, metodo, estado):
+    """Registra la duración, el estado y las consultas de la petición."""
+    peticiones_segundos.observar(time.perf_counter() - inicio, ruta, metodo)
+    peticiones_total.incrementar(ruta, metodo, str(estado))
+    consultas = _consultas.get()
+    consultas_por_peticion.observar(consultas.total if consultas else 0, ruta)
+
+
+def instrumentar(nombre, funcion):
+    """Envuelve una operación del backend para medir duración, errores y consultas por petición.
+
+    Las llamadas anidadas (una operación que llama a otra) se cuentan una vez.
+    Si la operación devuelve un generador (o es una función generadora), la
+    medición sigue mientras se itera: ver `_medir_iteracion`.
+    """
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        if _profundidad.get():
+            return funcion(*args, **kwargs)
+        consultas = _consultas.get()
+        if consultas is not None:
+            consultas.sumar()
+        inicio = time.perf_counter()
+        token = _profundidad.set(1)
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            operaciones_errores.incrementar(nombre)
+            operaciones_segundos.observar(time.perf_counter() - inicio, nombre)
+            raise
+        finally:
+            _profundidad.reset(token)
+        duracion = time.perf_counter() - inicio
+        if inspect.isgenerator(resultado):
+            return _medir_iteracion(nombre, resultado, duracion)
+        operaciones_segundos.observar(duracion, nombre)
+        return resultado
+    return envuelta
+
+
+def _medir_iteracion(nombre, generador, duracion):
+    """Entrega los elementos de `generador` sumando a `duracion` el tiempo de cada paso.
+
+    Sólo se mide el tiempo dentro del generador (leer filas, esperar al
+    servidor), no el que el consumidor tarda entre elemento y elemento; la
+    duración se registra al agotarlo, al cerrarlo o si falla. Cada paso corre
+    con la profundidad marcada, igual que una operación normal.
+    """
+    try:
+        while True:
+            inicio = time.perf_counter()
+            token = _profundidad.set(1)
+            try:
+                elemento = next(generador)
+            except StopIteration:
+                return
+            except Exception:
+                operaciones_errores.incrementar(nombre)
+                raise
+            finally:
+                _profundidad.reset(token)
+                duracion += time.perf_counter() - inicio
+            yield elemento
+    finally:
+        generador.close()
+        operaciones_segundos.observar(duracion, nombre)
+
+
+def instrumentar_backend(modulo, operaciones):
+    """Reemplaza en `modulo` cada operación por su versión instrumentada."""
+    for nombre in operaciones:
+        setattr(modulo, nombre, instrumentar(nombre, getattr(modulo, nombre)))
+
+
+def exportar():
+    """Devuelve todas las métricas en formato de texto de Prometheus."""
+    lineas = []
+    for metrica in (peticiones_segundos, peticiones_total, consultas_por_peticion,
+                    operaciones_segundos, operaciones_errores):
+        lineas.extend(metrica.exportar())
+    for nombre, funcion in _colectores:
+        try:
+            valores = funcion()
+        except Exception as exc:
+            print(f"No se pudo leer el colector de métricas {nombre}:", exc)
+            continue
+        for clave, valor in sorted(valores.items()):
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            metrica = f"{PREFIJO}_{nombre}_{clave}"
+            lineas.append(f"# TYPE {metrica} gauge")
+            lineas.append(f"{metrica} {valor}")
+    return "\n".join(lineas) + "\n"
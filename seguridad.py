@@ -0,0 +1,177 @@
+"""Hash y verificación de contraseñas en un pool de hilos acotado.
+
+`hashlib.scrypt` y `hashlib.pbkdf2_hmac` liberan el GIL mientras calculan,
+por lo que un pool de hilos reparte el costo de la derivación de claves sin
+bloquear los hilos que atienden peticiones más allá de la espera del
+resultado. El método y su costo se configuran con `HASH_METODO` (por ejemplo
+"scrypt", "scrypt:16384:8:1" o "pbkdf2:sha256:600000").
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+HASH_METODO = os.environ.get("HASH_METODO", "scrypt")
+HASH_HILOS = int(os.environ.get("HASH_HILOS", "4"))
+# Verificaciones en curso o en cola permitidas antes de rechazar nuevas.
+HASH_MAX_PENDIENTES = int(os.environ.get("HASH_MAX_PENDIENTES", "64"))
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT", "10"))
+
+
+class SobrecargaHashError(RuntimeError):
+    """Se lanza cuando hay demasiadas verificaciones de contraseña pendientes."""
+
+
+def _prefijo_metodo(metodo):
+    """Método con todos sus parámetros, como lo guarda werkzeug delante del hash.
+
+    Completa los valores por defecto de werkzeug ("scrypt" -> "scrypt:32768:8:1",
+    "pbkdf2" -> "pbkdf2:sha256:<iteraciones>") sin derivar ninguna clave.
+    """
+    nombre, *args = metodo.split(":")
+    if nombre == "scrypt":
+        if not args:
+            return f"scrypt:{2 ** 15}:8:1"
+        if len(args) != 3:
+            raise ValueError("'scrypt' lleva 3 parámetros.")
+        n, r, p = map(int, args)
+        return f"scrypt:{n}:{r}:{p}"
+    if nombre == "pbkdf2":
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' lleva como máximo 2 parámetros.")
+        algoritmo = args[0] if args else "sha256"
+        iteraciones = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{algoritmo}:{iteraciones}"
+    raise ValueError(f"Método de hash inválido: {metodo!r}.")
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_HILOS, thread_name_prefix="hash")
+_pendientes = threading.BoundedSemaphore(HASH_MAX_PENDIENTES)
+# Método completo con parámetros (p. ej. "scrypt:32768:8:1") del hash configurado.
+_PREFIJO_ACTUAL = _prefijo_metodo(HASH_METODO)
+_lock = threading.Lock()
+_log = logging.getLogger(__name__)
+_stats = {
+    "verificaciones": 0,
+    "hashes": 0,
+    "rehashes": 0,
+    "rechazadas_por_sobrecarga": 0,
+    "espera_total_ms": 0.0,
+    "calculo_total_ms": 0.0,
+    "calculo_max_ms": 0.0,
+}
+_duraciones_recientes = deque(maxlen=1000)
+
+
+def _ejecutar(funcion, *args):
+    """Ejecuta `funcion` en el pool y espera el resultado, midiendo espera y cálculo."""
+    if not _pendientes.acquire(timeout=HASH_TIMEOUT):
+        with _lock:
+            _stats["rechazadas_por_sobrecarga"] += 1
+        raise SobrecargaHashError("Demasiadas verificaciones de contraseña pendientes.")
+    encolado = time.perf_counter()
+
+    def tarea():
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args), inicio, time.perf_counter()
+        finally:
+            _pendientes.release()
+
+    try:
+        resultado, inicio, fin = _executor.submit(tarea).result(timeout=HASH_TIMEOUT)
+    except FuturoTimeoutError:
+        # La tarea sigue en cola o calculando; libera el semáforo al terminar.
+        with _lock:
+            _stats["rechazadas_por_sobrecarga"] += 1
+        raise SobrecargaHashError("La verificación de contraseña tardó demasiado.") from None
+    calculo_ms = (fin - inicio) * 1000
+    with _lock:
+        _stats["espera_total_ms"] += (inicio - encolado) * 1000
+        _stats["calculo_total_ms"] += calculo_ms
+        _stats["calculo_max_ms"] = max(_stats["calculo_max_ms"], calculo_ms)
+        _duraciones_recientes.append(calculo_ms)
+    return resultado
+
+
+def generar_hash(password):
+    """Genera el hash de `password` con el método configurado."""
+    resultado = _ejecutar(generate_password_hash, password, HASH_METODO)
+    with _lock:
+        _stats["hashes"] += 1
+    return resultado
+
+
+def es_hash(valor):
+    """True si el valor guardado tiene formato de hash de werkzeug."""
+    return bool(valor) and "$" in valor and valor.split("$", 1)[0].split(":", 1)[0] in ("scrypt", "pbkdf2")
+
+
+def verificar_password(password_guardado, password):
+    """Comprueba la contraseña contra el valor guardado.
+
+    Devuelve (valida, necesita_rehash). `necesita_rehash` es True cuando la
+    contraseña es válida pero está en texto plano o con un método/costo
+    distinto al configurado.
+    """
+    if not password_guardado:
+        return False, False
+
+    if es_hash(password_guardado):
+        try:
+            valida = _ejecutar(check_password_hash, password_guardado, password)
+        except ValueError:
+            valida = False
+        with _lock:
+            _stats["verificaciones"] += 1
+        if not valida:
+            return False, False
+        return True, password_guardado.split("$", 1)[0] != _PREFIJO_ACTUAL
+
+    # Contraseñas antiguas guardadas en texto plano.
+    valida = hmac.compare_digest(password_guardado.encode(), password.encode())
+    return valida, valida
+
+
+def programar_rehash(password, guardar):
+    """Calcula en segundo plano un hash nuevo y lo entrega a `guardar(hash)`.
+
+    Cuenta dentro de `HASH_MAX_PENDIENTES`: si el pool está lleno no se
+    programa y la contraseña se actualizará en otro inicio de sesión.
+    Devuelve True si quedó programado.
+    """
+    if not _pendientes.acquire(blocking=False):
+        return False
+
+    def tarea():
+        try:
+            guardar(generate_password_hash(password, HASH_METODO))
+            with _lock:
+                _stats["rehashes"] += 1
+        except Exception:
+            _log.exception("No se pudo actualizar el hash de la contraseña.")
+        finally:
+            _pendientes.release()
+
+    _executor.submit(tarea)
+    return True
+
+
+def estadisticas():
+    """Contadores y tiempos (ms) de hash y verificación de contraseñas."""
+    with _lock:
+        stats = dict(_stats)
+        recientes = sorted(_duraciones_recientes)
+    total = stats["verificaciones"] + stats["hashes"]
+    stats["metodo"] = HASH_METODO
+    stats["hilos"] = HASH_HILOS
+    stats["calculo_promedio_ms"] = stats["calculo_total_ms"] / total if total else 0.0
+    if recientes:
+        stats["calculo_p50_ms"] = recientes[len(recientes) // 2]
+        stats["calculo_p95_ms"] = recientes[min(len(recientes) - 1, int(len(recientes) * 0.95))]
+    return stats